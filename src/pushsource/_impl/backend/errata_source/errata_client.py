@@ -1,16 +1,12 @@
 from functools import partial
 import logging
 import os
-import re
-import subprocess
-import tempfile
 import threading
 import xmlrpc.client as xmlrpc_client  # nosec B411
 from urllib.parse import urljoin
 from urllib3.util.retry import Retry
 import warnings
 
-import gssapi
 from more_executors import Executors
 from more_executors.futures import f_zip, f_map
 import requests
@@ -18,6 +14,9 @@ import requests.adapters
 import requests_gssapi
 
 from ...compat_attr import attr
+from ...utils.disk_cache import DiskCache
+from .errata_kerberos import CREDENTIALS
+from .errata_sessions import SESSION_POOL
 
 LOG = logging.getLogger("pushsource.errata_client")
 
@@ -31,6 +30,20 @@ ERRATA_RETRY_STRATEGY = Retry(
     raise_on_status=False,
 )
 
+HTTP_CACHE_MAX_ENTRIES = int(
+    os.environ.get("PUSHSOURCE_ERRATA_HTTP_CACHE_MAX_ENTRIES", "10000")
+)
+
+# Advisories in these states are considered immutable: responses obtained once
+# they're known to be in one of these states are reused without revalidation.
+HTTP_CACHE_IMMUTABLE_STATES = [
+    state.strip()
+    for state in os.environ.get(
+        "PUSHSOURCE_ERRATA_HTTP_CACHE_IMMUTABLE", "SHIPPED_LIVE"
+    ).split(",")
+    if state.strip()
+]
+
 
 def get_errata_client(
     threads,
@@ -38,6 +51,7 @@ def get_errata_client(
     keytab_path=None,
     principal=None,
     force_xmlrpc=USE_XMLRPC_CLIENT,
+    http_cache=None,
     **retry_kwargs,
 ):
     keytab_path = (
@@ -48,8 +62,13 @@ def get_errata_client(
     principal = (
         os.environ.get("PUSHSOURCE_ERRATA_PRINCIPAL") if not principal else principal
     )
+    http_cache = (
+        os.environ.get("PUSHSOURCE_ERRATA_HTTP_CACHE") if not http_cache else http_cache
+    )
     if keytab_path and principal and not force_xmlrpc:
-        return ErrataHTTPClient(threads, url, keytab_path, principal, **retry_kwargs)
+        return ErrataHTTPClient(
+            threads, url, keytab_path, principal, http_cache=http_cache, **retry_kwargs
+        )
     return ErrataClient(threads, url, **retry_kwargs)
 
 
@@ -60,6 +79,8 @@ class ErrataRaw(object):
     advisory_cdn_file_list = attr.ib(type=dict)
     advisory_cdn_docker_file_list = attr.ib(type=dict)
     ftp_paths = attr.ib(type=dict)
+    # Only present if requested from get_raw_f
+    advisory_data = attr.ib(type=dict, default=None)
 
 
 # pylint: disable=W0223
@@ -108,18 +129,63 @@ class ErrataClientBase(object):
         LOG.info("Queried Errata Tool for %s", advisory_id)
         return response
 
-    def get_raw_f(self, advisory_id):
-        """Returns Future[ErrataRaw] holding all ET responses for a particular advisory."""
-        all_responses = f_zip(
+    def get_raw_f(self, advisory_id, on_file_list=None, advisory_data=False):
+        """Returns Future[ErrataRaw] holding all ET responses for a particular advisory.
+
+        If provided, on_file_list is invoked with the cdn_file_list response as soon
+        as it's available, so that work depending only on that response can start
+        while other calls are still in progress.
+
+        If advisory_data is True, the advisory's data (as from get_advisory_data) is
+        also fetched concurrently with the other calls. This is optional: if it fails,
+        ErrataRaw.advisory_data is None.
+        """
+        # Submitted first since, if responses are cached, the advisory state
+        # it provides determines whether other responses need revalidation.
+        data_f = (
+            self._executor.submit(self.get_advisory_data, advisory_id)
+            if advisory_data
+            else None
+        )
+
+        file_list_f = self._executor.submit(
+            self._get_advisory_cdn_file_list, advisory_id
+        )
+        if on_file_list:
+            file_list_f.add_done_callback(partial(self._file_list_done, on_file_list))
+
+        response_fs = [
             self._executor.submit(self._get_advisory_cdn_metadata, advisory_id),
-            self._executor.submit(self._get_advisory_cdn_file_list, advisory_id),
+            file_list_f,
             self._executor.submit(self._get_advisory_cdn_docker_file_list, advisory_id),
             self._executor.submit(self._get_ftp_paths, advisory_id),
-        )
+        ]
+        all_responses = f_zip(*response_fs)
         all_responses = f_map(
             all_responses, partial(self._log_queried_et, advisory_id=advisory_id)
         )
-        return f_map(all_responses, lambda tup: ErrataRaw(*tup))
+        raw_f = f_map(all_responses, lambda tup: ErrataRaw(*tup))
+
+        if data_f:
+            data_f = f_map(
+                data_f, error_fn=partial(self._advisory_data_error, advisory_id)
+            )
+            raw_f = f_map(
+                f_zip(raw_f, data_f),
+                lambda tup: attr.evolve(tup[0], advisory_data=tup[1]),
+            )
+
+        return raw_f
+
+    def _advisory_data_error(self, advisory_id, exception):
+        # Advisory data is fetched again later if it's needed, so errors
+        # here shouldn't fail the advisory.
+        LOG.debug("Couldn't fetch advisory data for %s: %s", advisory_id, exception)
+
+    def _file_list_done(self, callback, f):
+        # Errors are left for the caller to handle via get_raw_f's future.
+        if not f.cancelled() and not f.exception():
+            callback(f.result())
 
     def _call_et(self, method, advisory_id):
         # These APIs have had performance issues occasionally, so let's set up some
@@ -210,11 +276,24 @@ class ErrataClient(ErrataClientBase):
 
 
 class ErrataHTTPClient(ErrataClientBase):
-    def __init__(self, threads, url, keytab_path: str, principal: str, **retry_args):
+    def __init__(
+        self,
+        threads,
+        url,
+        keytab_path: str,
+        principal: str,
+        http_cache: str = None,
+        **retry_args,
+    ):
         super().__init__(threads, url, **retry_args)
 
         self.keytab_path = keytab_path
         self.principal = principal
+        self._http_cache = (
+            DiskCache.shared(http_cache, max_entries=HTTP_CACHE_MAX_ENTRIES)
+            if http_cache
+            else None
+        )
 
         self.get_advisory_data = partial(self._call_et, "/api/v1/erratum/{id}")
         self._get_advisory_cdn_metadata = partial(
@@ -230,87 +309,134 @@ class ErrataHTTPClient(ErrataClientBase):
             self._call_et, "/api/v1/push_metadata/ftp_paths/{id}.json"
         )
 
-        with tempfile.NamedTemporaryFile(
-            prefix="ccache_pushsource_errata_", delete=False
-        ) as file:
-            self.ccache_filename = file.name
+        self.ccache_filename = CREDENTIALS.get(principal, keytab_path).ccache_filename
+
+    def get_raw_f(self, advisory_id, on_file_list=None, advisory_data=False):
+        # If responses are cached, the erratum API is always queried, since
+        # only it shows whether the advisory is in an immutable state.
+        return super().get_raw_f(
+            advisory_id,
+            on_file_list=on_file_list,
+            advisory_data=advisory_data or bool(self._http_cache),
+        )
 
     def authenticate(self):
         """
         Use the keytab to create a Kerberos ticket granting ticket.
 
         This method is expected to be called before any HTTP queries to errata are made.
+        The ticket is shared by all clients using the same principal and keytab,
+        and is renewed in the background before it expires.
         """
+        CREDENTIALS.authenticate(self.principal, self.keytab_path)
 
-        result = subprocess.run(
-            ["klist", "-c", f"FILE:{self.ccache_filename}"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            check=False,
-        )
-        regex_res = re.search(r"Default principal: (.*)\n", result.stdout)
-
-        # if Kerberos ticket is not found, or the principal is incorrect
-        if result.returncode or not regex_res or regex_res.group(1) != self.principal:
-            LOG.info(
-                "Errata TGT doesn't exist, running kinit for principal %s",
-                self.principal,
-            )
-            result = subprocess.run(
-                [
-                    "kinit",
-                    self.principal,
-                    "-k",
-                    "-t",
-                    self.keytab_path,
-                    "-c",
-                    f"FILE:{self.ccache_filename}",
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                check=False,
-            )
-            if result.returncode:
-                LOG.warning("kinit has failed: '%s'", result.stdout)
-
-    @property
-    def _errata_service(self):
+    def _new_session(self):
         """
         Create requests Session.
 
         Session is used so that Kerberos authentication only has to be done once.
-        As pushsource utilizes threading, and sessions are not thread safe, each thread
-        will have a separate session.
+        Sessions are not thread safe, so they're borrowed from a process-wide pool
+        for the duration of each call, allowing them to be reused across threads
+        and clients using the same Errata Tool URL and credentials.
 
         Returns (object):
             Authenticated requests Session object.
         """
+        creds = CREDENTIALS.credentials(self.principal, self.keytab_path)
 
-        if not hasattr(self._tls, "session"):
-            LOG.debug("Creating HTTP client for Errata Tool: %s", self._url)
-            name = gssapi.Name(self.principal, gssapi.NameType.user)
-            creds = gssapi.Credentials.acquire(
-                name=name,
-                usage="initiate",
-                store={"ccache": f"FILE:{self.ccache_filename}"},
-            ).creds
-
-            session = requests.Session()
-            session.auth = requests_gssapi.HTTPSPNEGOAuth(creds=creds)
-            adapter = requests.adapters.HTTPAdapter(max_retries=ERRATA_RETRY_STRATEGY)
-            session.mount("https://", adapter)
-            session.mount("http://", adapter)
-            self._tls.session = session
-
-        return self._tls.session
+        session = requests.Session()
+        session.auth = requests_gssapi.HTTPSPNEGOAuth(creds=creds)
+        adapter = requests.adapters.HTTPAdapter(max_retries=ERRATA_RETRY_STRATEGY)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
 
     def _do_call(self, method, advisory_id):
         complete_api_path = method.format(id=advisory_id)
         url = urljoin(self._url, complete_api_path)
-        response = self._errata_service.get(url)
+        with SESSION_POOL.session(
+            self._url, self.principal, self.ccache_filename, self._new_session
+        ) as session:
+            if self._http_cache:
+                return self._do_cached_call(session, url, advisory_id)
+
+            response = session.get(url)
 
-        response.raise_for_status()
+            response.raise_for_status()
+
+            return response.json()
+
+    def _cache_key(self, kind, ident):
+        # Responses may depend on the authenticated user, so they're cached
+        # per principal.
+        return "errata-%s:%s:%s" % (kind, self.principal, ident)
+
+    def _do_cached_call(self, session, url, advisory_id):
+        key = self._cache_key("response", url)
+        cached = self._http_cache.get(key)
+
+        if cached and cached.get("immutable"):
+            LOG.debug("Using cached response for %s (advisory is immutable)", url)
+            return cached["body"]
+
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = session.get(url, headers=headers)
+
+        if cached and response.status_code == 304:
+            LOG.debug("Using cached response for %s (not modified)", url)
+            body = cached["body"]
+            etag = response.headers.get("ETag") or cached.get("etag")
+            last_modified = response.headers.get("Last-Modified") or cached.get(
+                "last_modified"
+            )
+        else:
+            response.raise_for_status()
+            body = response.json()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+        immutable = self._is_immutable(advisory_id, body)
+        if etag or last_modified or immutable:
+            self._http_cache.put(
+                key,
+                {
+                    "body": body,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "immutable": immutable,
+                },
+            )
 
-        return response.json()
+        return body
+
+    def _is_immutable(self, advisory_id, body):
+        # Returns True if responses for the advisory, obtained now, can be
+        # reused without revalidation.
+        #
+        # The state of an advisory is only known from the erratum API. Once
+        # that API has shown an advisory to be in an immutable state, this is
+        # recorded so that responses from the other APIs can also be treated
+        # as immutable from then on. Responses obtained earlier may predate
+        # the final state of the advisory, so they're revalidated once more.
+        key = self._cache_key("immutable", advisory_id)
+
+        state = None
+        errata = body.get("errata") if isinstance(body, dict) else None
+        if isinstance(errata, dict):
+            for data in errata.values():
+                if isinstance(data, dict):
+                    state = data.get("status")
+
+        if state in HTTP_CACHE_IMMUTABLE_STATES:
+            self._http_cache.put(key, state)
+            return True
+
+        if state is None:
+            return self._http_cache.get(key) in HTTP_CACHE_IMMUTABLE_STATES
+
+        return False
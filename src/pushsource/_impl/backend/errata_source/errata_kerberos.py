@@ -0,0 +1,200 @@
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import threading
+
+import gssapi
+
+LOG = logging.getLogger("pushsource.errata_client")
+
+
+class KerberosCredentials(object):
+    # Kerberos credentials for a single principal & keytab.
+    def __init__(self, principal, keytab_path):
+        self.principal = principal
+        self.keytab_path = keytab_path
+        self.lock = threading.Lock()
+        self.authenticated = False
+        self.creds = None
+
+        with tempfile.NamedTemporaryFile(
+            prefix="ccache_pushsource_errata_", delete=False
+        ) as file:
+            self.ccache_filename = file.name
+
+    @property
+    def ccache(self):
+        return f"FILE:{self.ccache_filename}"
+
+
+class KerberosCredentialManager(object):
+    # Manages Kerberos credentials used by all ErrataHTTPClient instances in
+    # a process, so that each principal & keytab needs only a single ccache,
+    # kinit and gssapi credential, rather than one per client.
+    #
+    # Once a principal has authenticated, a background thread checks the
+    # remaining lifetime of its credentials every check_interval seconds and
+    # runs kinit again once less than renew_before seconds remain. If that
+    # fails, the principal is no longer considered authenticated, so that
+    # authenticate() tries again rather than relying on an expiring ticket.
+    #
+    # gssapi credentials acquired from a ccache read tickets from the ccache
+    # as needed, so credentials handed out before a renewal continue to work
+    # after it.
+
+    def __init__(self, renew_before, check_interval):
+        self._renew_before = renew_before
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        # (principal, keytab_path) => KerberosCredentials
+        self._entries = {}
+        self._stop = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            stop = self._stop
+            self._stop = None
+        if stop:
+            stop.set()
+
+    def get(self, principal, keytab_path):
+        # Returns the KerberosCredentials for the given principal & keytab.
+        key = (principal, keytab_path)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = KerberosCredentials(principal, keytab_path)
+            return self._entries[key]
+
+    def authenticate(self, principal, keytab_path):
+        # Ensures a ticket granting ticket for the principal is present in
+        # its ccache, returning the KerberosCredentials.
+        entry = self.get(principal, keytab_path)
+        with entry.lock:
+            if not entry.authenticated:
+                entry.authenticated = self._login(entry)
+        if entry.authenticated:
+            self._start_renewal()
+        return entry
+
+    def credentials(self, principal, keytab_path):
+        # Returns gssapi credentials for the principal, acquired from its
+        # ccache on first use.
+        entry = self.get(principal, keytab_path)
+        with entry.lock:
+            if entry.creds is None:
+                name = gssapi.Name(principal, gssapi.NameType.user)
+                entry.creds = gssapi.Credentials.acquire(
+                    name=name,
+                    usage="initiate",
+                    store={"ccache": entry.ccache},
+                ).creds
+            return entry.creds
+
+    def renew(self):
+        # Runs kinit for any authenticated principals whose credentials
+        # expire within renew_before seconds.
+        with self._lock:
+            entries = list(self._entries.values())
+
+        for entry in entries:
+            if not entry.authenticated or entry.creds is None:
+                continue
+
+            try:
+                lifetime = entry.creds.lifetime
+            except Exception:  # pylint: disable=broad-except
+                # Credentials are most likely already expired.
+                LOG.debug(
+                    "Can't get lifetime of credentials for %s",
+                    entry.principal,
+                    exc_info=True,
+                )
+                lifetime = 0
+
+            # None means credentials don't expire.
+            if not isinstance(lifetime, int) or lifetime > self._renew_before:
+                continue
+
+            LOG.info("Renewing Errata TGT for principal %s", entry.principal)
+            with entry.lock:
+                renewed = False
+                try:
+                    renewed = self._kinit(entry)
+                finally:
+                    if not renewed:
+                        # The ticket may expire; the next authenticate() will
+                        # run kinit again from the caller's thread.
+                        entry.authenticated = False
+
+    def _start_renewal(self):
+        with self._lock:
+            if self._stop is not None:
+                return
+            stop = self._stop = threading.Event()
+
+        thread = threading.Thread(
+            name="pushsource-errata-kerberos",
+            target=self._renew_loop,
+            args=(stop,),
+            daemon=True,
+        )
+        thread.start()
+
+    def _renew_loop(self, stop):
+        while not stop.wait(self._check_interval):
+            try:
+                self.renew()
+            except Exception:  # pylint: disable=broad-except
+                LOG.warning("Failed to renew Errata TGT", exc_info=True)
+
+    def _login(self, entry):
+        # Uses the keytab to create a ticket granting ticket, unless the ccache
+        # already holds one for the principal. Returns True on success.
+        result = subprocess.run(
+            ["klist", "-c", entry.ccache],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            check=False,
+        )
+        regex_res = re.search(r"Default principal: (.*)\n", result.stdout)
+
+        # if Kerberos ticket is not found, or the principal is incorrect
+        if result.returncode or not regex_res or regex_res.group(1) != entry.principal:
+            LOG.info(
+                "Errata TGT doesn't exist, running kinit for principal %s",
+                entry.principal,
+            )
+            return self._kinit(entry)
+
+        return True
+
+    def _kinit(self, entry):
+        result = subprocess.run(
+            [
+                "kinit",
+                entry.principal,
+                "-k",
+                "-t",
+                entry.keytab_path,
+                "-c",
+                entry.ccache,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            check=False,
+        )
+        if result.returncode:
+            LOG.warning("kinit has failed: '%s'", result.stdout)
+            return False
+        return True
+
+
+CREDENTIALS = KerberosCredentialManager(
+    renew_before=int(os.environ.get("PUSHSOURCE_ERRATA_KRB_RENEW_BEFORE", "3600")),
+    check_interval=int(os.environ.get("PUSHSOURCE_ERRATA_KRB_CHECK_INTERVAL", "300")),
+)
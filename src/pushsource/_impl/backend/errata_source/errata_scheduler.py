@@ -0,0 +1,72 @@
+import heapq
+import itertools
+import logging
+import threading
+from concurrent.futures import Future
+
+LOG = logging.getLogger("pushsource")
+
+# Estimated cost of a container build relative to a single RPM or module, as
+# each container build involves several koji queries for its images.
+CONTAINER_COST = 10
+
+
+def advisory_cost(raw):
+    # Estimates the cost of producing push items for an advisory from the
+    # raw ET responses (ErrataRaw): the number of files it requests.
+    cost = 0
+    for build_info in (raw.advisory_cdn_file_list or {}).values():
+        cost += len(build_info.get("rpms") or {})
+        cost += len(build_info.get("modules") or {})
+    cost += CONTAINER_COST * len(raw.advisory_cdn_docker_file_list or {})
+    return cost
+
+
+class CostScheduler(object):
+    # Runs jobs on an executor in order of increasing estimated cost
+    # (shortest job first), rather than the order of submission.
+    #
+    # Each submitted job adds one task to the executor. Whenever such a task
+    # starts, it runs the cheapest job pending at that time, so that while
+    # all workers are busy, cheap jobs submitted later overtake expensive
+    # jobs submitted earlier.
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        # (cost, seq, future, fn, args)
+        self._pending = []
+        self._seq = itertools.count()
+
+    def submit(self, cost, fn, *args):
+        # Returns a Future for the result of fn(*args).
+        f = Future()
+        with self._lock:
+            heapq.heappush(self._pending, (cost, next(self._seq), f, fn, args))
+
+        task_f = self._executor.submit(self._run_next)
+        task_f.add_done_callback(self._task_done)
+
+        return f
+
+    def _pop(self):
+        with self._lock:
+            return heapq.heappop(self._pending)
+
+    def _run_next(self):
+        cost, _, f, fn, args = self._pop()
+        if not f.set_running_or_notify_cancel():
+            return
+
+        LOG.debug("Running job with estimated cost %s", cost)
+        try:
+            f.set_result(fn(*args))
+        except Exception as e:  # pylint: disable=broad-except
+            f.set_exception(e)
+
+    def _task_done(self, task_f):
+        # If a task is cancelled (e.g. executor shutting down), the job it
+        # would have run can't run either.
+        if task_f.cancelled():
+            _, _, f, _, _ = self._pop()
+            f.cancel()
@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+LOG = logging.getLogger("pushsource.errata_client")
+
+
+class ErrataSessionPool(object):
+    # A pool of authenticated HTTP sessions for Errata Tool, shared by all
+    # ErrataHTTPClient instances in a process, so that connections (including
+    # TLS handshakes and SPNEGO negotiation) can be reused rather than being
+    # set up again by each client.
+    #
+    # Sessions are pooled per ET URL, principal and Kerberos ccache, since
+    # a session is authenticated using the credentials it was created with.
+    # A session is only used by
+    # one thread at a time. Sessions are created on demand, and up to max_idle
+    # sessions per key are retained when not in use.
+    #
+    # Sessions which have been idle for longer than keepalive seconds are
+    # closed rather than reused, as the server has likely closed their
+    # connections by then.
+
+    def __init__(self, max_idle, keepalive):
+        self._max_idle = max_idle
+        self._keepalive = keepalive
+        self._lock = threading.Lock()
+        # (url, principal, ccache) => [(session, time last used), ...]
+        self._idle = {}
+
+    def clear(self):
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+        for sessions in idle.values():
+            for session, _ in sessions:
+                session.close()
+
+    @contextmanager
+    def session(self, url, principal, ccache, factory):
+        # Borrows a session for the given ET URL, principal and ccache for the
+        # duration of a 'with' block. If no idle session is available,
+        # a new one is created by calling factory().
+        key = (url, principal, ccache)
+
+        session = self._get(key)
+        if session is None:
+            LOG.debug("Creating HTTP client for Errata Tool: %s", url)
+            session = factory()
+
+        try:
+            yield session
+        except requests.HTTPError:
+            # An error response doesn't affect the state of the session.
+            self._put(key, session)
+            raise
+        except Exception:
+            # Can't be sure the session is still in a good state, so let it
+            # go rather than returning it to the pool.
+            LOG.debug("Discarding Errata Tool session for %s after error", url)
+            session.close()
+            raise
+
+        self._put(key, session)
+
+    def _get(self, key):
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                session, last_used = idle.pop()
+
+            if time.monotonic() - last_used < self._keepalive:
+                return session
+
+            LOG.debug("Closing idle Errata Tool session for %s", key[0])
+            session.close()
+
+    def _put(self, key, session):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._max_idle:
+                idle.append((session, time.monotonic()))
+                return
+        session.close()
+
+
+SESSION_POOL = ErrataSessionPool(
+    max_idle=int(os.environ.get("PUSHSOURCE_ERRATA_SESSION_POOL_SIZE", "16")),
+    keepalive=int(os.environ.get("PUSHSOURCE_ERRATA_SESSION_KEEPALIVE", "60")),
+)
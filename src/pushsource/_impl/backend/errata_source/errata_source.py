@@ -1,19 +1,23 @@
 import os
 import logging
 from concurrent import futures
+from functools import partial
+from queue import Queue, Empty
 
 from urllib import parse
 from more_executors import Executors
+from more_executors.futures import f_flat_map
 
 from .errata_client import get_errata_client
+from .errata_scheduler import CostScheduler, advisory_cost
 
 from ... import compat_attr as attr
 from ...source import Source
 from ...model import (
     ErratumPushItem,
     ContainerImagePushItem,
-    ModuleMdSourcePushItem,
     RpmPushItem,
+    ModuleMdSourcePushItem,
     OperatorManifestPushItem,
     conv,
 )
@@ -41,6 +45,10 @@ class ErrataSource(Source):
         principal=None,
         threads=4,
         timeout=60 * 60 * 4,
+        stream=False,
+        prefetch=False,
+        http_cache=None,
+        shortest_first=False,
     ):
         """Create a new source.
 
@@ -83,6 +91,50 @@ class ErrataSource(Source):
             timeout (int)
                 Number of seconds after which an error is raised, if no progress is
                 made during queries to Errata Tool.
+
+            stream (bool)
+                If ``True``, push items for each advisory are produced as soon as
+                they are resolved from koji, rather than only after all push items
+                for the advisory are resolved.
+
+                The :class:`~pushsource.ErratumPushItem` for each advisory is then
+                produced after all other push items for that advisory, since its
+                destinations depend on theirs.
+
+            prefetch (bool)
+                If ``True``, data for the RPMs and modules of each advisory starts
+                being fetched from koji as soon as the advisory's file list has
+                been obtained from Errata Tool, while other queries to Errata Tool
+                are still in progress.
+
+                Each advisory's data, needed for container advisories, is also
+                fetched from Errata Tool concurrently with other queries rather
+                than afterward.
+
+                This does not affect the push items produced, but can reduce the
+                total time taken when Errata Tool is slow to respond.
+
+            http_cache (str)
+                Path to a file used to cache responses from the Errata HTTP API
+                across processes. The file is created if it doesn't exist.
+                Defaults to the value of ``PUSHSOURCE_ERRATA_HTTP_CACHE``, if set.
+
+                Cached responses are revalidated using conditional requests, so
+                that unchanged responses needn't be transferred again. Responses
+                for advisories known to be in a state listed in
+                ``PUSHSOURCE_ERRATA_HTTP_CACHE_IMMUTABLE`` (default:
+                ``SHIPPED_LIVE``) are reused without revalidation.
+
+                Only applies when ``keytab_path`` and ``principal`` are provided.
+
+            shortest_first (bool)
+                If ``True``, advisories are processed in order of increasing
+                estimated cost, based on the number of files requested by each
+                advisory, rather than in the order Errata Tool responds.
+
+                When requesting many advisories, this reduces the time until push
+                items are produced for smaller advisories, as they no longer wait
+                behind larger advisories.
         """
         self._url = force_https(url)
         self._errata = list_argument(errata)
@@ -91,6 +143,7 @@ class ErrataSource(Source):
             url=self._errata_service_url,
             keytab_path=keytab_path,
             principal=principal,
+            http_cache=http_cache,
         )
         self._client.authenticate()
 
@@ -114,6 +167,19 @@ class ErrataSource(Source):
 
         self._legacy_container_repos = try_bool(legacy_container_repos)
         self._timeout = timeout
+        self._stream = try_bool(stream)
+        self._scheduler = (
+            CostScheduler(self._executor) if try_bool(shortest_first) else None
+        )
+
+        self._prefetch = try_bool(prefetch)
+        self._prefetch_executor = (
+            Executors.thread_pool(
+                name="pushsource-errata-prefetch", max_workers=threads
+            ).with_cancel_on_shutdown()
+            if self._prefetch
+            else None
+        )
 
     def __enter__(self):
         return self
@@ -121,6 +187,10 @@ class ErrataSource(Source):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._client.shutdown()
         self._executor.shutdown(True)
+        # Any prefetches still running use the koji executor, so must
+        # finish first.
+        if self._prefetch_executor:
+            self._prefetch_executor.shutdown(True)
         self._koji_executor.shutdown(True)
 
     @property
@@ -152,6 +222,8 @@ class ErrataSource(Source):
     def _koji_source(self, **kwargs):
         if not self._koji_source_url:
             raise ValueError("A Koji source is required but none is specified")
+        if self._stream:
+            kwargs["stream"] = True
         return Source.get(
             self._koji_source_url,
             cache=self._koji_cache,
@@ -164,8 +236,14 @@ class ErrataSource(Source):
         # TODO: other cases (comma-separated; plain string)
         return self._errata
 
-    def _push_items_from_raw(self, raw):
+    def _erratum_from_raw(self, raw, dest=None):
+        # If provided, dest holds destinations of the advisory's other push
+        # items, which the erratum should also go to.
         raw_metadata = raw.advisory_cdn_metadata.copy()
+        if dest is not None:
+            raw_metadata["cdn_repo"] = sorted(
+                set(raw_metadata.get("cdn_repo") or []) | set(dest)
+            )
         if raw.advisory_cdn_metadata.get("container_list"):
             new_container_list = []
             # for every item in container list replace build with external repos
@@ -188,23 +266,25 @@ class ErrataSource(Source):
 
                 new_container_list.append(new_clistitem)
             raw_metadata["container_list"] = new_container_list
-        erratum = ErratumPushItem._from_data(raw_metadata)
+        return ErratumPushItem._from_data(raw_metadata)
+
+    def _push_items_from_raw(self, raw):
+        # Each push item is constructed only once with its final values, since
+        # validating push items is relatively costly for large advisories.
+        erratum_name = raw.advisory_cdn_metadata["id"]
+        ftp_paths = FtpPathsHelper(erratum_name, raw)
 
-        items = self._push_items_from_rpms(erratum, raw.advisory_cdn_file_list)
+        items = self._push_items_from_rpms(
+            erratum_name, raw.advisory_cdn_file_list, raw.ftp_paths, ftp_paths
+        )
+        ftp_paths.check()
 
         # The erratum should go to all the same destinations as the rpms,
         # before FTP paths are added.
-        erratum_dest = set(erratum.dest or [])
-        for item in items:
-            for dest in item.dest:
-                erratum_dest.add(dest)
-        erratum = attr.evolve(erratum, dest=sorted(erratum_dest))
-
-        # Adjust push item destinations according to FTP paths from ET, if any.
-        items = self._add_ftp_paths(items, erratum, raw)
+        erratum = self._erratum_from_raw(raw, ftp_paths.cdn_dest)
 
         items = items + self._push_items_from_container_manifests(
-            erratum, raw.advisory_cdn_docker_file_list
+            erratum, raw.advisory_cdn_docker_file_list, raw.advisory_data
         )
 
         appliance_image_list = raw.advisory_cdn_metadata.get("appliance_image_list")
@@ -215,9 +295,43 @@ class ErrataSource(Source):
 
         return [erratum] + items
 
-    def _push_items_from_container_manifests(self, erratum, docker_file_list):
+    def _stream_push_items_from_raw(self, raw):
+        # As _push_items_from_raw, but yields each push item as soon as it's
+        # final, with the erratum last.
+        erratum_name = raw.advisory_cdn_metadata["id"]
+        ftp_paths = FtpPathsHelper(erratum_name, raw)
+
+        for _, item in self._iter_koji_push_items(
+            erratum_name, raw.advisory_cdn_file_list, raw.ftp_paths or {}, ftp_paths
+        ):
+            yield item
+
+        ftp_paths.check()
+
+        erratum = self._erratum_from_raw(raw, ftp_paths.cdn_dest)
+
+        for item in self._iter_container_push_items(
+            erratum, raw.advisory_cdn_docker_file_list, raw.advisory_data
+        ):
+            yield item
+
+        for item in self._iter_appliance_push_items(
+            erratum, raw.advisory_cdn_metadata.get("appliance_image_list")
+        ):
+            yield item
+
+        yield erratum
+
+    def _push_items_from_container_manifests(
+        self, erratum, docker_file_list, advisory_data=None
+    ):
+        return list(
+            self._iter_container_push_items(erratum, docker_file_list, advisory_data)
+        )
+
+    def _iter_container_push_items(self, erratum, docker_file_list, advisory_data=None):
         if not docker_file_list:
-            return []
+            return
 
         # Example of container list for one item to one repo:
         #
@@ -239,8 +353,10 @@ class ErrataSource(Source):
         # }
         #
 
-        # Get product name from Errata. Enrich Container push items with this info
-        advisory_data = self._client.get_advisory_data(erratum.name)
+        # Get product name from Errata (unless already prefetched).
+        # Enrich Container push items with this info
+        if advisory_data is None:
+            advisory_data = self._client.get_advisory_data(erratum.name)
         if advisory_data:
             # This dictionary key is different based on erratum type
             erratum_type = list(advisory_data["errata"].keys())[0]
@@ -249,19 +365,20 @@ class ErrataSource(Source):
             product_name = None
 
         # We'll be getting container metadata from these builds.
+        #
+        # The origin isn't set by the koji source, as operator manifests
+        # should refer to the container images as found in koji.
         with self._koji_source(
             container_build=list(docker_file_list.keys())
         ) as koji_source:
-            out = []
-
             for item in koji_source:
                 if isinstance(item, ContainerImagePushItem):
                     item = self._enrich_container_push_item(
                         erratum, docker_file_list, item, product_name
                     )
                 elif isinstance(item, OperatorManifestPushItem):
-                    # Accept this item but nothing special to do
-                    pass
+                    # Accept this item, nothing to add besides the origin
+                    item = attr.evolve(item, origin=erratum.name)
                 else:
                     # If build contained anything else, ignore it
                     LOG.debug(
@@ -271,24 +388,22 @@ class ErrataSource(Source):
                     )
                     continue
 
-                item = attr.evolve(item, origin=erratum.name)
-                out.append(item)
-
-        return out
+                yield item
 
     def _push_items_from_appliance_image_list(self, erratum, appliance_image_list):
-        out = []
+        return list(self._iter_appliance_push_items(erratum, appliance_image_list))
+
+    def _iter_appliance_push_items(self, erratum, appliance_image_list):
         if appliance_image_list:
             nvr_list = []
             for image in appliance_image_list:
                 nvr_list.extend([nvr for nvr in image.keys()])
 
-            with self._koji_source(vmi_build=nvr_list) as koji_source:
+            with self._koji_source(
+                vmi_build=nvr_list, origin=erratum.name
+            ) as koji_source:
                 for push_item in koji_source:
-                    push_item = attr.evolve(push_item, origin=erratum.name)
-                    out.append(push_item)
-
-        return out
+                    yield push_item
 
     def _enrich_container_push_item(
         self, erratum, docker_file_list, item, product_name
@@ -343,55 +458,157 @@ class ErrataSource(Source):
             dest=dest,
             dest_signing_key=dest_signing_key,
             product_name=product_name,
+            origin=erratum.name,
         )
 
-    def _push_items_from_rpms(self, erratum, rpm_list):
-        out = []
+    def _push_items_from_rpms(self, erratum_name, rpm_list, ftp_paths, ftp_helper):
+        # All RPMs and modules of the advisory are resolved up front through as
+        # few koji sources as possible, then mapped back to the build which
+        # requested them. Output is ordered by build as if each build had been
+        # queried separately.
+        rpm_items = {}
+        module_items = {}
 
-        for build_nvr, build_info in rpm_list.items():
-            out.extend(self._rpm_push_items_from_build(erratum, build_nvr, build_info))
-            out.extend(
-                self._module_push_items_from_build(erratum, build_nvr, build_info)
-            )
+        for build_nvr, item in self._iter_koji_push_items(
+            erratum_name, rpm_list, ftp_paths or {}, ftp_helper
+        ):
+            out = rpm_items if isinstance(item, RpmPushItem) else module_items
+            out.setdefault(build_nvr, []).append(item)
 
-        return out
+        out = []
 
-    def _module_push_items_from_build(self, erratum, build_nvr, build_info):
-        modules = (build_info.get("modules") or {}).copy()
+        for build_nvr in rpm_list:
+            out.extend(rpm_items.get(build_nvr) or [])
+            out.extend(module_items.get(build_nvr) or [])
 
-        module_filenames = list(modules.keys())
+        return out
 
+    @staticmethod
+    def _module_filter(filenames):
+        # Returns the module_filter_filename for a koji source providing the
+        # given modulemd files.
+        #
         # We always request the modulemd.src.txt because we might need it later
         # depending on the ftp_paths response.
-        module_filenames.append("modulemd.src.txt")
+        return sorted(set(filenames) | set(["modulemd.src.txt"]))
 
-        out = []
+    def _requested_modules(self, rpm_list, ftp_paths):
+        # Returns {build NVR => (wanted filenames, {module filename => dest})}
+        # for those builds whose modules need to be looked up at all.
+        requested = {}
 
-        # Get a koji source which will yield all modules from the build
-        with self._koji_source(
-            module_build=[build_nvr], module_filter_filename=module_filenames
-        ) as koji_source:
-            for push_item in koji_source:
-                # ET uses filenames to identify the modules here, we must do the same.
-                basename = os.path.basename(push_item.src)
-                dest = modules.pop(basename, [])
+        for build_nvr, build_info in rpm_list.items():
+            modules = (build_info.get("modules") or {}).copy()
+            ftp_modules = (ftp_paths.get(build_nvr) or {}).get("modules")
 
-                # Fill in more push item details based on the info provided by ET.
-                push_item = attr.evolve(push_item, dest=dest, origin=erratum.name)
+            # The modulemd.src.txt is only used if ET has requested FTP paths
+            # for modules. If the build has neither modules nor module FTP paths,
+            # it's a plain RPM build and there's nothing to look up.
+            if not modules and not ftp_modules:
+                continue
 
-                out.append(push_item)
+            requested[build_nvr] = (set(modules.keys()), modules)
 
-        # Were there any requested modules we couldn't find?
-        missing_modules = ", ".join(sorted(modules.keys()))
-        if missing_modules:
-            msg = "koji build {nvr} does not contain {missing} (requested by advisory {erratum})".format(
-                nvr=build_nvr, missing=missing_modules, erratum=erratum.name
+        return requested
+
+    def _koji_requests(self, erratum_name, rpm_list, requested_modules):
+        # Returns a list of (kwargs, rpm_to_builds) for the koji sources needed
+        # to obtain the RPMs of the given builds and the requested modules,
+        # where rpm_to_builds maps each RPM filename to the builds requesting it.
+        #
+        # One source is needed per signing key of RPMs. Modules don't depend on
+        # the signing key, so they're obtained from the first source, sharing
+        # its multicalls with the RPMs.
+        out = [
+            (
+                dict(rpm=list(rpm_to_builds.keys()), signing_key=signing_key),
+                rpm_to_builds,
+            )
+            for (signing_key, rpm_to_builds) in self._rpms_by_signing_key(
+                erratum_name, rpm_list
+            ).items()
+            if rpm_to_builds
+        ]
+
+        if requested_modules:
+            if not out:
+                out.append(({}, {}))
+            out[0][0].update(
+                module_build=list(requested_modules.keys()),
+                module_filter_filename=self._module_filter(
+                    [
+                        filename
+                        for (wanted, _) in requested_modules.values()
+                        for filename in wanted
+                    ]
+                ),
             )
-            raise ValueError(msg)
 
         return out
 
-    def _filter_rpms_by_arch(self, erratum, rpm_filenames):
+    def _iter_koji_push_items(self, erratum_name, rpm_list, ftp_paths, ftp_helper):
+        # Yields (build NVR, push item) for RPMs and modules of the given builds,
+        # with FTP paths applied via ftp_helper.
+        requested = self._requested_modules(rpm_list, ftp_paths)
+
+        for kwargs, rpm_to_builds in self._koji_requests(
+            erratum_name, rpm_list, requested
+        ):
+            with self._koji_source(**kwargs) as koji_source:
+                for push_item in koji_source:
+                    if isinstance(push_item, RpmPushItem):
+                        items = self._rpm_push_items_for_builds(
+                            erratum_name, rpm_list, rpm_to_builds, push_item, ftp_helper
+                        )
+                    else:
+                        items = self._module_push_items_for_builds(
+                            erratum_name, requested, push_item, ftp_helper
+                        )
+                    for item in items:
+                        yield item
+
+        # Were there any requested modules we couldn't find?
+        for build_nvr, (_, modules) in requested.items():
+            missing_modules = ", ".join(sorted(modules.keys()))
+            if missing_modules:
+                msg = "koji build {nvr} does not contain {missing} (requested by advisory {erratum})".format(
+                    nvr=build_nvr, missing=missing_modules, erratum=erratum_name
+                )
+                raise ValueError(msg)
+
+    def _module_push_items_for_builds(
+        self, erratum_name, requested, push_item, ftp_helper
+    ):
+        # Returns [(build NVR, push item)] for a module from koji, as requested
+        # by the advisory.
+        if push_item.build not in requested:
+            LOG.debug(
+                "Erratum %s: ignored unexpected item from koji source: %s",
+                erratum_name,
+                push_item,
+            )
+            return []
+
+        wanted, modules = requested[push_item.build]
+
+        # ET uses filenames to identify the modules here, we must do the same.
+        basename = os.path.basename(push_item.src)
+
+        # The filter was shared between all builds, so it may have let through
+        # modules which were requested only for some other build.
+        if basename not in wanted and basename != "modulemd.src.txt":
+            return []
+
+        dest = ftp_helper.module_dest(push_item, modules.pop(basename, []))
+        if dest is None:
+            return []
+
+        # Fill in more push item details based on the info provided by ET.
+        push_item = attr.evolve(push_item, dest=dest, origin=erratum_name)
+
+        return [(push_item.build, push_item)]
+
+    def _filter_rpms_by_arch(self, erratum_name, rpm_filenames):
         if self._rpm_filter_arch is None:
             return rpm_filenames
 
@@ -407,72 +624,227 @@ class ErrataSource(Source):
                     continue
 
             LOG.debug(
-                "Erratum %s: RPM removed by arch filter: %s", erratum.name, filename
+                "Erratum %s: RPM removed by arch filter: %s", erratum_name, filename
             )
 
         return out
 
-    def _rpm_push_items_from_build(self, erratum, build_nvr, build_info):
+    def _rpms_by_signing_key(self, erratum_name, rpm_list):
+        # Returns {signing key => {RPM filename => [build NVR, ...]}}
+        #
+        # Builds of one advisory normally share a signing key, so this will
+        # usually be a single koji source for the whole advisory.
+        by_signing_key = {}
+
+        for build_nvr, build_info in rpm_list.items():
+            signing_key = build_info.get("sig_key") or None
+            if signing_key:
+                # Errata Tool API may return key alias in sig_key field in format "name1,name2,...", but
+                # we need to convert "," into "+" otherwise it would be used as multiple keys for Koji
+                # source which would result in incorrect processing.
+                signing_key = signing_key.replace(",", "+")
+
+            rpms = build_info.get("rpms") or {}
+            rpm_to_builds = by_signing_key.setdefault(signing_key, {})
+            for filename in self._filter_rpms_by_arch(erratum_name, list(rpms.keys())):
+                rpm_to_builds.setdefault(filename, []).append(build_nvr)
+
+        return by_signing_key
+
+    def _rpm_push_items_for_builds(
+        self, erratum_name, rpm_list, rpm_to_builds, push_item, ftp_helper
+    ):
+        # Returns [(build NVR, push item)] for an RPM from koji, for each build
+        # of the advisory which requested it.
+
+        # Do not allow to proceed if RPM was absent
+        if push_item.state == "NOTFOUND":
+            raise ValueError(
+                "Advisory refers to %s but RPM was not found in koji" % push_item.name
+            )
+
+        build_nvrs = rpm_to_builds.get(push_item.name)
+        if not build_nvrs:
+            LOG.debug(
+                "Erratum %s: ignored unexpected item from koji source: %s",
+                erratum_name,
+                push_item,
+            )
+            return []
+
+        return [
+            (
+                build_nvr,
+                self._rpm_push_item_for_build(
+                    erratum_name,
+                    build_nvr,
+                    rpm_list[build_nvr],
+                    push_item,
+                    ftp_helper,
+                ),
+            )
+            for build_nvr in build_nvrs
+        ]
+
+    def _rpm_push_item_for_build(
+        self, erratum_name, build_nvr, build_info, push_item, ftp_helper
+    ):
         rpms = build_info.get("rpms") or {}
-        signing_key = build_info.get("sig_key") or None
-        if signing_key:
-            # Errata Tool API may return key alias in sig_key field in format "name1,name2,...", but
-            # we need to convert "," into "+" otherwise it would be used as multiple keys for Koji
-            # source which would result in incorrect processing.
-            signing_key = signing_key.replace(",", "+")
         sha256sums = (build_info.get("checksums") or {}).get("sha256") or {}
         md5sums = (build_info.get("checksums") or {}).get("md5") or {}
 
-        rpm_filenames = self._filter_rpms_by_arch(erratum, list(rpms.keys()))
+        # Note, we can't sanity check here that the push item's build
+        # equals ET's NVR, because it's not always the case.
+        #
+        # Example:
+        #  RPM: pgaudit-debuginfo-1.4.0-4.module+el8.1.1+4794+c82b6e09.x86_64.rpm
+        #  belongs to build: 1015162 (pgaudit-1.4.0-4.module+el8.1.1+4794+c82b6e09)
+        #  but ET refers instead to module build: postgresql-12-8010120191120141335.e4e244f9.
+        #
+        # We also make use of this to fill in the module_build attribute on items when
+        # available.
+        #
+        # (This is not ideal because we don't really "know" that a non-matching NVR here is
+        # the module build NVR, we are relying on the ET implementation detail that this is
+        # the only reason they should not match; though legacy code already depended on this
+        # for years, so maybe it's fine. We also have the heuristic of scanning for 'module'
+        # in the NVR to make exceptions less likely.)
+        module_build = None
+        if push_item.build != build_nvr and ".module" in push_item.build:
+            module_build = build_nvr
+
+        # Fill in more push item details based on the info provided by ET.
+        return attr.evolve(
+            push_item,
+            sha256sum=sha256sums.get(push_item.name),
+            md5sum=md5sums.get(push_item.name),
+            dest=ftp_helper.rpm_dest(push_item.name, rpms.get(push_item.name) or []),
+            origin=erratum_name,
+            module_build=module_build,
+        )
 
-        # Get a koji source which will yield all desired push items from this build.
-        koji_source = self._koji_source(rpm=rpm_filenames, signing_key=signing_key)
+    def _get_raw_f(self, advisory_id):
+        if not self._prefetch:
+            return self._client.get_raw_f(advisory_id)
+        # Advisory data is only needed for container advisories, but whether
+        # this is one isn't known until the other responses arrive; fetching
+        # it concurrently means container advisories don't need another round
+        # trip to ET after those responses.
+        return self._client.get_raw_f(
+            advisory_id,
+            on_file_list=partial(self._start_prefetch, advisory_id),
+            advisory_data=True,
+        )
 
-        out = []
+    def _start_prefetch(self, advisory_id, rpm_list):
+        self._prefetch_executor.submit(self._prefetch_koji, advisory_id, rpm_list)
 
-        for push_item in koji_source:
-            # Do not allow to proceed if RPM was absent
-            if push_item.state == "NOTFOUND":
-                raise ValueError(
-                    "Advisory refers to %s but RPM was not found in koji"
-                    % push_item.name
+    def _prefetch_koji(self, advisory_id, rpm_list):
+        # Speculatively fetches the koji data likely to be needed for the RPMs
+        # and modules of an advisory, so it's cached (or being fetched) by the
+        # time it's needed.
+        #
+        # Only the koji calls are made here; the sources used later to produce
+        # push items are requested in the same way, so they find all data
+        # in the cache.
+        #
+        # Any errors are ignored here, since they'll be raised again when
+        # the advisory is processed.
+        LOG.debug("Erratum %s: prefetching koji data", advisory_id)
+
+        # ET's FTP paths aren't known yet, so builds requesting modules only
+        # via FTP paths aren't prefetched.
+        requests = self._koji_requests(
+            advisory_id, rpm_list, self._requested_modules(rpm_list, {})
+        )
+
+        for kwargs, _ in requests:
+            try:
+                with self._koji_source(fetch_only=True, **kwargs) as koji_source:
+                    for _ in koji_source:
+                        pass
+            except Exception:  # pylint: disable=broad-except
+                LOG.debug(
+                    "Erratum %s: koji prefetch failed", advisory_id, exc_info=True
                 )
 
-            # Note, we can't sanity check here that the push item's build
-            # equals ET's NVR, because it's not always the case.
-            #
-            # Example:
-            #  RPM: pgaudit-debuginfo-1.4.0-4.module+el8.1.1+4794+c82b6e09.x86_64.rpm
-            #  belongs to build: 1015162 (pgaudit-1.4.0-4.module+el8.1.1+4794+c82b6e09)
-            #  but ET refers instead to module build: postgresql-12-8010120191120141335.e4e244f9.
-            #
-            # We also make use of this to fill in the module_build attribute on items when
-            # available.
-            #
-            # (This is not ideal because we don't really "know" that a non-matching NVR here is
-            # the module build NVR, we are relying on the ET implementation detail that this is
-            # the only reason they should not match; though legacy code already depended on this
-            # for years, so maybe it's fine. We also have the heuristic of scanning for 'module'
-            # in the NVR to make exceptions less likely.)
-            module_build = None
-            if push_item.build != build_nvr and ".module" in push_item.build:
-                module_build = build_nvr
-
-            # Fill in more push item details based on the info provided by ET.
-            push_item = attr.evolve(
-                push_item,
-                sha256sum=sha256sums.get(push_item.name),
-                md5sum=md5sums.get(push_item.name),
-                dest=rpms.get(push_item.name),
-                origin=erratum.name,
-                module_build=module_build,
-            )
+    def __iter__(self):
+        if self._stream:
+            for pushitem in self._stream_push_items():
+                yield pushitem
+            return
 
-            out.append(push_item)
+        # Get raw ET responses for all errata.
+        raw_fs = [self._get_raw_f(id) for id in self._advisory_ids]
 
-        return out
+        # Convert them to lists of push items
+        push_items_fs = []
+        for f in futures.as_completed(raw_fs, timeout=self._timeout):
+            push_items_fs.append(self._submit(self._push_items_from_raw, f.result()))
+
+        completed_fs = as_completed_with_timeout_reset(
+            push_items_fs, timeout=self._timeout
+        )
+        for f in completed_fs:
+            for pushitem in f.result():
+                yield pushitem
+
+    def _submit(self, fn, raw):
+        # Submits fn(raw) to process an advisory, returning a Future.
+        if self._scheduler:
+            return self._scheduler.submit(advisory_cost(raw), fn, raw)
+        return self._executor.submit(fn, raw)
+
+    def _stream_push_items(self):
+        # Yields push items from all errata as they're produced, from
+        # concurrent tasks per advisory.
+        queue = Queue()
+        done = object()
+
+        def stream_advisory(raw):
+            for pushitem in self._stream_push_items_from_raw(raw):
+                queue.put(pushitem)
+
+        def put_done(f):
+            queue.put((done, f))
+
+        remaining = 0
+        for raw_f in [self._get_raw_f(id) for id in self._advisory_ids]:
+            f = f_flat_map(raw_f, partial(self._submit, stream_advisory))
+            f.add_done_callback(put_done)
+            remaining += 1
+
+        while remaining:
+            try:
+                entry = queue.get(timeout=self._timeout)
+            except Empty:
+                raise futures.TimeoutError(
+                    "No push items produced in %s seconds" % self._timeout
+                ) from None
+
+            if isinstance(entry, tuple) and entry[0] is done:
+                # Raises if the advisory failed
+                entry[1].result()
+                remaining -= 1
+            else:
+                yield entry
+
+
+class FtpPathsHelper(object):
+    # Applies the FTP paths from ET for an advisory to its push items.
+    #
+    # The final destinations of RPMs and modules are obtained one at a time
+    # from rpm_dest() and module_dest(); once all have been obtained, check()
+    # raises if any requested modules were missing.
+    #
+    # cdn_dest collects the destinations of those items before FTP paths were
+    # added, which are also destinations of the erratum.
+
+    def __init__(self, erratum_name, raw):
+        self._erratum_name = erratum_name
+        self._raw = raw
+        self.cdn_dest = set()
 
-    def _add_ftp_paths(self, items, erratum, raw):
         ftp_paths = raw.ftp_paths
 
         # ftp_paths structure is like this:
@@ -497,49 +869,60 @@ class ErrataSource(Source):
         # We use the (rpm, module) => ftp path mappings, which should be added onto
         # our existing push items if they match.
         #
-        rpm_to_paths = {}
-        build_to_module_paths = {}
-        builds_need_modules = set()
-        builds_have_modules = set()
+        self._rpm_to_paths = {}
+        self._build_to_module_paths = {}
+        self._builds_need_modules = set()
+        self._builds_have_modules = set()
         for build_nvr, build_map in ftp_paths.items():
             for rpm_name, paths in (build_map.get("rpms") or {}).items():
-                rpm_to_paths[rpm_name] = paths
+                self._rpm_to_paths[rpm_name] = paths
 
             modules = build_map.get("modules") or []
-            build_to_module_paths[build_nvr] = modules
+            self._build_to_module_paths[build_nvr] = modules
             if modules:
-                builds_need_modules.add(build_nvr)
+                self._builds_need_modules.add(build_nvr)
+
+    def rpm_dest(self, rpm_name, dest):
+        # Returns the final dest of an RPM whose dest from ET is 'dest'.
+        self.cdn_dest.update(dest)
+
+        # RPMs have dest updated with FTP paths.
+        return list(dest) + (self._rpm_to_paths.get(rpm_name) or [])
+
+    def module_dest(self, item, dest):
+        # Returns the final dest of a module push item whose dest from ET
+        # is 'dest', or None if the item should be dropped.
+        self.cdn_dest.update(dest)
+
+        if not isinstance(item, ModuleMdSourcePushItem):
+            # Other types of items are unaffected by ftp_paths.
+            return dest
+
+        # modulemd sources have dest updated with FTP paths and will
+        # also be filtered out if there are no matches at all (because
+        # modulemd sources aren't delivered in any other manner)
+        paths = self._build_to_module_paths.get(item.build)
+        if paths:
+            self._builds_have_modules.add(item.build)
+            dest = list(dest) + paths
+        if dest:
+            return dest
+
+        # modulemd sources are filtered out altogether if ET did
+        # not provide any destinations.
+        LOG.debug(
+            "Erratum %s: modulemd source skipped due to no destinations: %s",
+            self._erratum_name,
+            item.src,
+        )
+        return None
 
-        out = []
-        for item in items:
-            if isinstance(item, RpmPushItem):
-                # RPMs have dest updated with FTP paths.
-                paths = rpm_to_paths.get(item.name) or []
-                item = attr.evolve(item, dest=item.dest + paths)
-                out.append(item)
-            elif isinstance(item, ModuleMdSourcePushItem):
-                # modulemd sources have dest updated with FTP paths and will
-                # also be filtered out if there are no matches at all (because
-                # modulemd sources aren't delivered in any other manner)
-                paths = build_to_module_paths.get(item.build)
-                if paths:
-                    builds_have_modules.add(item.build)
-                    item = attr.evolve(item, dest=item.dest + paths)
-                if item.dest:
-                    out.append(item)
-                else:
-                    # modulemd sources are filtered out altogether if ET did
-                    # not provide any destinations.
-                    LOG.debug(
-                        "Erratum %s: modulemd source skipped due to no destinations: %s",
-                        erratum.name,
-                        item.src,
-                    )
-            else:
-                # Other types of items are unaffected by ftp_paths.
-                out.append(item)
+    def check(self):
+        raw = self._raw
 
-        builds_missing_modules = sorted(builds_need_modules - builds_have_modules)
+        builds_missing_modules = sorted(
+            self._builds_need_modules - self._builds_have_modules
+        )
         builds_missing_et = []
         builds_missing_koji = []
 
@@ -576,7 +959,7 @@ class ErrataSource(Source):
             LOG.warning(
                 "Erratum %s: ignoring module(s) from ftp_paths due to absence "
                 "in cdn_file_list: %s",
-                erratum.name,
+                self._erratum_name,
                 ", ".join(builds_missing_et),
             )
 
@@ -585,30 +968,10 @@ class ErrataSource(Source):
             # koji build might be malformed, incomplete or there have been some
             # backwards-incompatible changes in the structure of module builds.
             msg = "Erratum %s: missing modulemd sources on koji build(s): %s" % (
-                erratum.name,
+                self._erratum_name,
                 ", ".join(builds_missing_koji),
             )
             raise ValueError(msg)
 
-        return out
-
-    def __iter__(self):
-        # Get raw ET responses for all errata.
-        raw_fs = [self._client.get_raw_f(id) for id in self._advisory_ids]
-
-        # Convert them to lists of push items
-        push_items_fs = []
-        for f in futures.as_completed(raw_fs, timeout=self._timeout):
-            push_items_fs.append(
-                self._executor.submit(self._push_items_from_raw, f.result())
-            )
-
-        completed_fs = as_completed_with_timeout_reset(
-            push_items_fs, timeout=self._timeout
-        )
-        for f in completed_fs:
-            for pushitem in f.result():
-                yield pushitem
-
 
 Source.register_backend("errata", ErrataSource)
@@ -0,0 +1,180 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from functools import partial
+
+from .koji_sessions import SESSION_POOL
+
+LOG = logging.getLogger("pushsource")
+
+
+class AggregatedCall(object):
+    # A call added to an AggregatedMultiCall, whose result is available once
+    # the multicall it was merged into has completed.
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        # The call in the shared multicall
+        self.handle = None
+        # Any exception raised when adding the call to the shared multicall
+        self.error = None
+
+    @property
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        if self.handle is None:
+            raise RuntimeError("Called .result on multicall before done")
+        return self.handle.result
+
+
+class AggregatedMultiCall(object):
+    # Collects calls in the manner of koji's MultiCallSession, but executes
+    # them via a KojiCallAggregator, merged with calls from other sources.
+
+    def __init__(self, aggregator, url, strict=False, batch=None):
+        self._aggregator = aggregator
+        self._url = url
+        self._strict = strict
+        self._batch = batch
+        self._calls = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return partial(self._add_call, name)
+
+    def _add_call(self, name, *args, **kwargs):
+        call = AggregatedCall(name, args, kwargs)
+        self._calls.append(call)
+        return call
+
+    def call_all(self):
+        calls = self._calls
+        self._calls = []
+
+        if calls:
+            self._aggregator.execute(self._url, calls, self._batch)
+
+        if self._strict:
+            # Raise the first fault among our own calls; faults in calls made
+            # for other sources don't concern us.
+            for call in calls:
+                call.result  # pylint: disable=pointless-statement
+
+
+class _Round(object):
+    # A shared multicall, gathering calls from any number of sources.
+    def __init__(self, batch):
+        self.calls = []
+        self.sources = 0
+        self.batch = batch
+        self.error = None
+        self.done = threading.Event()
+
+    def add(self, calls, batch):
+        self.calls.extend(calls)
+        self.sources += 1
+        if batch and (not self.batch or batch < self.batch):
+            self.batch = batch
+
+
+class KojiCallAggregator(object):
+    # Merges koji calls made concurrently by any number of KojiSource
+    # instances into shared multicalls, per koji hub.
+    #
+    # The first source to submit calls for a hub opens a round, which
+    # other sources join by adding their own calls. The round is started
+    # after a short window, or once fewer than max_rounds are already
+    # running for the hub; while waiting, it keeps accepting calls.
+    # Results are then available to each source via its own calls.
+
+    def __init__(self, window, max_rounds):
+        self._window = window
+        self._max_rounds = max_rounds
+        self._cond = threading.Condition()
+        # url => round accepting calls
+        self._open = {}
+        # url => number of running rounds
+        self._running = Counter()
+
+    def multicall(self, url, strict=False, batch=None):
+        return AggregatedMultiCall(self, url, strict=strict, batch=batch)
+
+    def execute(self, url, calls, batch=None):
+        # Executes calls as part of a shared multicall to the hub at url,
+        # blocking until complete.
+        with self._cond:
+            current = self._open.get(url)
+            leader = current is None
+            if leader:
+                current = self._open[url] = _Round(batch)
+            current.add(calls, batch)
+
+        if leader:
+            self._lead(url, current)
+        else:
+            current.done.wait()
+
+        if current.error is not None:
+            raise current.error
+
+    def _lead(self, url, current):
+        if self._window:
+            time.sleep(self._window)
+
+        with self._cond:
+            while self._running[url] >= self._max_rounds:
+                self._cond.wait()
+            # Round no longer accepts calls once it's running
+            del self._open[url]
+            self._running[url] += 1
+
+        try:
+            self._run(url, current)
+        except Exception as e:  # pylint: disable=broad-except
+            current.error = e
+        finally:
+            with self._cond:
+                self._running[url] -= 1
+                self._cond.notify_all()
+            current.done.set()
+
+    def _run(self, url, current):
+        start = time.monotonic()
+
+        with SESSION_POOL.session(url, {"anon_retry": True}) as session:
+            multicall = session.multicall(strict=False, batch=current.batch)
+            for call in current.calls:
+                try:
+                    call.handle = getattr(multicall, call.method)(
+                        *call.args, **call.kwargs
+                    )
+                except Exception as e:  # pylint: disable=broad-except
+                    call.error = e
+            multicall.call_all()
+
+        LOG.debug(
+            "koji aggregated multicall: executed %s call(s) for %s source(s)",
+            len(current.calls),
+            current.sources,
+            extra={
+                "event": {
+                    "type": "koji-aggregated-multicall",
+                    "url": url,
+                    "calls": len(current.calls),
+                    "sources": current.sources,
+                    "duration": time.monotonic() - start,
+                }
+            },
+        )
+
+
+AGGREGATOR = KojiCallAggregator(
+    window=float(os.environ.get("PUSHSOURCE_KOJI_AGGREGATE_WINDOW", "0.01")),
+    max_rounds=int(os.environ.get("PUSHSOURCE_KOJI_AGGREGATE_ROUNDS", "4")),
+)
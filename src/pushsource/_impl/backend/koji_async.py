@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import ssl
+import weakref
+from functools import partial
+
+import httpx
+import koji
+
+LOG = logging.getLogger("pushsource")
+
+# Extra arguments for httpx.AsyncClient.
+# Provided so it can be overridden from tests (e.g. to use a mock transport).
+CLIENT_ARGS = {}
+
+# Clients are bound to an event loop, so they're kept per loop:
+# loop => {url => AsyncKojiSession}
+SESSIONS = weakref.WeakKeyDictionary()
+
+
+class AsyncMultiCall(object):
+    # Collects calls to be executed by 'await call_all()', in the manner
+    # of koji's MultiCallSession: each call returns a koji.VirtualCall whose
+    # result is available once call_all has completed.
+
+    def __init__(self, session, strict=False, batch=None):
+        self._session = session
+        self._strict = strict
+        self._batch = batch
+        self._calls = []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return partial(self._add_call, name)
+
+    def _add_call(self, name, *args, **kwargs):
+        call = koji.VirtualCall(name, args, kwargs)
+        self._calls.append(call)
+        return call
+
+    async def call_all(self, timeout=None):
+        calls = self._calls
+        self._calls = []
+
+        batch = self._batch or len(calls)
+        results = []
+        for i in range(0, len(calls), batch):
+            batch_calls = calls[i : i + batch]
+            batch_results = await self._session.call(
+                "multiCall", [call.format() for call in batch_calls], timeout=timeout
+            )
+            for call, result in zip(batch_calls, batch_results):
+                call._result = result
+            results.extend(batch_results)
+
+        if self._strict:
+            for entry in results:
+                if isinstance(entry, dict):
+                    raise koji.convertFault(
+                        koji.Fault(entry["faultCode"], entry["faultString"])
+                    )
+
+        return results
+
+
+class AsyncKojiSession(object):
+    # A minimal asyncio client for koji's XML-RPC API, supporting the
+    # anonymous calls used by KojiSource.
+    #
+    # Requests are made through a single httpx.AsyncClient, so any number of
+    # concurrent calls share one pool of connections.
+
+    # Number of attempts for calls failing due to connection errors
+    # or server-side errors.
+    ATTEMPTS = 3
+
+    def __init__(self, url, max_connections):
+        self.url = url
+        # Number of users of a session shared via async_session.
+        self.users = 0
+        self._client = httpx.AsyncClient(
+            verify=ssl.create_default_context(
+                cafile=os.environ.get("REQUESTS_CA_BUNDLE")
+            ),
+            limits=httpx.Limits(max_connections=max_connections),
+            headers={"User-Agent": "koji/1", "Content-Type": "text/xml"},
+            **CLIENT_ARGS
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_args):
+        await self.aclose()
+
+    async def aclose(self):
+        # Closes all connections held by the session.
+        await self._client.aclose()
+
+    def multicall(self, strict=False, batch=None):
+        return AsyncMultiCall(self, strict=strict, batch=batch)
+
+    async def getKojiVersion(self):
+        return await self.call("getKojiVersion")
+
+    async def call(self, method, *args, **kwargs):
+        timeout = kwargs.pop("timeout", None)
+        request = koji.dumps(
+            koji.encode_args(*args, **kwargs), method, allow_none=1
+        ).encode("utf-8")
+
+        for attempt in range(1, self.ATTEMPTS + 1):
+            try:
+                response = await self._client.post(
+                    self.url, content=request, timeout=timeout
+                )
+                response.raise_for_status()
+                break
+            except httpx.HTTPError as ex:
+                retryable = isinstance(ex, httpx.TransportError) or (
+                    isinstance(ex, httpx.HTTPStatusError)
+                    and ex.response.status_code >= 500
+                )
+                if not retryable or attempt == self.ATTEMPTS:
+                    raise
+                LOG.debug("Retrying koji call %s after error: %s", method, ex)
+                await asyncio.sleep(2**attempt)
+
+        parser, unmarshaller = koji.getparser()
+        parser.feed(response.content)
+        parser.close()
+        try:
+            result = unmarshaller.close()
+        except koji.Fault as fault:
+            raise koji.convertFault(fault)
+
+        return result[0] if len(result) == 1 else result
+
+
+def async_session(url):
+    """Returns an asyncio koji session for the hub at url, shared by all
+    users of the current event loop.
+
+    Each caller must pass the session to release_async_session once done
+    with it."""
+    loop = asyncio.get_event_loop()
+    sessions = SESSIONS.setdefault(loop, {})
+    if url not in sessions:
+        LOG.debug("Creating async koji session: %s", url)
+        sessions[url] = AsyncKojiSession(
+            url,
+            max_connections=int(
+                os.environ.get("PUSHSOURCE_KOJI_ASYNC_CONNECTIONS", "16")
+            ),
+        )
+    session = sessions[url]
+    session.users += 1
+    return session
+
+
+async def release_async_session(session):
+    """Releases a session obtained from async_session, closing it once it
+    has no more users."""
+    session.users -= 1
+    if session.users:
+        return
+
+    sessions = SESSIONS.get(asyncio.get_event_loop()) or {}
+    if sessions.get(session.url) is session:
+        del sessions[session.url]
+    LOG.debug("Closing async koji session: %s", session.url)
+    await session.aclose()
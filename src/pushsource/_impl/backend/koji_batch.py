@@ -0,0 +1,133 @@
+import json
+import logging
+import threading
+
+LOG = logging.getLogger("pushsource")
+
+
+# Maximum number of results serialized to estimate the size of a multicall's results.
+SIZE_SAMPLE = 8
+
+
+def parse_batch_size(value):
+    # Parses a configured batch size: a number of calls, or "auto".
+    return value if value == "auto" else int(value)
+
+
+def results_size(results):
+    # Approximate total size in bytes of the results of koji calls.
+    #
+    # Only an evenly spaced sample of results is serialized, since results
+    # of calls to the same method tend to be of similar size.
+    if not results:
+        return 0
+    sample = results[:: max(1, len(results) // SIZE_SAMPLE)]
+    return len(json.dumps(sample, default=str)) * len(results) // len(sample)
+
+
+class AdaptiveBatchSize(object):
+    # Chooses how many koji calls go into each multicall, based on the
+    # latency and size of earlier responses.
+    #
+    # Each koji method has its own estimated cost per call: the fraction of
+    # a full batch taken by one call, where a full batch is expected to
+    # complete in around TARGET_SECONDS and produce a response of around
+    # TARGET_BYTES. Calls to any methods may share a multicall, which is
+    # full once the total cost of its calls reaches 1, within the given
+    # bounds on the number of calls. This avoids making many round trips for
+    # cheap calls, while keeping responses for expensive calls (e.g. container
+    # builds with large 'extra' data) reasonably small.
+
+    TARGET_SECONDS = 2.0
+    TARGET_BYTES = 2 * 1024 * 1024
+
+    # Weight given to the newest observation in moving averages.
+    ALPHA = 0.5
+
+    def __init__(self, minimum, maximum, initial):
+        self._min = minimum
+        self._max = max(minimum, maximum)
+        self._initial = self._clamp(initial)
+        self._lock = threading.Lock()
+        # method => (seconds, bytes) per call
+        self._per_call = {}
+
+    def _clamp(self, value):
+        return max(self._min, min(self._max, int(value)))
+
+    def _cost(self, method):
+        # Estimated fraction of a full batch taken by one call to method.
+        if method not in self._per_call:
+            return 1.0 / self._initial
+        seconds, size = self._per_call[method]
+        return max(seconds / self.TARGET_SECONDS, size / self.TARGET_BYTES, 1e-9)
+
+    def get(self, method):
+        # Returns the number of calls to method alone which make a full batch.
+        with self._lock:
+            return self._clamp(1.0 / self._cost(method))
+
+    def full(self, counts):
+        # Returns True if a multicall with the given number of calls
+        # per method (dict of method => count) is a full batch.
+        total = sum(counts.values())
+        if total >= self._max:
+            return True
+        if total < self._min:
+            return False
+        with self._lock:
+            cost = sum(count * self._cost(method) for method, count in counts.items())
+        return cost >= 1.0
+
+    def record(self, counts, seconds, sizes):
+        # Records that a multicall with the given number of calls per method
+        # took 'seconds' to complete, with results of approximately sizes[method]
+        # bytes for each method.
+        #
+        # The time taken is attributed to each method in proportion to the
+        # size of its results, or to its number of calls if results are empty.
+        counts = dict((method, count) for method, count in counts.items() if count)
+        if not counts:
+            return
+
+        total_size = sum(sizes.get(method, 0) for method in counts)
+        total_calls = sum(counts.values())
+
+        for method, calls in sorted(counts.items()):
+            size = sizes.get(method, 0)
+            if total_size:
+                share = float(size) / total_size
+            else:
+                share = float(calls) / total_calls
+            self._record(method, calls, seconds * share, size)
+
+    def _record(self, method, calls, seconds, size):
+        with self._lock:
+            old_batch_size = self._clamp(1.0 / self._cost(method))
+
+            seconds = float(seconds) / calls
+            size = float(size) / calls
+            if method in self._per_call:
+                old_seconds, old_size = self._per_call[method]
+                seconds = self.ALPHA * seconds + (1 - self.ALPHA) * old_seconds
+                size = self.ALPHA * size + (1 - self.ALPHA) * old_size
+            self._per_call[method] = (seconds, size)
+
+            batch_size = self._clamp(1.0 / self._cost(method))
+
+        if batch_size != old_batch_size:
+            LOG.debug(
+                "koji multicall batch size for %s: %s => %s",
+                method,
+                old_batch_size,
+                batch_size,
+                extra={
+                    "event": {
+                        "type": "koji-batch-size",
+                        "method": method,
+                        "batch_size": batch_size,
+                        "seconds_per_call": seconds,
+                        "bytes_per_call": size,
+                    }
+                },
+            )
@@ -0,0 +1,147 @@
+import threading
+from collections import OrderedDict
+
+# Fields of koji build & archive metadata used by KojiSource.
+#
+# Each spec is a dict of keys to retain: a value of True retains the entire
+# value for that key, while a nested spec retains only some keys of a nested
+# dict. This drops large data such as the build's container image config and
+# layer history, which is never used.
+IMAGE_SPEC = {
+    "arch": True,
+    "boot_mode": True,
+    "index": True,
+    "media_types": True,
+    "operator_manifests": True,
+    "sources_for_nvr": True,
+}
+
+BUILD_SPEC = {
+    "id": True,
+    "nvr": True,
+    "name": True,
+    "version": True,
+    "release": True,
+    "epoch": True,
+    "state": True,
+    "volume_name": True,
+    "completion_time": True,
+    "extra": {
+        "container_koji_task_id": True,
+        "operator_manifests_archive": True,
+        "image": IMAGE_SPEC,
+        "typeinfo": {
+            "image": IMAGE_SPEC,
+            "operator-manifests": True,
+        },
+    },
+}
+
+ARCHIVE_SPEC = {
+    "id": True,
+    "filename": True,
+    "btype": True,
+    "type_name": True,
+    "checksum": True,
+    "checksum_type": True,
+    "size": True,
+    "extra": {
+        "image": {"arch": True, "boot_mode": True},
+        "docker": {
+            "tags": True,
+            "repositories": True,
+            "digests": True,
+            "config": {
+                "architecture": True,
+                "config": {"Labels": True},
+            },
+        },
+    },
+}
+
+
+def project(value, spec):
+    # Returns a copy of value retaining only the keys in spec.
+    if spec is True or not isinstance(value, dict):
+        return value
+    return dict(
+        (key, project(value[key], subspec))
+        for (key, subspec) in spec.items()
+        if key in value
+    )
+
+
+def project_build(build):
+    return project(build, BUILD_SPEC) if build else build
+
+
+def project_archives(archives):
+    return [project(archive, ARCHIVE_SPEC) for archive in archives or []]
+
+
+class ProjectedCache(object):
+    # A size-limited cache of koji metadata.
+    #
+    # Values are projected to a compact form when stored, and each value is
+    # stored once, though it may be looked up by several keys (e.g. a build's
+    # ID and NVR). Once more than max_entries values are stored, the least
+    # recently used values are discarded.
+    #
+    # Supports the parts of the dict interface used by KojiSource.
+
+    def __init__(self, projection, max_entries):
+        self._projection = projection
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        # primary key => (value, [keys])
+        self._entries = OrderedDict()
+        # key => primary key
+        self._aliases = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._aliases
+
+    def __getitem__(self, key):
+        with self._lock:
+            primary = self._aliases[key]
+            self._entries.move_to_end(primary)
+            return self._entries[primary][0]
+
+    def __setitem__(self, key, value):
+        self.put(value, [key])
+
+    def put(self, value, keys):
+        # Stores value under each of the given keys, returning the value
+        # as projected.
+        value = self._projection(value)
+        primary = keys[0]
+
+        with self._lock:
+            for key in keys:
+                old_primary = self._aliases.get(key)
+                if old_primary is not None and old_primary != primary:
+                    self._remove(old_primary)
+
+            if primary in self._entries:
+                keys = set(self._entries[primary][1]).union(keys)
+
+            self._entries[primary] = (value, list(keys))
+            self._entries.move_to_end(primary)
+            for key in keys:
+                self._aliases[key] = primary
+
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+
+        return value
+
+    def _remove(self, primary):
+        _, keys = self._entries.pop(primary)
+        for key in keys:
+            if self._aliases.get(key) == primary:
+                del self._aliases[key]
@@ -0,0 +1,113 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import koji
+
+LOG = logging.getLogger("pushsource")
+
+
+class KojiSessionPool(object):
+    # A pool of koji client sessions, shared by all KojiSource instances
+    # in a process, so that connections to koji (including TLS handshakes)
+    # can be reused rather than being set up again by each source.
+    #
+    # A session is only used by one thread at a time. Sessions are created
+    # on demand, and up to max_idle sessions per koji hub are retained when
+    # not in use.
+    #
+    # Sessions which have been idle for longer than check_after seconds are
+    # checked before reuse, and any session which raised an exception
+    # while in use is discarded. Sessions leaving the pool for any reason
+    # are logged out and their connections closed.
+
+    def __init__(self, max_idle, check_after):
+        self._max_idle = max_idle
+        self._check_after = check_after
+        self._lock = threading.Lock()
+        # (url, opts) => [(session, time last used), ...]
+        self._idle = {}
+
+    def clear(self):
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for (url, _), sessions in idle.items():
+            for session, _ in sessions:
+                self._close(session, url)
+
+    @contextmanager
+    def session(self, url, opts=None):
+        # Borrows a session for the given koji hub for the duration of
+        # a 'with' block.
+        opts = opts or {}
+        key = (url, tuple(sorted(opts.items())))
+
+        session = self._get(key)
+        try:
+            yield session
+        except Exception:
+            # Can't be sure the session is still in a good state, so let it
+            # go rather than returning it to the pool.
+            LOG.debug("Discarding koji session for %s after error", url)
+            self._close(session, url)
+            raise
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._max_idle:
+                idle.append((session, time.monotonic()))
+                return
+
+        # Pool is already full.
+        self._close(session, url)
+
+    def _get(self, key):
+        url, opts = key
+
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                session, last_used = idle.pop()
+
+            if time.monotonic() - last_used < self._check_after:
+                return session
+
+            if self._healthy(session, url):
+                return session
+
+            self._close(session, url)
+
+        LOG.debug("Creating koji session: %s", url)
+        return koji.ClientSession(url, dict(opts))
+
+    def _healthy(self, session, url):
+        try:
+            session.getKojiVersion()
+            return True
+        except Exception:  # pylint: disable=broad-except
+            LOG.debug("Discarding unhealthy koji session for %s", url, exc_info=True)
+            return False
+
+    def _close(self, session, url):
+        # Logs out a session which is leaving the pool (if it was logged in)
+        # and closes its connection.
+        try:
+            session.logout()
+        except Exception:  # pylint: disable=broad-except
+            LOG.debug("Error logging out koji session for %s", url, exc_info=True)
+
+        rsession = getattr(session, "rsession", None)
+        if rsession is not None:
+            rsession.close()
+
+
+SESSION_POOL = KojiSessionPool(
+    max_idle=int(os.environ.get("PUSHSOURCE_KOJI_SESSION_POOL_SIZE", "16")),
+    check_after=int(os.environ.get("PUSHSOURCE_KOJI_SESSION_CHECK_AFTER", "60")),
+)
@@ -1,25 +1,20 @@
+import asyncio
 import os
+import re
 import threading
 import logging
+import time
 from functools import partial
 import json
+from collections import Counter
+from contextlib import contextmanager
 
-from queue import Queue, Empty
+from concurrent.futures import Future, CancelledError
+from queue import Queue, LifoQueue, Empty
 from threading import Thread
 
 import koji
 from more_executors import Executors
-from more_executors.futures import f_map
-
-try:
-    from kobo import rpmlib
-except Exception as ex:  # pragma: no cover, pylint: disable=broad-except
-    # If kobo.rpmlib is unavailable, let's not immediately crash.
-    # We will hold this exception and re-raise it only if there's an
-    # attempt to use the related functionality.
-    from . import broken_rpmlib as rpmlib
-
-    rpmlib.CAUSE = ex
 
 from ..source import Source
 from ..model import (
@@ -37,11 +32,20 @@ from ..model import (
 )
 from ..helpers import (
     list_argument,
+    try_bool,
     try_int,
     as_completed_with_timeout_reset,
     wait_exist,
 )
+from ..utils.disk_cache import DiskCache, DEFAULT_TTL
+from ..utils.http_opener import HttpOpener
 from .modulemd import Module
+from .koji_batch import AdaptiveBatchSize, parse_batch_size, results_size
+from .koji_cache import ProjectedCache, project_build, project_archives
+from .koji_aggregator import AGGREGATOR
+from .koji_async import async_session, release_async_session
+from .koji_sessions import SESSION_POOL
+from .rpm_keys import get_signing_key, read_signing_key_from
 from .koji_containers import ContainerArchiveHelper, MIME_TYPE_MANIFEST_LIST
 
 LOG = logging.getLogger("pushsource")
@@ -51,83 +55,287 @@ CACHE_LOCK = threading.RLock()
 # Provided so it can be overridden from tests to reduce time spent on retries.
 RETRY_ARGS = {}
 
+# Filename of an RPM from its koji metadata.
+RPM_FILENAME = "%(name)s-%(version)s-%(release)s.%(arch)s.rpm"
+
+# Matches signing keys which are plain key IDs (as opposed to aliases).
+KEY_ID = re.compile(r"^[0-9a-f]{8}$")
+
+
+class KojiCommand(object):
+    # Base class for commands fetching data from koji.
+    #
+    # Identical koji calls are coalesced: if a command finds that the same
+    # call is already in flight (possibly from another fetch thread), it waits
+    # for that call's result rather than making another call.
+    #
+    # Subclasses implement provides(), returning keys of the data which may
+    # have been cached once the command was saved, as used by
+    # KojiSource._ready_futures.
+    def __init__(self):
+        self.call = None
+        # Key of the call this command is responsible for, if any.
+        self.claimed = None
+        # Future for a call made on behalf of this command by another command.
+        self.inflight = None
+
+    def claim(self, source, key, is_cached):
+        # Returns True if this command should fetch the data identified
+        # by key, in which case it must later release the claim.
+        claimed, self.inflight = source._begin_call(key, is_cached)
+        if claimed:
+            self.claimed = key
+        return claimed
+
+    def release(self, source, error=None):
+        if self.claimed:
+            source._end_call(self.claimed, error)
+            self.claimed = None
+
+    def wait(self, source):
+        # Wait for any call made on behalf of this command.
+        if self.inflight:
+            self.inflight.result(source._timeout)
+
+
+class ListArchivesCommand(KojiCommand):
+    method = "listArchives"
 
-class ListArchivesCommand(object):
     def __init__(self, build):
+        super(ListArchivesCommand, self).__init__()
         self.build = build
-        self.call = None
 
     def execute(self, source, session):
-        archives_cache = source._cache.setdefault("archives", {})
+        archives_cache = source._archives_cache
         ident = self.build["id"]
-        if ident in archives_cache:
+        if not self.claim(
+            source, (self.method, ident), lambda: ident in archives_cache
+        ):
+            return 0
+
+        archives = source._load_persistent("archives", ident)
+        if archives is not None:
+            self.store(source, archives)
             return 0
 
         LOG.debug("Get koji archives %s", ident)
         self.call = session.listArchives(ident)
         return 1
 
+    def store(self, source, archives):
+        source._archives_cache.put(archives, [self.build["id"], self.build["nvr"]])
+        self.release(source)
+
+    def provides(self):
+        return [("archives", self.build["id"])]
+
     def save(self, source, _):
+        self.wait(source)
         if self.call is not None:
-            source._cache["archives"][self.build["id"]] = self.call.result
-            source._cache["archives"][self.build["nvr"]] = self.call.result
+            archives = project_archives(self.call.result)
+            source._save_persistent("archives", self.build["id"], archives, self.build)
+            self.store(source, archives)
 
 
-class GetBuildCommand(object):
+class GetBuildCommand(KojiCommand):
+    method = "getBuild"
+
     def __init__(self, ident, list_archives=False):
+        super(GetBuildCommand, self).__init__()
         self.ident = ident
         self.list_archives = list_archives
-        self.call = None
 
     def execute(self, source, session):
-        build_cache = source._cache.setdefault("build", {})
-        if self.ident in build_cache:
+        build_cache = source._build_cache
+        if not self.claim(
+            source, (self.method, self.ident), lambda: self.ident in build_cache
+        ):
             return 0
+
+        build = source._load_persistent("build", self.ident)
+        if build is not None:
+            self.store(source, build)
+            return 0
+
         LOG.debug("Get koji build %s", self.ident)
         self.call = session.getBuild(self.ident)
         return 1
 
+    def store(self, source, build):
+        # Build is saved under both NVR and ID
+        if build:
+            source._build_cache.put(build, [build["id"], build["nvr"]])
+        else:
+            source._build_cache[self.ident] = build
+        self.release(source)
+
     def save(self, source, koji_queue):
+        self.wait(source)
         if self.call is None:
-            build = source._cache["build"][self.ident]
+            build = source._get_build(self.ident)
         else:
-            # Build is saved under both NVR and ID
-            build = self.call.result
+            build = project_build(self.call.result)
             if build:
-                source._cache["build"][build["id"]] = build
-                source._cache["build"][build["nvr"]] = build
-            else:
-                source._cache["build"][self.ident] = build
+                source._save_persistent("build", build["id"], build, build)
+                source._save_persistent("build", build["nvr"], build, build)
+            self.store(source, build)
         if self.list_archives and build:
             koji_queue.put(ListArchivesCommand(build))
 
+    def provides(self):
+        return [("build", self.ident)]
+
 
-class GetRpmCommand(object):
-    def __init__(self, ident):
+class GetRpmCommand(KojiCommand):
+    method = "getRPM"
+
+    def __init__(self, ident, siblings=None):
+        super(GetRpmCommand, self).__init__()
         self.ident = ident
-        self.call = None
+        # Filenames of other RPMs expected to be from the same build,
+        # to be obtained via listRPMs once this RPM's build is known.
+        self.siblings = siblings or []
 
     def execute(self, source, session):
         rpm_cache = source._cache.setdefault("rpm", {})
-        if self.ident in rpm_cache:
+        if not self.claim(
+            source, (self.method, self.ident), lambda: self.ident in rpm_cache
+        ):
             return 0
+
+        rpm = source._load_persistent("rpm", self.ident)
+        if rpm is not None:
+            self.store(source, rpm)
+            return 0
+
         LOG.debug("Get koji RPM %s", self.ident)
         self.call = session.getRPM(self.ident)
         return 1
 
+    def store(self, source, rpm):
+        source._cache["rpm"][self.ident] = rpm
+        self.release(source)
+
     def save(self, source, koji_queue):
+        self.wait(source)
         if self.call is not None:
-            source._cache["rpm"][self.ident] = self.call.result
+            source._save_persistent("rpm", self.ident, self.call.result)
+            self.store(source, self.call.result)
         # We have to get the RPM's build as well.
-        if source._cache["rpm"][self.ident]:
-            build_id = source._cache["rpm"][self.ident]["build_id"]
-            koji_queue.put(GetBuildCommand(build_id))
+        rpm = source._cache["rpm"][self.ident]
+        if rpm:
+            koji_queue.put(GetBuildCommand(rpm["build_id"]))
+            # And its signatures, if we were asked to look them up.
+            if source._query_signatures:
+                koji_queue.put(QueryRpmSigsCommand(rpm["id"]))
+            if self.siblings:
+                koji_queue.put(ListRpmsCommand(rpm["build_id"], self.siblings))
+        else:
+            # Can't use this RPM to find the others, look them up one by one.
+            for filename in self.siblings:
+                koji_queue.put(GetRpmCommand(filename))
+
+    def provides(self):
+        return [("rpm", self.ident)]
+
+
+class ListRpmsCommand(KojiCommand):
+    method = "listRPMs"
+
+    def __init__(self, build_id, filenames):
+        super(ListRpmsCommand, self).__init__()
+        self.build_id = build_id
+        self.filenames = filenames
+
+    def execute(self, source, session):
+        build_rpms_cache = source._cache.setdefault("build_rpms", {})
+        if not self.claim(
+            source,
+            (self.method, self.build_id),
+            lambda: self.build_id in build_rpms_cache,
+        ):
+            return 0
+
+        LOG.debug("List koji RPMs in build %s", self.build_id)
+        self.call = session.listRPMs(buildID=self.build_id)
+        return 1
+
+    def save(self, source, koji_queue):
+        self.wait(source)
+        if self.call is not None:
+            source._cache["build_rpms"][self.build_id] = self.call.result
+            self.release(source)
+
+        build_rpms = dict(
+            (RPM_FILENAME % rpm, rpm)
+            for rpm in source._cache["build_rpms"][self.build_id]
+        )
+        rpm_cache = source._cache.setdefault("rpm", {})
+
+        for filename in self.filenames:
+            rpm = build_rpms.get(filename)
+            if not rpm:
+                # Not in the build we guessed, fall back to looking it up directly.
+                LOG.debug("RPM %s not in build %s", filename, self.build_id)
+                koji_queue.put(GetRpmCommand(filename))
+                continue
+
+            rpm_cache[filename] = rpm
+            source._save_persistent("rpm", filename, rpm)
+            if source._query_signatures:
+                koji_queue.put(QueryRpmSigsCommand(rpm["id"]))
+
+    def provides(self):
+        return [("rpm", filename) for filename in self.filenames]
+
+
+class QueryRpmSigsCommand(KojiCommand):
+    method = "queryRPMSigs"
+
+    def __init__(self, rpm_id):
+        super(QueryRpmSigsCommand, self).__init__()
+        self.rpm_id = rpm_id
+
+    def execute(self, source, session):
+        sigs_cache = source._cache.setdefault("rpm_sigs", {})
+        if not self.claim(
+            source, (self.method, self.rpm_id), lambda: self.rpm_id in sigs_cache
+        ):
+            return 0
+
+        # Signatures are not persistently cached since RPMs may be signed
+        # at any time.
+        LOG.debug("Get koji RPM signatures %s", self.rpm_id)
+        self.call = session.queryRPMSigs(rpm_id=self.rpm_id)
+        return 1
+
+    def save(self, source, _):
+        self.wait(source)
+        if self.call is not None:
+            source._cache["rpm_sigs"][self.rpm_id] = self.call.result
+            self.release(source)
+
+    def provides(self):
+        return [("rpm_sigs", self.rpm_id)]
 
 
 class KojiSource(Source):
     """Uses koji artifacts as the source of push items."""
 
-    _BATCH_SIZE = int(os.environ.get("PUSHSOURCE_KOJI_BATCH_SIZE", "100"))
+    # Number of calls per multicall batch, or "auto" for adaptive batch sizes
+    _BATCH_SIZE = parse_batch_size(os.environ.get("PUSHSOURCE_KOJI_BATCH_SIZE", "100"))
+    _BATCH_SIZE_MIN = int(os.environ.get("PUSHSOURCE_KOJI_BATCH_SIZE_MIN", "10"))
+    _BATCH_SIZE_MAX = int(os.environ.get("PUSHSOURCE_KOJI_BATCH_SIZE_MAX", "1000"))
+    # Number of requested RPMs/builds processed together by each task
+    _CHUNK_SIZE = max(1, int(os.environ.get("PUSHSOURCE_KOJI_CHUNK_SIZE", "1")))
+    _CACHE_TTL = int(os.environ.get("PUSHSOURCE_KOJI_CACHE_TTL", str(60 * 60 * 24)))
+    _CACHE_MAX_ENTRIES = int(
+        os.environ.get("PUSHSOURCE_KOJI_CACHE_MAX_ENTRIES", "100000")
+    )
+    # Koji build type used to find each type of content in a tag
+    _TAG_BUILD_TYPES = {"module": "module", "container": "image", "vmi": "image"}
+    # Number of builds (and archive lists) retained in memory
+    _BUILD_CACHE_SIZE = int(os.environ.get("PUSHSOURCE_KOJI_BUILD_CACHE_SIZE", "10000"))
 
     def __init__(
         self,
@@ -144,6 +352,18 @@ class KojiSource(Source):
         timeout=60 * 30,
         cache=None,
         executor=None,
+        stream=False,
+        persistent_cache=None,
+        query_signatures=False,
+        list_rpms=False,
+        tag=None,
+        tag_type=None,
+        tag_latest=True,
+        tag_inherit=False,
+        topurl=None,
+        aggregate=False,
+        fetch_only=False,
+        origin=None,
     ):
         """Create a new source.
 
@@ -217,8 +437,122 @@ class KojiSource(Source):
                 case, some calls may be avoided by passing the same cache
                 to each instance.
 
+                Only the fields of koji builds used by this source are cached,
+                and the number of cached builds is limited, so a cache may be
+                retained for the lifetime of a process.
+
+                Identical calls are never made more than once concurrently.
+                Counters of calls made and avoided are kept in the cache
+                under the ``"stats"`` key.
+
             executor (concurrent.futures.Executor)
                 A custom executor used to submit calls to koji.
+
+            stream (bool)
+                If ``True``, each push item is produced as soon as the koji data
+                needed for it has been fetched, rather than only after all data
+                has been fetched.
+
+                This reduces the time until the first push item is yielded for
+                large requests. The order of yielded push items is not affected
+                in any meaningful way, as it is unspecified either way.
+
+            persistent_cache (str)
+                Path to a file used to retain the results of XML-RPC calls
+                across processes. The file is created if it doesn't exist.
+
+                Unlike ``cache``, this cache is useful even if each process
+                creates only a single instance of KojiSource. It can be safely
+                shared by any number of concurrent processes.
+
+                Data relating to completed builds is cached indefinitely; other
+                data expires after ``PUSHSOURCE_KOJI_CACHE_TTL`` seconds
+                (default: one day). The cache holds up to
+                ``PUSHSOURCE_KOJI_CACHE_MAX_ENTRIES`` entries (default: 100000),
+                after which the least recently used entries are discarded.
+
+            query_signatures (bool)
+                If ``True`` and ``signing_key`` is provided, the signatures
+                available for each RPM are queried from koji, and the preferred
+                signing key is selected from koji's response.
+
+                The filesystem is then only accessed to confirm the existence of
+                the selected signed RPM, rather than probing the path for each
+                signing key and reading RPM headers to determine the key ID.
+
+            list_rpms (bool)
+                If ``True``, requested RPMs which appear to belong to the same build
+                (as they share a version, release and the first component of
+                their name) are looked up together.
+                One of the RPMs is looked up directly, then all RPMs of its build
+                are listed to find the others.
+
+                This reduces the number of calls to koji when requesting many RPMs
+                from a few builds, such as all the RPMs in an advisory. Any RPMs
+                not found this way are looked up individually.
+
+            tag (str)
+                Name of a koji tag. If provided, the source will also yield
+                content tagged into this tag, as selected by ``tag_type``.
+
+                Content is found via a few bulk queries to koji, which is far
+                more efficient than requesting the same content individually.
+
+            tag_type (list[str])
+                Type(s) of content to be yielded from ``tag``; any of ``rpm``,
+                ``module``, ``container`` or ``vmi``. Defaults to ``rpm``.
+
+                ``rpm`` yields RPMs in the tag; the other types yield content
+                from builds in the tag, as if requested via ``module_build``,
+                ``container_build`` or ``vmi_build`` respectively.
+
+            tag_latest (bool)
+                If ``True`` (the default), only content from the latest build of
+                each package in ``tag`` is yielded.
+
+            tag_inherit (bool)
+                If ``True``, content is also found in tags inherited by ``tag``.
+
+            topurl (str)
+                URL serving the content under ``basedir`` over HTTP
+                (e.g. https://kojipkgs.fedoraproject.org/).
+
+                If provided, the content of RPMs, modulemd files and VM images
+                is accessed via HTTP rather than from the local filesystem,
+                and ``basedir`` need not be mounted locally. Such push items
+                have an :attr:`~pushsource.PushItem.opener` which downloads
+                content, verifying it against any checksums known to koji.
+
+                Large files are downloaded using several concurrent range
+                requests (``PUSHSOURCE_KOJI_HTTP_THREADS``, default: 4).
+                Requests time out according to
+                ``PUSHSOURCE_KOJI_HTTP_CONNECT_TIMEOUT`` (default: 30) and
+                ``PUSHSOURCE_KOJI_HTTP_READ_TIMEOUT`` (default: 300).
+                If ``PUSHSOURCE_KOJI_HTTP_CACHE`` is set to a directory,
+                downloaded content is retained there, so that each file is
+                only downloaded once.
+
+            aggregate (bool)
+                If ``True``, calls to koji are merged with those made at the same
+                time by any other koji sources in the process using the same koji hub,
+                and executed together in shared multicalls.
+
+                This greatly reduces the number of round trips to koji when many
+                small sources are used concurrently, such as one source per
+                advisory or per container image.
+
+            fetch_only (bool)
+                If ``True``, koji data for the requested content is fetched into
+                ``cache`` (and ``persistent_cache``, if given), but no push items
+                are produced.
+
+                This may be used to speculatively fetch data needed by other
+                sources sharing the same cache, without accessing content from
+                koji or creating push items.
+
+            origin (str)
+                The origin to fill in for push items created by this source.
+                If omitted, all push items have an empty origin.
         """
         self._url = url
         self._rpm = [try_int(x) for x in list_argument(rpm)]
@@ -229,11 +563,47 @@ class KojiSource(Source):
         self._container_build = [try_int(x) for x in list_argument(container_build)]
         self._vmi_build = [try_int(x) for x in list_argument(vmi_build)]
         self._signing_key = self._parse_signing_key(list_argument(signing_key))
+        self._tag = tag
+        self._tag_type = list_argument(tag_type) or ["rpm"]
+        self._tag_latest = try_bool(tag_latest)
+        self._tag_inherit = try_bool(tag_inherit)
+        # Filenames of RPMs found in tag, once the tag has been queried
+        self._tag_rpms = None
+        # Builds of RPMs found in tag, by ID
+        self._tag_builds = {}
+        for build_type in self._tag_type:
+            if build_type not in self._TAG_BUILD_TYPES and build_type != "rpm":
+                raise ValueError("Unsupported tag_type: %s" % build_type)
         self._dest = list_argument(dest)
+        self._origin = origin
         self._timeout = timeout
         self._pathinfo = koji.PathInfo(basedir)
+        self._opener = (
+            HttpOpener(
+                self._pathinfo.topdir,
+                topurl,
+                cache_dir=os.environ.get("PUSHSOURCE_KOJI_HTTP_CACHE") or None,
+                threads=int(os.environ.get("PUSHSOURCE_KOJI_HTTP_THREADS") or "4"),
+            )
+            if topurl
+            else None
+        )
         self._cache = {} if cache is None else cache
         self._threads = threads
+        self._stream = try_bool(stream)
+        self._list_rpms = try_bool(list_rpms)
+        self._aggregate = try_bool(aggregate)
+        self._fetch_only = try_bool(fetch_only)
+        self._query_signatures = try_bool(query_signatures) and bool(self._signing_key)
+        self._persistent_cache = (
+            DiskCache.shared(
+                persistent_cache,
+                ttl=self._CACHE_TTL,
+                max_entries=self._CACHE_MAX_ENTRIES,
+            )
+            if persistent_cache
+            else None
+        )
         self._executor = (
             executor
             or Executors.thread_pool(name="pushsource-koji", max_workers=threads)
@@ -244,6 +614,10 @@ class KojiSource(Source):
         self._on_shutdown = []
         if not executor:
             self._on_shutdown.append(lambda: self._executor.shutdown(True))
+        if self._opener:
+            # Push items may still use the opener later, in which case it
+            # reconnects as needed.
+            self._on_shutdown.append(self._opener.close)
 
     def __enter__(self):
         return self
@@ -252,16 +626,20 @@ class KojiSource(Source):
         for cb in self._on_shutdown:
             cb()
 
-    @property
     def _koji_session(self):
-        # A koji client session.
-        # Each thread uses a separate client.
-        with CACHE_LOCK:
-            tls = self._cache.setdefault("tls", threading.local())
-            if not hasattr(tls, "koji_session"):
-                LOG.debug("Creating koji session: %s", self._url)
-                tls.koji_session = koji.ClientSession(self._url, {"anon_retry": True})
-        return tls.koji_session
+        # Borrows a koji client session from the process-wide pool, for use
+        # in a 'with' statement. Sessions must not be shared between threads.
+        return SESSION_POOL.session(self._url, {"anon_retry": True})
+
+    @contextmanager
+    def _multicall_factory(self):
+        # Yields a callable for creating multicall sessions, for use in a
+        # 'with' statement.
+        if self._aggregate:
+            yield partial(AGGREGATOR.multicall, self._url)
+            return
+        with self._koji_session() as koji_session:
+            yield koji_session.multicall
 
     def _parse_signing_key(self, keys):
         out = []
@@ -285,22 +663,227 @@ class KojiSource(Source):
     def _koji_get_version(self):
         with CACHE_LOCK:
             if "koji_version" not in self._cache:
-                self._cache["koji_version"] = self._koji_session.getKojiVersion()
+                with self._koji_session() as session:
+                    self._cache["koji_version"] = session.getKojiVersion()
             return self._cache["koji_version"]
 
+    def _has_koji_version(self):
+        with CACHE_LOCK:
+            return "koji_version" in self._cache
+
+    def _set_koji_version(self, version):
+        with CACHE_LOCK:
+            self._cache["koji_version"] = version
+
     def _get_rpm(self, rpm):
         return self._cache["rpm"][rpm]
 
+    @property
+    def _build_cache(self):
+        return self._projected_cache("build", project_build)
+
+    @property
+    def _archives_cache(self):
+        return self._projected_cache("archives", project_archives)
+
+    def _projected_cache(self, kind, projection):
+        with CACHE_LOCK:
+            if kind not in self._cache:
+                self._cache[kind] = ProjectedCache(projection, self._BUILD_CACHE_SIZE)
+            return self._cache[kind]
+
     def _get_build(self, build_id):
-        return self._cache["build"][build_id]
+        if build_id in self._tag_builds:
+            return self._tag_builds[build_id]
+        try:
+            return self._build_cache[build_id]
+        except KeyError:
+            # Can happen only if the build was evicted from the cache since
+            # it was fetched; fetch it again.
+            LOG.debug("Get koji build %s (evicted from cache)", build_id)
+            with self._koji_session() as session:
+                build = session.getBuild(build_id)
+            if not build:
+                self._build_cache[build_id] = build
+                return build
+            return self._build_cache.put(build, [build["id"], build["nvr"]])
 
     def _get_archives(self, build_id):
-        return self._cache["archives"][build_id]
+        try:
+            return self._archives_cache[build_id]
+        except KeyError:
+            # As in _get_build
+            LOG.debug("Get koji archives %s (evicted from cache)", build_id)
+            with self._koji_session() as session:
+                archives = session.listArchives(build_id)
+            return self._archives_cache.put(archives, [build_id])
+
+    def _get_rpm_sigs(self, rpm_id):
+        return self._cache["rpm_sigs"][rpm_id]
+
+    def _persistent_key(self, kind, ident):
+        return json.dumps([self._url, kind, ident])
+
+    def _load_persistent(self, kind, ident):
+        # Returns a koji result previously saved to the persistent cache,
+        # or None if unavailable.
+        if not self._persistent_cache:
+            return None
+        out = self._persistent_cache.get(self._persistent_key(kind, ident))
+        if out is not None:
+            self._count("persistent_hits")
+        return out
+
+    def _save_persistent(self, kind, ident, value, build=None):
+        # Saves a koji result to the persistent cache.
+        #
+        # Data relating to a completed build doesn't change, so it's cached
+        # without expiry. Missing data isn't cached at all, as it may appear
+        # later.
+        if not self._persistent_cache or value is None:
+            return
+        ttl = DEFAULT_TTL
+        if build and build.get("state") == koji.BUILD_STATES["COMPLETE"]:
+            ttl = None
+        self._persistent_cache.put(self._persistent_key(kind, ident), value, ttl)
+
+    def _count(self, name, value=1):
+        with CACHE_LOCK:
+            self._cache.setdefault("stats", Counter())[name] += value
+
+    def _log_stats(self):
+        with CACHE_LOCK:
+            stats = dict(self._cache.get("stats") or {})
+        LOG.debug(
+            "koji fetch stats: %s",
+            ", ".join("%s=%s" % item for item in sorted(stats.items())),
+            extra={"event": dict(type="koji-fetch-stats", **stats)},
+        )
+
+    @property
+    def _batch_sizer(self):
+        # The object used to pick adaptive batch sizes, if enabled.
+        # It's kept in the cache so that instances sharing a cache also share
+        # what was learned about koji's performance.
+        if self._BATCH_SIZE != "auto":
+            return None
+        with CACHE_LOCK:
+            if "batch_sizer" not in self._cache:
+                self._cache["batch_sizer"] = AdaptiveBatchSize(
+                    self._BATCH_SIZE_MIN, self._BATCH_SIZE_MAX, initial=100
+                )
+            return self._cache["batch_sizer"]
+
+    def _batch_full(self, counts):
+        # Returns True if a multicall with the given number of calls per
+        # method is a full batch.
+        sizer = self._batch_sizer
+        if sizer:
+            return sizer.full(counts)
+        return sum(counts.values()) >= self._BATCH_SIZE
+
+    def _begin_call(self, key, is_cached):
+        # Called before making the koji call identified by 'key'.
+        #
+        # Returns (claimed, inflight) where:
+        # - claimed is True if the caller should make the call, and later
+        #   call _end_call once the result has been cached
+        # - inflight is a Future resolved once the result of the call is cached,
+        #   if another caller is already making the same call
+        #
+        # If is_cached() returns True, no call is needed at all.
+        with CACHE_LOCK:
+            if is_cached():
+                self._count("cache_hits")
+                return (False, None)
+
+            inflight = self._cache.setdefault("inflight", {})
+            if key in inflight:
+                self._count("coalesced")
+                return (False, inflight[key])
+
+            inflight[key] = Future()
+            return (True, None)
+
+    def _end_call(self, key, error=None):
+        with CACHE_LOCK:
+            inflight = self._cache["inflight"].pop(key)
+        if error:
+            inflight.set_exception(error)
+        else:
+            inflight.set_result(None)
+
+    def _rpm_missing(self, rpm):
+        # Returns the key of some koji data needed for an RPM which hasn't
+        # been fetched yet, or None if all of it has been fetched.
+        rpm_cache = self._cache.get("rpm") or {}
+        if rpm not in rpm_cache:
+            return ("rpm", rpm)
+        meta = rpm_cache[rpm]
+        if not meta:
+            return None
+        if self._query_signatures and meta["id"] not in (
+            self._cache.get("rpm_sigs") or {}
+        ):
+            return ("rpm_sigs", meta["id"])
+        if (
+            meta["build_id"] not in self._tag_builds
+            and meta["build_id"] not in self._build_cache
+        ):
+            return ("build", meta["build_id"])
+        return None
+
+    def _exists(self, path, timeout=0, poll_rate=0):
+        # Returns True if the file at path exists, waiting up to timeout
+        # seconds for it to appear on the local filesystem.
+        if self._opener:
+            return self._opener.exists(path)
+        if timeout:
+            wait_exist(path, timeout, poll_rate)
+        return os.path.exists(path)
+
+    def _open(self, path):
+        # Returns a file object for reading the content of the file at path.
+        if self._opener:
+            return self._opener.open(path)
+        return open(path, "rb")
+
+    def _read_signing_key(self, path):
+        if self._opener:
+            return self._opener.read_head(path, read_signing_key_from)
+        return get_signing_key(path)
+
+    def _add_checksum(self, path, archive):
+        # Records the checksum of an archive, so it's verified on download.
+        checksum_type = archive.get("checksum_type")
+        if isinstance(checksum_type, int):
+            checksum_type = koji.CHECKSUM_TYPES[checksum_type]
+        if self._opener and archive.get("checksum") and checksum_type:
+            self._opener.add_checksum(path, checksum_type, archive["checksum"])
+
+    def _item_opener(self):
+        # Extra arguments for push items whose content may be accessed via
+        # the opener.
+        return {"opener": self._opener} if self._opener else {}
+
+    def _build_missing(self, build_id):
+        # As _rpm_missing, for a build.
+        build_cache = self._build_cache
+        if build_id not in build_cache:
+            return ("build", build_id)
+        meta = build_cache[build_id]
+        if meta and meta["id"] not in self._archives_cache:
+            return ("archives", meta["id"])
+        return None
 
     def _push_items_from_rpm_meta(self, rpm, meta):
         LOG.debug("RPM metadata for %s: %s", rpm, meta)
 
-        notfound = [RpmPushItem(name=str(rpm), dest=self._dest, state="NOTFOUND")]
+        notfound = [
+            RpmPushItem(
+                name=str(rpm), dest=self._dest, origin=self._origin, state="NOTFOUND"
+            )
+        ]
 
         if not meta:
             LOG.error("RPM not found in koji: %s", rpm)
@@ -317,33 +900,41 @@ class KojiSource(Source):
         timeout = int(os.getenv("PUSHSOURCE_SRC_POLL_TIMEOUT") or "0")
         poll_rate = int(os.getenv("PUSHSOURCE_SRC_POLL_RATE") or "30")
 
-        # If signing keys requested, try them in order of preference
-        # We will wait up to timeout for the highest-priority key to appear
-        # If it fails to appear, try keys with lowering priorities until one is present
-        key = self._signing_key[0] if self._signing_key else None
-        if key:
-            key = key.lower()
-            candidate = os.path.join(build_path, self._pathinfo.signed(meta, key))
-        else:
-            candidate = unsigned_path
+        if self._query_signatures:
+            rpm_path, rpm_signing_key = self._rpm_path_from_sigs(
+                meta, build_path, unsigned_path, timeout, poll_rate
+            )
 
-        wait_exist(candidate, timeout, poll_rate)
-        # If signing keys requested, try them in order of preference
-        # Some key should be present at this stage, let's try them all
-        for key in self._signing_key:
+        if not rpm_path:
+            # If signing keys requested, try them in order of preference
+            # We will wait up to timeout for the highest-priority key to appear
+            # If it fails to appear, try keys with lowering priorities until one is present
+            key = self._signing_key[0] if self._signing_key else None
             if key:
                 key = key.lower()
                 candidate = os.path.join(build_path, self._pathinfo.signed(meta, key))
             else:
                 candidate = unsigned_path
-            candidate_paths.append(candidate)
-            if os.path.exists(candidate):
-                rpm_path = candidate
-                # we may only get key alias as input, let's extract actual key ID from RPM header in all cases
-                # as we don't know if the provided data are alias or actual key ID
-                header = rpmlib.get_rpm_header(candidate)
-                rpm_signing_key = rpmlib.get_keys_from_header(header)
-                break
+
+            if not self._opener:
+                wait_exist(candidate, timeout, poll_rate)
+            # If signing keys requested, try them in order of preference
+            # Some key should be present at this stage, let's try them all
+            for key in self._signing_key:
+                if key:
+                    key = key.lower()
+                    candidate = os.path.join(
+                        build_path, self._pathinfo.signed(meta, key)
+                    )
+                else:
+                    candidate = unsigned_path
+                candidate_paths.append(candidate)
+                if self._exists(candidate):
+                    rpm_path = candidate
+                    # we may only get key alias as input, let's extract actual key ID from RPM header in all cases
+                    # as we don't know if the provided data are alias or actual key ID
+                    rpm_signing_key = self._read_signing_key(candidate)
+                    break
 
         if self._signing_key:
             # If signing keys requested: we either found an RPM above, or an error occurs
@@ -363,11 +954,45 @@ class KojiSource(Source):
                 name=os.path.basename(rpm_path),
                 src=rpm_path,
                 dest=self._dest,
+                origin=self._origin,
                 signing_key=rpm_signing_key,
                 build=build["nvr"],
+                **self._item_opener()
             )
         ]
 
+    def _rpm_path_from_sigs(self, meta, build_path, unsigned_path, timeout, poll_rate):
+        # Selects the RPM with the preferred signing key among the signatures
+        # known to koji. The filesystem is only used to confirm that the RPM
+        # exists.
+        #
+        # Returns (path, signing_key), or (None, None) if no suitable RPM was
+        # found, in which case the caller should fall back to probing paths.
+        sigkeys = set(sig["sigkey"].lower() for sig in self._get_rpm_sigs(meta["id"]))
+
+        for key in self._signing_key:
+            if not key:
+                path = unsigned_path
+            elif key.lower() in sigkeys:
+                key = key.lower()
+                path = os.path.join(build_path, self._pathinfo.signed(meta, key))
+            else:
+                continue
+
+            if not self._exists(path, timeout, poll_rate):
+                LOG.warning(
+                    "RPM signed with %s according to koji is missing at %s", key, path
+                )
+                break
+
+            if key and not KEY_ID.match(key):
+                # Key is an alias, so we still need the RPM header to know
+                # the actual key ID.
+                key = self._read_signing_key(path)
+            return (path, key)
+
+        return (None, None)
+
     def _module_filtered(self, file_path):
         ok_names = self._module_filter_filename
         filename = os.path.basename(file_path)
@@ -403,11 +1028,14 @@ class KojiSource(Source):
             # do not attempt to parse
             return basename
 
-        if not os.path.exists(file_path):
+        if not self._opener and not os.path.exists(file_path):
             # Don't have the file, don't attempt to parse
             return basename
 
         try:
+            if self._opener:
+                with self._opener.open(file_path) as f:
+                    return Module.from_text(f.read().decode("utf-8"), file_path).nsvca
             return Module.from_file(file_path).nsvca
         except:
             # If we fail, make it clear what we were attempting to do before raising
@@ -437,6 +1065,8 @@ class KojiSource(Source):
             if self._module_filtered(file_path):
                 continue
 
+            self._add_checksum(file_path, module)
+
             name = self._get_module_name(nvr, file_path)
 
             klass = ModuleMdPushItem
@@ -444,7 +1074,14 @@ class KojiSource(Source):
                 klass = ModuleMdSourcePushItem
 
             out.append(
-                klass(name=name, src=file_path, dest=self._dest, build=meta["nvr"])
+                klass(
+                    name=name,
+                    src=file_path,
+                    dest=self._dest,
+                    origin=self._origin,
+                    build=meta["nvr"],
+                    **self._item_opener()
+                )
             )
         return out
 
@@ -508,6 +1145,7 @@ class KojiSource(Source):
                     # the metadata from atomic-reactor.
                     name=archive["filename"],
                     dest=self._dest,
+                    origin=self._origin,
                     build=nvr,
                     # Note, we should be able to use the default KojiBuild
                     # construction from NVR here. The reason we don't is that
@@ -588,6 +1226,7 @@ class KojiSource(Source):
         for archive in vmi_archives:
             path = self._pathinfo.typedir(meta, archive["btype"])
             item_src = os.path.join(path, archive["filename"])
+            self._add_checksum(item_src, archive)
 
             extra = archive.get("extra") or {}
             image = extra.get("image") or {}
@@ -627,6 +1266,7 @@ class KojiSource(Source):
                     name=archive["filename"],
                     description="",
                     dest=self._dest,
+                    origin=self._origin,
                     src=item_src,
                     boot_mode=boot_mode,
                     build=nvr,
@@ -638,6 +1278,7 @@ class KojiSource(Source):
                     ),
                     md5sum=archive.get("checksum"),
                     release=release,
+                    **self._item_opener()
                 )
             )
 
@@ -654,7 +1295,7 @@ class KojiSource(Source):
             if archive.get("filename") == "meta.json":
                 path = self._pathinfo.typedir(meta, archive["btype"])
                 item_src = os.path.join(path, archive["filename"])
-                with open(item_src) as archive_file:
+                with self._open(item_src) as archive_file:
                     rhcos_meta_data = json.loads(archive_file.read())
 
         extra = meta.get("extra") or {}
@@ -769,101 +1410,435 @@ class KojiSource(Source):
         return OperatorManifestPushItem(
             name=os.path.join(nvr, operator_archive_name),
             dest=self._dest,
+            origin=self._origin,
             build=nvr,
             related_images=operator_related_images,
             container_image_items=container_items,
         )
 
-    def _rpm_futures(self):
-        # Get info from each requested RPM.
-        rpm_fs = [(self._executor.submit(self._get_rpm, rpm), rpm) for rpm in self._rpm]
+    def _tag_calls(self):
+        # Returns the calls needed to find content in the requested tag,
+        # as a list of (method, args, kwargs).
+        if not self._tag or self._tag_rpms is not None:
+            return []
 
-        # Convert them to lists of push items
-        return [
-            f_map(f, partial(self._push_items_from_rpm_meta, rpm)) for f, rpm in rpm_fs
-        ]
+        kwargs = {"latest": self._tag_latest, "inherit": self._tag_inherit}
+        out = []
+        for tag_type in self._tag_type:
+            if tag_type == "rpm":
+                out.append(("listTaggedRPMS", (self._tag,), kwargs))
+            else:
+                build_type = self._TAG_BUILD_TYPES[tag_type]
+                out.append(("listTagged", (self._tag,), dict(kwargs, type=build_type)))
+        return out
 
-    def _modulemd_futures(self):
-        # Get info from each requested module build.
-        module_build_fs = [
-            (self._executor.submit(self._get_build, build), build)
-            for build in self._module_build
-        ]
+    def _use_tag_results(self, results):
+        # Adds content found in the requested tag, given the results
+        # of the calls from _tag_calls.
+        rpm_cache = self._cache.setdefault("rpm", {})
+        self._tag_rpms = set()
+
+        for tag_type, result in zip(self._tag_type, results):
+            if tag_type == "rpm":
+                rpms, builds = result
+                LOG.debug("Found %s RPM(s) in tag %s", len(rpms), self._tag)
+
+                # These builds lack fields present in the output of getBuild,
+                # so they're only used by this source, not cached.
+                for build in builds:
+                    self._tag_builds[build["id"]] = project_build(build)
+
+                for rpm in rpms:
+                    filename = RPM_FILENAME % rpm
+                    with CACHE_LOCK:
+                        rpm_cache.setdefault(filename, rpm)
+                    self._rpm.append(filename)
+                    self._tag_rpms.add(filename)
+            else:
+                nvrs = [build["nvr"] for build in result]
+                LOG.debug(
+                    "Found %s %s build(s) in tag %s", len(nvrs), tag_type, self._tag
+                )
+                {
+                    "module": self._module_build,
+                    "container": self._container_build,
+                    "vmi": self._vmi_build,
+                }[tag_type].extend(nvrs)
+
+        self._count("calls", len(results))
+
+    def _find_tagged(self):
+        calls = self._tag_calls()
+        if calls:
+            with self._koji_session() as session:
+                self._use_tag_results(
+                    [
+                        getattr(session, method)(*args, **kwargs)
+                        for (method, args, kwargs) in calls
+                    ]
+                )
 
-        # Convert them to lists of push items
-        return [
-            f_map(f, partial(self._push_items_from_module_build, build))
-            for f, build in module_build_fs
-        ]
+    async def _find_tagged_async(self, session):
+        results = []
+        for method, args, kwargs in self._tag_calls():
+            results.append(
+                await asyncio.wait_for(
+                    session.call(method, *args, **kwargs), self._timeout
+                )
+            )
+        await self._in_executor(self._use_tag_results, results)
 
-    def _container_futures(self):
-        # Get info from each requested container build.
-        build_fs = [
-            (self._executor.submit(self._get_build, build), build)
-            for build in self._container_build
-        ]
+    def _rpm_commands(self):
+        # Returns commands needed to obtain all requested RPMs.
+        out = []
+        rpms = self._rpm
+
+        if self._tag_rpms:
+            # RPMs from the tag were already obtained along with their builds,
+            # but we may still need their signatures.
+            rpms = [rpm for rpm in rpms if rpm not in self._tag_rpms]
+            if self._query_signatures:
+                rpm_cache = self._cache["rpm"]
+                out.extend(
+                    QueryRpmSigsCommand(rpm_cache[rpm]["id"]) for rpm in self._tag_rpms
+                )
 
-        # Convert them to lists of push items
-        return [
-            f_map(f, partial(self._push_items_from_container_build, build))
-            for f, build in build_fs
-        ]
+        if not self._list_rpms:
+            return out + [GetRpmCommand(ident=rpm) for rpm in rpms]
 
-    def _vmi_futures(self):
-        # Get info from each requested virtual machine image build.
-        vmi_build_fs = [
-            (self._executor.submit(self._get_build, build), build)
-            for build in self._vmi_build
-        ]
+        # RPMs from the same build normally share a version-release, and a
+        # name prefix with the build (e.g. foo, foo-devel), so group by those.
+        # Each group is resolved by a single getRPM followed by a listRPMs on
+        # the build found.
+        groups = {}
+        for rpm in rpms:
+            try:
+                nvra = koji.parse_NVRA(rpm)
+            except (koji.GenericError, AttributeError, TypeError):
+                # e.g. RPM requested by ID
+                out.append(GetRpmCommand(ident=rpm))
+                continue
+            key = (nvra["name"].split("-")[0], nvra["version"], nvra["release"])
+            groups.setdefault(key, []).append(rpm)
 
-        # Convert them to lists of push items
-        return [
-            f_map(f, partial(self._push_items_from_vmi_build, build))
-            for f, build in vmi_build_fs
-        ]
+        for group in groups.values():
+            out.append(GetRpmCommand(ident=group[0], siblings=group[1:]))
 
-    def _do_fetch(self, koji_queue, exceptions):
-        try:
-            done = False
+        return out
 
-            while not done:
-                count = 0
-                pending_commands = []
+    def _chunked_futures(self, kind, idents, get_meta, push_items, ready):
+        # Returns futures for lists of push items for each of the given
+        # RPMs/builds. Items are processed in chunks of _CHUNK_SIZE, with
+        # one future per chunk, to reduce overhead on large requests.
+        #
+        # get_meta(ident) obtains the koji metadata for an item, and
+        # push_items(ident, meta) converts it to a list of push items.
+        ready = ready or {}
+        out = []
 
-                session = self._koji_session.multicall(
-                    strict=True, batch=self._BATCH_SIZE
-                )
+        for i in range(0, len(idents), self._CHUNK_SIZE):
+            chunk = idents[i : i + self._CHUNK_SIZE]
+            chunk_ready = [ready[(kind, x)] for x in chunk if (kind, x) in ready]
+            out.append(self._chunk_future(chunk, chunk_ready, get_meta, push_items))
 
-                while not done:
-                    try:
-                        command = koji_queue.get_nowait()
-                        count += command.execute(self, session)
-                        pending_commands.append(command)
-                    except Empty:
-                        done = True
-                        LOG.debug("koji fetch queue emptied")
+        return out
+
+    def _chunk_future(self, chunk, chunk_ready, get_meta, push_items):
+        # Returns a future for the push items of a single chunk, whose
+        # metadata is obtained from the executor once all futures in
+        # chunk_ready have resolved.
+        #
+        # This is done with plain callbacks rather than composing futures
+        # via f_map, f_sequence etc, as those add significant overhead per
+        # future, which adds up with a chunk per item and delays streaming.
+        out = Future()
+        state = {"waiting": len(chunk_ready)}
+        lock = threading.Lock()
+
+        def on_metas(metas_f):
+            if metas_f.cancelled():
+                out.cancel()
+            elif metas_f.exception():
+                out.set_exception(metas_f.exception())
+            else:
+                try:
+                    result = self._chunk_push_items(push_items, chunk, metas_f.result())
+                except Exception as e:  # pylint: disable=broad-except
+                    out.set_exception(e)
+                else:
+                    out.set_result(result)
+
+        def submit():
+            try:
+                metas_f = self._executor.submit(lambda: [get_meta(x) for x in chunk])
+            except Exception as e:  # pylint: disable=broad-except
+                # e.g. executor already shut down
+                out.set_exception(e)
+            else:
+                metas_f.add_done_callback(on_metas)
+
+        def on_ready(ready_f):
+            error = None
+            if ready_f.cancelled():
+                error = CancelledError()
+            elif ready_f.exception():
+                error = ready_f.exception()
+
+            with lock:
+                if state["waiting"] <= 0:
+                    # Already failed due to some other future.
+                    return
+                state["waiting"] = 0 if error else state["waiting"] - 1
+                if state["waiting"]:
+                    return
+
+            if error:
+                out.set_exception(error)
+            else:
+                submit()
 
-                LOG.debug("koji multicall: about to execute %s call(s)", count)
+        if chunk_ready:
+            for ready_f in chunk_ready:
+                ready_f.add_done_callback(on_ready)
+        else:
+            submit()
 
-                session.call_all()
+        return out
 
-                LOG.debug("koji multicall: executed %s call(s)", count)
+    def _chunk_push_items(self, push_items, chunk, metas):
+        out = []
+        for ident, meta in zip(chunk, metas):
+            out.extend(push_items(ident, meta))
+        return out
 
-                # multicall is now done.
-                # Save the result to cache from each command.
-                # This could potentially result in new queue entries.
-                for command in pending_commands:
-                    command.save(self, koji_queue)
+    def _rpm_futures(self, ready=None):
+        # Get info from each requested RPM and convert to push items.
+        return self._chunked_futures(
+            "rpm", self._rpm, self._get_rpm, self._push_items_from_rpm_meta, ready
+        )
 
-                # If there were any commands processed, queue might no longer be
-                # empty, so re-check it
-                if pending_commands:
-                    done = False
+    def _modulemd_futures(self, ready=None):
+        # Get info from each requested module build and convert to push items.
+        return self._chunked_futures(
+            "build",
+            self._module_build,
+            self._get_build,
+            self._push_items_from_module_build,
+            ready,
+        )
+
+    def _container_futures(self, ready=None):
+        # Get info from each requested container build and convert to push items.
+        return self._chunked_futures(
+            "build",
+            self._container_build,
+            self._get_build,
+            self._push_items_from_container_build,
+            ready,
+        )
+
+    def _vmi_futures(self, ready=None):
+        # Get info from each requested virtual machine image build and convert
+        # to push items.
+        return self._chunked_futures(
+            "build",
+            self._vmi_build,
+            self._get_build,
+            self._push_items_from_vmi_build,
+            ready,
+        )
+
+    def _execute_queued(self, koji_queue, multicall, pending_commands):
+        # Executes commands from the queue against a multicall session
+        # obtained from multicall(), appending them to pending_commands,
+        # until the queue is empty or a full batch of calls has been made.
+        #
+        # Returns (session, counts), the multicall session used (if any)
+        # and the number of calls made per koji method.
+        #
+        # Each round makes at most one batch of calls, so that results are
+        # saved (and any push items depending on them become ready) after
+        # every batch, rather than only once the whole queue is processed.
+        #
+        # Calls to all methods share the same multicall; if batch sizes are
+        # adaptive, the batch is full once the estimated cost of its calls
+        # reaches the target.
+        session = None
+        counts = Counter()
+
+        while True:
+            try:
+                command = koji_queue.get_nowait()
+            except Empty:
+                LOG.debug("koji fetch queue emptied")
+                return session, counts
+
+            pending_commands.append(command)
+            if session is None:
+                session = multicall(strict=True, batch=self._multicall_batch)
+            counts[command.method] += command.execute(self, session)
+            if self._batch_full(counts):
+                return session, counts
+
+    @property
+    def _multicall_batch(self):
+        # Batch size passed to koji's multicall, which splits calls into
+        # requests of at most that many calls. Our own batches are never
+        # larger than this, so each batch is made in a single request.
+        if self._BATCH_SIZE == "auto":
+            return self._BATCH_SIZE_MAX
+        return self._BATCH_SIZE
+
+    def _do_fetch(self, koji_queue, exceptions, on_saved=None):
+        pending_commands = []
+        try:
+            with self._multicall_factory() as multicall:
+                done = False
+
+                while not done:
+                    pending_commands = []
+                    session, counts = self._execute_queued(
+                        koji_queue, multicall, pending_commands
+                    )
+                    done = True
+
+                    if session is not None:
+                        self._call_all(session, counts, pending_commands)
+
+                    # multicall is now done.
+                    # Save the result to cache from each command.
+                    # This could potentially result in new queue entries.
+                    #
+                    # Commands waiting on calls made by other commands are saved
+                    # last, so we never block others waiting on our own results.
+                    pending_commands.sort(
+                        key=lambda command: command.inflight is not None
+                    )
+                    self._save_commands(pending_commands, koji_queue, on_saved)
+
+                    # If there were any commands processed, queue might no longer be
+                    # empty, so re-check it
+                    if pending_commands:
+                        done = False
         except Exception as e:
             LOG.exception("Error during koji fetches")
             exceptions.append(e)
+            # Anyone waiting for calls we were responsible for should also fail
+            for command in pending_commands:
+                command.release(self, e)
             raise
 
+    async def _in_executor(self, fn, *args):
+        # Calls fn(*args) from the event loop's default executor.
+        #
+        # Used from the event loop for anything accessing the cache, as
+        # doing so can block on CACHE_LOCK or on persistent cache I/O.
+        return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+    def _save_commands(self, commands, koji_queue, on_saved=None):
+        # Saves the results of commands, then passes the keys of the data
+        # they provided to on_saved, if given.
+        for command in commands:
+            command.save(self, koji_queue)
+        if on_saved:
+            on_saved([key for command in commands for key in command.provides()])
+
+    async def _do_fetch_async(self, session, koji_queue, on_saved=None):
+        # As _do_fetch, but for use from an event loop.
+        pending_commands = []
+        try:
+            done = False
+
+            while not done:
+                pending_commands = []
+                multicall, counts = await self._in_executor(
+                    self._execute_queued,
+                    koji_queue,
+                    session.multicall,
+                    pending_commands,
+                )
+                done = True
+
+                if multicall is not None:
+                    start = self._start_call_all(counts)
+                    await multicall.call_all(timeout=self._timeout)
+                    await self._in_executor(
+                        self._end_call_all, counts, start, pending_commands
+                    )
+
+                # Save the results of our own calls first, then wait (without
+                # blocking the event loop) for calls made by others.
+                own = [c for c in pending_commands if c.inflight is None]
+                others = [c for c in pending_commands if c.inflight is not None]
+                await self._in_executor(self._save_commands, own, koji_queue, on_saved)
+                for command in others:
+                    # Shielded since the future is shared with other callers,
+                    # and must only be resolved by the caller making the call.
+                    await asyncio.wait_for(
+                        asyncio.shield(asyncio.wrap_future(command.inflight)),
+                        self._timeout,
+                    )
+                await self._in_executor(
+                    self._save_commands, others, koji_queue, on_saved
+                )
+
+                if pending_commands:
+                    done = False
+        except BaseException as e:
+            # BaseException since the task may also be cancelled, in which case
+            # others waiting on our calls must not wait forever.
+            LOG.exception("Error during koji fetches")
+            for command in pending_commands:
+                command.release(
+                    self, e if isinstance(e, Exception) else RuntimeError(repr(e))
+                )
+            raise
+
+    def _call_all(self, session, counts, commands):
+        # Execute all calls from a multicall session.
+        start = self._start_call_all(counts)
+        session.call_all()
+        self._end_call_all(counts, start, commands)
+
+    def _start_call_all(self, counts):
+        LOG.debug(
+            "koji multicall: about to execute %s call(s), batch size %s",
+            sum(counts.values()),
+            self._BATCH_SIZE,
+        )
+        return time.monotonic()
+
+    def _end_call_all(self, counts, start, commands):
+        duration = time.monotonic() - start
+        count = sum(counts.values())
+
+        LOG.debug(
+            "koji multicall: executed %s call(s)",
+            count,
+            extra={
+                "event": {
+                    "type": "koji-multicall",
+                    "methods": dict(counts),
+                    "calls": count,
+                    "batch_size": self._BATCH_SIZE,
+                    "duration": duration,
+                }
+            },
+        )
+        self._count("calls", count)
+
+        sizer = self._batch_sizer
+        if sizer and count:
+            results = {}
+            for command in commands:
+                if command.call is not None:
+                    results.setdefault(command.method, []).append(command.call.result)
+            sizes = dict(
+                (method, results_size(method_results))
+                for method, method_results in results.items()
+            )
+            sizer.record(counts, duration, sizes)
+
     def __iter__(self):
         # Try a (blocking) call to koji before anything else.
         #
@@ -880,53 +1855,164 @@ class KojiSource(Source):
         #   before we spawn multiple threads is a way to avoid this.
         #
         self._koji_check()
+        self._find_tagged()
+
+        koji_queue = self._koji_queue()
+
+        if self._fetch_only:
+            self._fetch(koji_queue)
+            return
+
+        if self._stream:
+            push_items_fs = self._stream_futures(koji_queue)
+        else:
+            self._fetch(koji_queue)
+            push_items_fs = self._push_items_futures()
+
+        completed_fs = as_completed_with_timeout_reset(
+            push_items_fs, timeout=self._timeout
+        )
+        for f in completed_fs:
+            # If an exception occurred, this is where it will be raised.
+            for pushitem in f.result():
+                yield pushitem
+
+    async def __aiter__(self):
+        # As __iter__, but koji calls are made from the current event loop
+        # rather than from fetch threads, via a connection pool shared by
+        # all sources using the loop. Yields the same push items as __iter__.
+        #
+        # Push items are still created on the executor, since doing so may
+        # involve blocking filesystem access.
+        session = async_session(self._url)
+        push_items = self._aiter_session(session)
+        try:
+            async for pushitem in push_items:
+                yield pushitem
+        finally:
+            await push_items.aclose()
+            await release_async_session(session)
+
+    async def _aiter_session(self, session):
+        # Yields push items for __aiter__, using the given async koji session.
+        if not await self._in_executor(self._has_koji_version):
+            try:
+                version = await asyncio.wait_for(
+                    session.getKojiVersion(), self._timeout
+                )
+            except Exception as ex:  # pylint: disable=broad-except
+                msg = "Communication error with koji at %s" % self._url
+                raise RuntimeError(msg) from ex
+            await self._in_executor(self._set_koji_version, version)
+            LOG.debug("Connected to koji %s at %s", version, self._url)
+
+        await self._find_tagged_async(session)
+        koji_queue = self._koji_queue()
+
+        if self._fetch_only:
+            await self._fetch_async(session, koji_queue)
+            return
+
+        if self._stream:
+            ready, poll, fail = self._ready_futures()
+            await self._in_executor(poll)
+            fetch = asyncio.ensure_future(
+                self._stream_fetch_async(session, koji_queue, poll, fail)
+            )
+            push_items_fs = self._push_items_futures(ready)
+        else:
+            fetch = asyncio.ensure_future(self._fetch_async(session, koji_queue))
+            await fetch
+            push_items_fs = self._push_items_futures()
 
-        # Queue holding all requests we need to make to koji.
+        try:
+            for f in asyncio.as_completed(
+                [asyncio.wrap_future(f) for f in push_items_fs]
+            ):
+                # If an exception occurred, this is where it will be raised.
+                for pushitem in await asyncio.wait_for(f, self._timeout):
+                    yield pushitem
+
+            # All items were yielded; let the fetch finish as in __iter__,
+            # rather than leaving it to be cancelled with the event loop.
+            await fetch
+        finally:
+            if not fetch.done():
+                # We're finishing early; let the fetches end as soon as they can.
+                self._drain(koji_queue)
+
+    def _koji_queue(self):
+        # Returns a queue holding all requests we need to make to koji.
         # We try to fetch as much as we can early to make efficient use
         # of multicall.
-        koji_queue = Queue()
+        #
+        # In stream mode, commands queued while saving the results of other
+        # commands are processed first, so that the calls needed for each push
+        # item complete as early as possible, rather than only after the first
+        # call for every push item.
 
         # We'll need to obtain all RPMs referenced by filename
-        for rpm_filename in self._rpm:
-            koji_queue.put(GetRpmCommand(ident=rpm_filename))
+        commands = self._rpm_commands()
 
         # We'll need to obtain all builds from which we want modules,
         # as well as the archives from those
         for build_id in self._module_build:
-            koji_queue.put(GetBuildCommand(ident=build_id, list_archives=True))
+            commands.append(GetBuildCommand(ident=build_id, list_archives=True))
 
         # We'll need to obtain all container image builds
         for build_id in self._container_build:
-            koji_queue.put(GetBuildCommand(ident=build_id, list_archives=True))
+            commands.append(GetBuildCommand(ident=build_id, list_archives=True))
 
         # We'll need to obtain all virtual machine image builds
         for build_id in self._vmi_build:
-            koji_queue.put(GetBuildCommand(ident=build_id, list_archives=True))
+            commands.append(GetBuildCommand(ident=build_id, list_archives=True))
 
+        if self._stream:
+            koji_queue = LifoQueue()
+            commands.reverse()
+        else:
+            koji_queue = Queue()
+
+        for command in commands:
+            koji_queue.put(command)
+
+        return koji_queue
+
+    def _push_items_futures(self, ready=None):
+        return (
+            self._modulemd_futures(ready)
+            + self._rpm_futures(ready)
+            + self._container_futures(ready)
+            + self._vmi_futures(ready)
+        )
+
+    def _drain(self, koji_queue):
+        try:
+            while True:
+                koji_queue.get_nowait()
+        except Empty:
+            pass
+
+    def _start_fetch(self, koji_queue, on_saved=None):
         # Put some threads to work on the queue.
         fetch_exceptions = []
         fetch_threads = [
             Thread(
                 name="koji-%s-fetch-%s" % (id(self), i),
                 target=self._do_fetch,
-                args=(koji_queue, fetch_exceptions),
+                args=(koji_queue, fetch_exceptions, on_saved),
             )
             for i in range(0, self._threads)
         ]
 
-        # Wait for all fetches to finish
         for t in fetch_threads:
             t.start()
 
         # If we are asked to shut down early then also shut down those threads
         # as soon as we can.
         def fetch_shutdown():
-            try:
-                # Empty the queue
-                while True:
-                    koji_queue.get_nowait()
-            except Empty:
-                pass
+            # Empty the queue
+            self._drain(koji_queue)
 
             # Then ask the threads to join
             for t in fetch_threads:
@@ -934,6 +2020,12 @@ class KojiSource(Source):
 
         self._on_shutdown.append(fetch_shutdown)
 
+        return fetch_threads, fetch_exceptions
+
+    def _fetch(self, koji_queue):
+        fetch_threads, fetch_exceptions = self._start_fetch(koji_queue)
+
+        # Wait for all fetches to finish
         for t in fetch_threads:
             t.join(self._timeout)
 
@@ -945,20 +2037,122 @@ class KojiSource(Source):
         # The queue must be empty now
         assert koji_queue.empty()
 
-        push_items_fs = (
-            self._modulemd_futures()
-            + self._rpm_futures()
-            + self._container_futures()
-            + self._vmi_futures()
+        self._log_stats()
+
+    async def _fetch_async(self, session, koji_queue, on_saved=None):
+        # Run concurrent fetches from the current event loop until the queue
+        # is exhausted; equivalent to the fetch threads used by _fetch.
+        results = await asyncio.gather(
+            *[
+                self._do_fetch_async(session, koji_queue, on_saved)
+                for _ in range(0, self._threads)
+            ],
+            return_exceptions=True
         )
 
-        completed_fs = as_completed_with_timeout_reset(
-            push_items_fs, timeout=self._timeout
-        )
-        for f in completed_fs:
-            # If an exception occurred, this is where it will be raised.
-            for pushitem in f.result():
-                yield pushitem
+        # Re-raise exceptions, if any.
+        # If we got more than one, we're only propagating the first.
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        self._log_stats()
+
+    async def _stream_fetch_async(self, session, koji_queue, poll, fail):
+        try:
+            await self._fetch_async(session, koji_queue, poll)
+            error = RuntimeError("koji fetch ended without providing all data")
+        except Exception as ex:  # pylint: disable=broad-except
+            error = ex
+
+        # After all fetches completed, everything should be ready.
+        # If not, it's because some fetch has failed.
+        await self._in_executor(poll)
+        fail(error)
+
+    def _ready_futures(self):
+        # Returns (ready, poll, fail) where:
+        # - ready is a dict of futures for each requested RPM/build, resolved
+        #   once the data needed for it is found in the cache
+        # - poll(keys) resolves futures of any items which may have become
+        #   ready once the data identified by keys was cached, or of all ready
+        #   items if keys are omitted
+        # - fail(error) fails the futures of all items not yet ready
+        #
+        # Each item not yet ready waits on the key of some data it still needs,
+        # so polling only needs to check items waiting on the given keys.
+
+        # item => function returning key of data still needed for the item
+        missing = {}
+        for rpm in self._rpm:
+            missing[("rpm", rpm)] = partial(self._rpm_missing, rpm)
+        for build in self._module_build + self._container_build + self._vmi_build:
+            missing[("build", build)] = partial(self._build_missing, build)
+
+        ready = dict((item, Future()) for item in missing)
+        # key of data => items waiting on it
+        waiting = {}
+        lock = threading.Lock()
+
+        def check(items):
+            for item in items:
+                key = missing[item]()
+                if key is None:
+                    del missing[item]
+                    ready[item].set_result(None)
+                else:
+                    waiting.setdefault(key, []).append(item)
+
+        def poll(keys=None):
+            with lock:
+                if keys is None:
+                    waiting.clear()
+                    check(list(missing))
+                else:
+                    check([item for key in keys for item in waiting.pop(key, [])])
+
+        def fail(error):
+            with lock:
+                for item in missing:
+                    ready[item].set_exception(error)
+                missing.clear()
+                waiting.clear()
+
+        return ready, poll, fail
+
+    def _stream_futures(self, koji_queue):
+        # Returns futures for push items which are each submitted as soon as
+        # the koji data they need is available, while fetches are still ongoing.
+        #
+        # Each requested RPM/build has a 'ready' future, resolved once the
+        # data is found in the cache. Items are checked each time fetch
+        # threads have saved the results of a multicall providing data
+        # they need.
+        ready, poll, fail = self._ready_futures()
+
+        # Some (or all) data may be cached already.
+        poll()
+
+        fetch_threads, fetch_exceptions = self._start_fetch(koji_queue, poll)
+
+        def finish():
+            for t in fetch_threads:
+                t.join()
+
+            self._log_stats()
+
+            # After all fetches completed, everything should be ready.
+            # If not, it's because some fetch has failed.
+            poll()
+            fail(
+                fetch_exceptions[0]
+                if fetch_exceptions
+                else RuntimeError("koji fetch ended without providing all data")
+            )
+
+        Thread(name="koji-%s-fetch-finish" % id(self), target=finish).start()
+
+        return self._push_items_futures(ready)
 
 
 Source.register_backend("koji", KojiSource)
@@ -1,9 +1,138 @@
 # Utilities for dealing with modulemd files from backends.
 # None of this is public API.
+import logging
+import os
+import threading
+from collections import OrderedDict
+
 import yaml
 
 from .. import compat_attr as attr
 
+LOG = logging.getLogger("pushsource")
+
+# Use libyaml for parsing where available.
+Loader = getattr(yaml, "CBaseLoader", yaml.BaseLoader)
+
+# Fields needed to identify a module.
+MOD_FIELDS = ("name", "stream", "version", "context", "arch")
+
+# Placeholder for the key of a mapping while its key is expected.
+NOT_KEY = object()
+
+
+def scan_fields(stream):
+    # Extracts module fields from a modulemd document (text or file object)
+    # using the YAML event parser, without constructing the document.
+    #
+    # Constructing the document dominates the cost of loading large modulemd
+    # files, most of which are lists of artifacts. Every event is still
+    # parsed, so invalid documents raise as they would from a full load.
+    #
+    # Returns None if the stream doesn't hold a single document with the
+    # fields as scalars under 'data', in which case the caller must fully
+    # parse the document.
+    loader = Loader(stream)
+    try:
+        return _scan_events(loader)
+    finally:
+        loader.dispose()
+
+
+def _scan_events(loader):
+    out = {}
+    documents = 0
+    # One entry per open collection: [is_mapping, key, is_data], where key
+    # is the key of the mapping value being parsed, or NOT_KEY while a key is
+    # expected.
+    stack = []
+
+    while loader.check_event():
+        event = loader.get_event()
+
+        if isinstance(event, yaml.DocumentStartEvent):
+            documents += 1
+            if documents > 1:
+                return None
+
+        if isinstance(event, yaml.CollectionEndEvent):
+            stack.pop()
+            if stack:
+                stack[-1][1] = NOT_KEY
+
+        if not isinstance(event, yaml.NodeEvent):
+            continue
+
+        key = NOT_KEY
+        if stack and stack[-1][0]:
+            parent = stack[-1]
+            key = parent[1]
+            if key is NOT_KEY:
+                # This node is a key
+                if not isinstance(event, yaml.ScalarEvent):
+                    return None
+                parent[1] = event.value
+                continue
+
+            # This node is the value for key
+            parent[1] = NOT_KEY
+            if parent[2] and key in MOD_FIELDS:
+                if isinstance(event, yaml.ScalarEvent):
+                    out[key] = event.value
+                else:
+                    out.pop(key, None)
+
+        if isinstance(event, yaml.CollectionStartEvent):
+            is_data = len(stack) == 1 and key == "data"
+            if is_data:
+                # As in a full load, the last 'data' wins
+                out = {}
+            stack.append([isinstance(event, yaml.MappingStartEvent), NOT_KEY, is_data])
+
+    if len(out) != len(MOD_FIELDS):
+        return None
+
+    return out
+
+
+class ModuleCache(object):
+    # Caches modules loaded from files, by file identity (as for signing keys
+    # of RPMs), so that each modulemd file is only read once per process.
+
+    MAX_ENTRIES = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modules = OrderedDict()
+
+    def clear(self):
+        with self._lock:
+            self._modules.clear()
+
+    def get(self, fname, load):
+        try:
+            st = os.stat(fname)
+        except OSError:
+            return load(fname)
+
+        ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if ident in self._modules:
+                self._modules.move_to_end(ident)
+                return self._modules[ident]
+
+        module = load(fname)
+
+        with self._lock:
+            self._modules[ident] = module
+            if len(self._modules) > self.MAX_ENTRIES:
+                self._modules.popitem(last=False)
+
+        return module
+
+
+MODULES = ModuleCache()
+
 
 @attr.s()
 class Module(object):
@@ -29,10 +158,33 @@ class Module(object):
     def from_file(cls, fname):
         # Obtain a Module instance from a YAML file.
         # Raises if file doesn't contain a module or has multiple documents.
+        return MODULES.get(fname, cls._load)
+
+    @classmethod
+    def _load(cls, fname):
         with open(fname) as f:
-            parsed = yaml.load(f, Loader=yaml.BaseLoader)  # nosec B506
-        data = parsed["data"]
+            data = scan_fields(f)
+            if data is None:
+                f.seek(0)
+                data = cls._parse(f, fname)
+        return cls._from_data(data)
 
+    @classmethod
+    def from_text(cls, text, fname="<modulemd>"):
+        # Obtain a Module instance from the text of a YAML file.
+        data = scan_fields(text)
+        if data is None:
+            data = cls._parse(text, fname)
+        return cls._from_data(data)
+
+    @staticmethod
+    def _parse(stream, fname):
+        LOG.debug("Fully parsing modulemd file %s", fname)
+        parsed = yaml.load(stream, Loader=Loader)  # nosec B506
+        return parsed["data"]
+
+    @classmethod
+    def _from_data(cls, data):
         return cls(
             name=data["name"],
             stream=data["stream"],
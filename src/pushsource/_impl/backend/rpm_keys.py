@@ -0,0 +1,221 @@
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+try:
+    from kobo import rpmlib
+except Exception as ex:  # pragma: no cover, pylint: disable=broad-except
+    # If kobo.rpmlib is unavailable, let's not immediately crash.
+    # We will hold this exception and re-raise it only if there's an
+    # attempt to use the related functionality.
+    from . import broken_rpmlib as rpmlib
+
+    rpmlib.CAUSE = ex
+
+import koji
+
+from ..utils.disk_cache import DiskCache
+
+LOG = logging.getLogger("pushsource")
+
+RPM_LEAD_MAGIC = b"\xed\xab\xee\xdb"
+RPM_LEAD_SIZE = 96
+# Signature type in the lead meaning "signature is a header", the only
+# type in use for decades.
+RPM_SIGTYPE_HEADERSIG = 5
+HEADER_MAGIC = b"\x8e\xad\xe8\x01"
+HEADER_BIN_TYPE = 7
+# Tags in the signature header which may hold a signature:
+# DSA and RSA header-only signatures, PGP and GPG header+payload signatures.
+# These are the same signatures as used by rpmlib.get_keys_from_header.
+SIGNATURE_TAGS = (267, 268, 1002, 1005)
+# Sanity limits on the signature header, as used by rpm itself.
+MAX_HEADER_TAGS = 0xFFFF
+MAX_HEADER_SIZE = 256 * 1024 * 1024
+
+
+def read_signing_key(path):
+    """Returns the ID of the key used to sign the RPM at path, or None
+    if the RPM is unsigned.
+
+    Only the lead and signature header at the start of the RPM are read,
+    which is much cheaper than obtaining the full RPM header via rpmlib,
+    while giving the same result as ``rpmlib.get_keys_from_header``.
+
+    Raises ValueError if the file does not appear to be a valid RPM.
+    """
+    with open(path, "rb") as f:
+        return read_signing_key_from(f, path)
+
+
+def read_signing_key_from(f, path):
+    """As :func:`read_signing_key`, reading the RPM from the file-like object f.
+
+    Only the start of the RPM is read from f, so this may be used to efficiently
+    obtain the signing key of a remote RPM from a stream.
+    """
+    lead = _read_exactly(f, RPM_LEAD_SIZE)
+    if len(lead) != RPM_LEAD_SIZE or not lead.startswith(RPM_LEAD_MAGIC):
+        raise ValueError("Not an RPM: %s" % path)
+
+    (sigtype,) = struct.unpack(">H", lead[78:80])
+    if sigtype != RPM_SIGTYPE_HEADERSIG:
+        raise ValueError("Unsupported signature type %s in %s" % (sigtype, path))
+
+    intro = _read_exactly(f, 16)
+    if len(intro) != 16 or not intro.startswith(HEADER_MAGIC):
+        raise ValueError("Invalid signature header in %s" % path)
+
+    tag_count, data_size = struct.unpack(">II", intro[8:])
+    if tag_count > MAX_HEADER_TAGS or data_size > MAX_HEADER_SIZE:
+        raise ValueError("Invalid signature header in %s" % path)
+
+    index = _read_exactly(f, tag_count * 16)
+    data = _read_exactly(f, data_size)
+    if len(index) != tag_count * 16 or len(data) != data_size:
+        raise ValueError("Truncated signature header in %s" % path)
+
+    keys = set()
+    for i in range(tag_count):
+        tag, tag_type, offset, size = struct.unpack_from(">IIII", index, i * 16)
+        if tag not in SIGNATURE_TAGS or tag_type != HEADER_BIN_TYPE or not size:
+            continue
+        if offset + size > data_size:
+            raise ValueError("Invalid signature header in %s" % path)
+        sigpacket = data[offset : offset + size]
+        keys.add(koji.get_sigpacket_key_id(sigpacket).upper())
+
+    if len(keys) > 1:
+        raise ValueError("More than one key found: %s" % keys)
+
+    return keys.pop() if keys else None
+
+
+def _read_exactly(f, size):
+    # Reads size bytes from f, or fewer only at end of file.
+    # Streams (unlike local files) may return less than requested on each read.
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class SigningKeyCache(object):
+    # A cache of the signing keys of RPMs, so that the header of a given RPM
+    # is only parsed once per process (or once ever, if the cache is persisted
+    # on disk).
+    #
+    # RPMs are identified by device, inode, size and mtime rather than path,
+    # so the same file is recognized via any hard link, and a modified file
+    # is never mistaken for the original.
+
+    # Maximum number of keys held in memory.
+    MAX_ENTRIES = 100000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+        self._inflight = {}
+
+    @property
+    def _persistent(self):
+        # Path to a file persisting the cache, if any.
+        path = os.environ.get("PUSHSOURCE_RPM_KEY_CACHE")
+        return DiskCache.shared(path, max_entries=self.MAX_ENTRIES) if path else None
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+    def get(self, path):
+        # Returns the signing key ID of the RPM at path, or None if unsigned.
+        try:
+            st = os.stat(path)
+        except OSError:
+            # Can't identify the file, let the header read raise a
+            # meaningful error (or succeed) as usual.
+            return self._read(path)
+
+        ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            if ident in self._keys:
+                self._keys.move_to_end(ident)
+                return self._keys[ident]
+
+            inflight = self._inflight.get(ident)
+            if inflight is None:
+                inflight = Future()
+                self._inflight[ident] = inflight
+                claimed = True
+            else:
+                claimed = False
+
+        if not claimed:
+            # Someone else is already reading this RPM's header.
+            return inflight.result()
+
+        try:
+            key = self._lookup(ident, path)
+        except Exception as ex:
+            with self._lock:
+                del self._inflight[ident]
+            inflight.set_exception(ex)
+            raise
+
+        with self._lock:
+            self._keys[ident] = key
+            if len(self._keys) > self.MAX_ENTRIES:
+                self._keys.popitem(last=False)
+            del self._inflight[ident]
+        inflight.set_result(key)
+
+        return key
+
+    def _lookup(self, ident, path):
+        persistent = self._persistent
+        persistent_key = "rpm-key:%s:%s:%s:%s" % ident
+
+        if persistent:
+            # Unsigned RPMs are stored as "" since None means a miss.
+            key = persistent.get(persistent_key)
+            if key is not None:
+                return key or None
+
+        key = self._read(path)
+
+        if persistent:
+            persistent.put(persistent_key, key or "")
+
+        return key
+
+    def _read(self, path):
+        try:
+            return read_signing_key(path)
+        except Exception:  # pylint: disable=broad-except
+            # Let rpmlib have the final say on anything we couldn't handle.
+            LOG.debug("Can't read signature header of %s", path, exc_info=True)
+
+        LOG.debug("Reading RPM header of %s", path)
+        header = rpmlib.get_rpm_header(path)
+        return rpmlib.get_keys_from_header(header)
+
+
+SIGNING_KEYS = SigningKeyCache()
+
+
+def get_signing_key(path):
+    """Returns the ID of the key used to sign the RPM at path, or None
+    if the RPM is unsigned.
+
+    Results are cached, so the header of a given RPM is only parsed once.
+    """
+    return SIGNING_KEYS.get(path)
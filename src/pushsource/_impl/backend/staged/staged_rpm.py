@@ -1,16 +1,7 @@
 import logging
 
-try:
-    from kobo import rpmlib
-except Exception as ex:  # pragma: no cover, pylint: disable=broad-except
-    # If kobo.rpmlib is unavailable, let's not immediately crash.
-    # We will hold this exception and re-raise it only if there's an
-    # attempt to use the related functionality.
-    from .. import broken_rpmlib as rpmlib
-
-    rpmlib.CAUSE = ex
-
 from ...model import RpmPushItem
+from ..rpm_keys import get_signing_key
 from .staged_base import StagedBaseMixin, handles_type
 
 LOG = logging.getLogger("pushsource")
@@ -27,8 +18,7 @@ class StagedRpmMixin(StagedBaseMixin):
             LOG.warning("Unexpected non-RPM %s (ignored)", entry.path)
             return None
 
-        header = rpmlib.get_rpm_header(entry.path)
-        key_id = rpmlib.get_keys_from_header(header)
+        key_id = get_signing_key(entry.path)
 
         return RpmPushItem(
             name=entry.name,
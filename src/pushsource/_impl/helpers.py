@@ -1,7 +1,7 @@
 import os
 import logging
 import time
-from concurrent.futures import wait, FIRST_COMPLETED
+from queue import Queue, Empty
 
 from urllib.parse import urlparse, ParseResult
 
@@ -117,7 +117,7 @@ def as_completed_with_timeout_reset(futures, timeout):
     """
     Yields any finished future within time alloted by timeout, raises TimeoutError otherwise.
     Futures are allowed to continue over timeout, if any processing in caller is slow.
-    Timeout is not applied to futures themselves but rather to wait() call, which means
+    Timeout is not applied to futures themselves but rather to waiting for the next one, which means
     that this function allows to yield all quicker futures and tries to wait for slow ones.
 
     Parameters:
@@ -125,28 +125,32 @@ def as_completed_with_timeout_reset(futures, timeout):
             list of futures
 
         timeout: int or float
-            Timeout used for wait() calls
+            Timeout used for waiting on the next finished future
 
     Returns:
         Future
             finished Future object
 
     Throws:
-        TimeoutError, if waiting for some Future to finish in wait() call takes more
+        TimeoutError, if waiting for some Future to finish takes more
         time than given timeout.
     """
     total_futures = len(futures)
-    pending = futures
-    while pending:
-        finished, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
-        # no future finished in timeout given, raise TimeoutError
-        if not finished:
-            raise TimeoutError(
-                "%d (of %d) futures unfinished" % (len(pending), total_futures)
-            )
 
-        for fs in finished:
-            yield fs
+    # Futures are collected via callbacks as they finish, so that waiting
+    # doesn't repeatedly scan every pending future.
+    finished = Queue()
+    for fs in futures:
+        fs.add_done_callback(finished.put)
+
+    for pending in range(total_futures, 0, -1):
+        try:
+            yield finished.get(timeout=timeout)
+        except Empty:
+            # no future finished in timeout given, raise TimeoutError
+            raise TimeoutError(
+                "%d (of %d) futures unfinished" % (pending, total_futures)
+            ) from None
 
 
 def wait_exist(path, timeout, poll_rate):
@@ -241,7 +241,13 @@ class PushItem(object):
 
         LOG.debug("Start read: %s", self.src)
 
-        with open(self.src, "rb") as src_file:
+        # Content is read via the opener where there is one, as the file might
+        # not be locally accessible.
+        if self.opener:
+            src_file = self.opener(self)
+        else:
+            src_file = open(self.src, "rb")  # pylint: disable=consider-using-with
+        with src_file:
             while True:
                 chunk = src_file.read(CHUNKSIZE)
                 if not chunk:
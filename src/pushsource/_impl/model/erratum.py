@@ -174,7 +174,7 @@ class ErratumPackageCollection(object):
             # parse the odd 'sum' structure, which is a list of form:
             # [<algo>, <hexdigest>, <algo>, <hexdigest>, ...]
             sums = {}
-            raw_sum = raw_pkg.pop("sum", [])
+            raw_sum = raw_pkg.get("sum") or []
             while raw_sum:
                 sums[raw_sum[0]] = raw_sum[1]
                 raw_sum = raw_sum[2:]
@@ -1,3 +1,4 @@
+import asyncio
 import inspect
 import functools
 import logging
@@ -13,6 +14,7 @@ else:
     from importlib_metadata import entry_points
 
 from pushsource._impl.helpers import wait_exist
+from pushsource._impl.utils.openers import open_src_local
 
 LOG = logging.getLogger("pushsource")
 
@@ -23,6 +25,31 @@ class SourceUrlError(ValueError):
     """
 
 
+async def _iterate_in_executor(loop, iterator):
+    # Yields from a blocking iterator, advancing it from the default executor.
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        # If iteration stopped early, a generator's cleanup runs now rather
+        # than whenever it's garbage collected.
+        close = getattr(iterator, "close", None)
+        if close:
+            await loop.run_in_executor(None, close)
+
+
+def _local_src(item):
+    # Returns True if item references a file expected on the local filesystem.
+    if not getattr(item, "src", None) or not item.src.startswith("/"):
+        return False
+    # Items with a custom opener (e.g. over HTTP) don't use the local file.
+    return getattr(item, "opener", None) in (None, open_src_local)
+
+
 class SourceWrapper(object):
     # Internal class to ensure that all source instances support enter/exit
     # for with statements even if underlying instance doesn't implement it
@@ -65,11 +92,43 @@ class SourceWrapper(object):
 
         generator = self.__delegate.__iter__()
         for item in generator:
-            if not hasattr(item, "src") or not item.src or not item.src.startswith("/"):
-                yield item
-            else:
+            if _local_src(item):
                 wait_exist(item.src, timeout, poll_rate)
+            yield item
+
+    async def __aiter__(self):
+        """
+        As ``__iter__``, for use with ``async for``.
+
+        If the underlying source supports ``async for``, it's used directly.
+        Otherwise, the source is iterated from the event loop's default
+        executor so the event loop is not blocked.
+
+        Yields:
+            PushItem:
+                Created push item.
+        """
+        timeout = int(os.getenv("PUSHSOURCE_SRC_POLL_TIMEOUT") or "0")
+        poll_rate = int(os.getenv("PUSHSOURCE_SRC_POLL_RATE") or "30")
+        loop = asyncio.get_event_loop()
+
+        if hasattr(self.__delegate, "__aiter__"):
+            generator = self.__delegate.__aiter__()
+        else:
+            generator = _iterate_in_executor(loop, self.__delegate.__iter__())
+
+        try:
+            async for item in generator:
+                if _local_src(item):
+                    await loop.run_in_executor(
+                        None, wait_exist, item.src, timeout, poll_rate
+                    )
                 yield item
+        finally:
+            # Ensure the delegate is closed if the consumer stops early.
+            aclose = getattr(generator, "aclose", None)
+            if aclose:
+                await aclose()
 
     def __enter__(self):
         if hasattr(self.__delegate, "__enter__"):
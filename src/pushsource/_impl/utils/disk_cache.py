@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+LOG = logging.getLogger("pushsource")
+
+# Sentinel for "use the cache's default TTL".
+DEFAULT_TTL = object()
+
+# How many writes between checks of the cache's size.
+EVICT_INTERVAL = 100
+
+# How many seconds an entry's access time may lag behind before being updated
+# on read. Reads within this interval don't write to the database at all.
+ACCESS_INTERVAL = 60 * 60
+
+INSTANCES = {}
+INSTANCES_LOCK = threading.Lock()
+
+
+class DiskCache(object):
+    # A persistent key/value store backed by an SQLite database.
+    #
+    # Values must be JSON-serializable. Each entry may have an expiry time;
+    # entries without one are retained until evicted due to the size limit,
+    # in which case least recently accessed entries are dropped first.
+    #
+    # An instance may be used from multiple threads, and the same database
+    # may be used from multiple processes at once.
+    #
+    # The cache is an optimization only: any errors from the database are
+    # logged and otherwise treated as a cache miss.
+
+    def __init__(self, path, ttl=None, max_entries=None, timeout=30):
+        self._path = path
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._timeout = timeout
+        self._tls = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        self._run(self._init_db)
+
+    @classmethod
+    def shared(cls, path, **kwargs):
+        # Returns a shared instance for the given path and settings.
+        #
+        # Users of the same path with different settings get separate
+        # instances, each applying its own settings to the same database.
+        path = os.path.abspath(path)
+        key = (path, tuple(sorted(kwargs.items())))
+        with INSTANCES_LOCK:
+            if key not in INSTANCES:
+                INSTANCES[key] = cls(path, **kwargs)
+            return INSTANCES[key]
+
+    @property
+    def _conn(self):
+        # A connection to the database.
+        # sqlite connections can't be shared between threads, nor used in
+        # a forked child process, so one is created per thread & process.
+        pid = os.getpid()
+        if getattr(self._tls, "pid", None) != pid:
+            conn = sqlite3.connect(
+                self._path, timeout=self._timeout, isolation_level=None
+            )
+            # In WAL mode, this remains safe against corruption while avoiding
+            # a sync on every write. This setting applies per connection.
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._tls.conn = conn
+            self._tls.pid = pid
+        return self._tls.conn
+
+    def _init_db(self, conn):
+        # WAL allows readers to proceed while another process is writing.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires REAL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _run(self, fn, *args):
+        try:
+            return fn(self._conn, *args)
+        except sqlite3.Error:
+            LOG.warning("Error using cache at %s", self._path, exc_info=True)
+            return None
+
+    def _do_get(self, conn, key):
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires, accessed FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, expires, accessed = row
+        if expires is not None and expires < now:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires < ?", (key, now))
+            return None
+
+        # Access times are only needed roughly, for eviction, so most reads
+        # avoid a write transaction (contending with other processes).
+        if accessed < now - ACCESS_INTERVAL:
+            conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def _do_put(self, conn, key, value, expires):
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires, accessed) "
+            "VALUES (?, ?, ?, ?)",
+            (key, value, expires, time.time()),
+        )
+
+    def _do_evict(self, conn):
+        conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        if self._max_entries is None:
+            return
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        excess = count - self._max_entries
+        if excess > 0:
+            LOG.debug("Evicting %s entries from cache %s", excess, self._path)
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (excess,),
+            )
+
+    def get(self, key):
+        # Returns the value stored under key, or None if not present.
+        return self._run(self._do_get, key)
+
+    def put(self, key, value, ttl=DEFAULT_TTL):
+        # Stores value under key.
+        # ttl is the number of seconds the value remains valid, or None
+        # for no expiry. If omitted, the cache's default TTL is used.
+        if ttl is DEFAULT_TTL:
+            ttl = self._ttl
+
+        try:
+            encoded = json.dumps(value)
+        except (TypeError, ValueError):
+            LOG.debug("Not caching unserializable value for %s", key)
+            return
+
+        expires = None if ttl is None else time.time() + ttl
+        self._run(self._do_put, key, encoded, expires)
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_INTERVAL == 0
+        if evict:
+            self._run(self._do_evict)
@@ -0,0 +1,290 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .disk_cache import DiskCache
+
+LOG = logging.getLogger("pushsource")
+
+CHUNKSIZE = 1024 * 1024
+
+
+class HttpOpener(object):
+    # An opener for push items whose 'src' is a path under 'topdir', where
+    # the same content is also served over HTTP from 'topurl'.
+    #
+    # Content is downloaded to a local file before being read. Large files are
+    # downloaded as several ranges in parallel, if the server supports it.
+    #
+    # If cache_dir is provided, downloaded content is retained there, named by
+    # its sha256sum, so that each file is only downloaded once.
+    #
+    # Content is verified against checksums where known: from the push item
+    # itself, or provided to the opener via add_checksum.
+    #
+    # Connections are kept alive between requests. close() releases them, along
+    # with the threads used for ranged downloads; the opener can still be used
+    # afterward, in which case new connections and threads are created.
+
+    # Files at least this large are downloaded via parallel ranges.
+    RANGE_THRESHOLD = 32 * 1024 * 1024
+    # Size of each range.
+    RANGE_SIZE = 8 * 1024 * 1024
+    # Timeouts, in seconds, for connecting and for reading each response.
+    CONNECT_TIMEOUT = float(
+        os.environ.get("PUSHSOURCE_KOJI_HTTP_CONNECT_TIMEOUT", "30")
+    )
+    READ_TIMEOUT = float(os.environ.get("PUSHSOURCE_KOJI_HTTP_READ_TIMEOUT", "300"))
+
+    def __init__(self, topdir, topurl, cache_dir=None, threads=4):
+        self._topdir = topdir.rstrip("/") + "/"
+        self._topurl = topurl.rstrip("/") + "/"
+        self._cache_dir = cache_dir
+        self._threads = threads
+        self._tls = threading.local()
+        self._lock = threading.Lock()
+        # path => {algorithm: checksum}
+        self._checksums = {}
+        # All sessions created by any thread, so they can be closed
+        self._sessions = []
+        self._executor = None
+
+    def __eq__(self, other):
+        # Openers are equal if they'd produce the same content for an item,
+        # so that otherwise-identical push items compare equal.
+        return isinstance(other, HttpOpener) and (self._topdir, self._topurl) == (
+            other._topdir,
+            other._topurl,
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self._topdir, self._topurl))
+
+    def __repr__(self):
+        return "HttpOpener(%r, %r)" % (self._topdir, self._topurl)
+
+    @property
+    def _timeout(self):
+        return (self.CONNECT_TIMEOUT, self.READ_TIMEOUT)
+
+    @property
+    def _session(self):
+        # requests sessions aren't thread-safe, so one is used per thread.
+        tls = self._tls
+        if not hasattr(tls, "session"):
+            tls.session = requests.Session()
+            with self._lock:
+                self._sessions.append(tls.session)
+        return tls.session
+
+    @property
+    def _range_executor(self):
+        # Executor for ranged downloads, shared by all files.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._threads, thread_name_prefix="pushsource-http"
+                )
+            return self._executor
+
+    def close(self):
+        # Closes all connections and stops threads used by the opener.
+        with self._lock:
+            sessions = self._sessions
+            executor = self._executor
+            self._sessions = []
+            self._executor = None
+            # Threads will create new sessions if the opener is used again.
+            self._tls = threading.local()
+
+        if executor:
+            executor.shutdown(wait=True)
+        for session in sessions:
+            session.close()
+
+    @property
+    def _index(self):
+        # Maps URLs to the sha256sum of their content.
+        return DiskCache.shared(os.path.join(self._cache_dir, "index.db"))
+
+    def url(self, path):
+        # Returns the URL serving the file at path.
+        if not path.startswith(self._topdir):
+            raise ValueError("%s is not located under %s" % (path, self._topdir))
+        return self._topurl + path[len(self._topdir) :]
+
+    def add_checksum(self, path, algorithm, checksum):
+        # Records the expected checksum of the file at path.
+        with self._lock:
+            self._checksums.setdefault(path, {})[algorithm] = checksum
+
+    def exists(self, path):
+        # Returns True if the file at path is available.
+        response = self._session.head(
+            self.url(path), allow_redirects=True, timeout=self._timeout
+        )
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def read_head(self, path, reader):
+        # Calls reader(f, url) with a stream of the content of the file at path,
+        # which should read only as much of the file as it needs.
+        url = self.url(path)
+        with self._session.get(url, stream=True, timeout=self._timeout) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            return reader(response.raw, url)
+
+    def __call__(self, item):
+        # Some backends fill in checksums of other types as md5sum, so
+        # checksums are only used if they're the expected length.
+        checksums = {}
+        if len(getattr(item, "sha256sum", None) or "") == 64:
+            checksums["sha256"] = item.sha256sum
+        if len(getattr(item, "md5sum", None) or "") == 32:
+            checksums["md5"] = item.md5sum
+        return self.open(item.src, checksums)
+
+    def _cache_path(self, sha256sum):
+        return os.path.join(self._cache_dir, "sha256", sha256sum[:2], sha256sum)
+
+    def _cached(self, url, checksums):
+        # Returns the path to cached content of url, if any.
+        sha256sum = checksums.get("sha256") or self._index.get(url)
+        if sha256sum:
+            path = self._cache_path(sha256sum)
+            if os.path.exists(path):
+                LOG.debug("Using cached content of %s: %s", url, path)
+                return path
+        return None
+
+    def open(self, path, checksums=None):
+        # Returns a file object for reading the content of the file at path.
+        # Content is verified against the given checksums, along with any
+        # recorded via add_checksum.
+        with self._lock:
+            expected = dict(self._checksums.get(path) or {})
+        expected.update(checksums or {})
+        checksums = expected
+        url = self.url(path)
+
+        if self._cache_dir:
+            cached = self._cached(url, checksums)
+            if cached:
+                return open(cached, "rb")
+            tmpdir = os.path.join(self._cache_dir, "tmp")
+            os.makedirs(tmpdir, exist_ok=True)
+            f = tempfile.NamedTemporaryFile(  # pylint: disable=consider-using-with
+                dir=tmpdir, delete=False
+            )
+        else:
+            f = tempfile.TemporaryFile()
+
+        try:
+            self._download(url, f)
+            sha256sum = self._verify(url, f, checksums)
+        except Exception:
+            f.close()
+            if self._cache_dir:
+                os.unlink(f.name)
+            raise
+
+        if not self._cache_dir:
+            f.seek(0)
+            return f
+
+        f.close()
+        cache_path = self._cache_path(sha256sum)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        os.replace(f.name, cache_path)
+        self._index.put(url, sha256sum, ttl=None)
+        return open(cache_path, "rb")
+
+    def _download(self, url, f):
+        LOG.debug("Downloading %s", url)
+
+        # Check whether the file is large enough to download in ranges, and
+        # whether the server supports that.
+        response = self._session.head(url, allow_redirects=True, timeout=self._timeout)
+        response.raise_for_status()
+        size = int(response.headers.get("Content-Length") or 0)
+        if response.headers.get("Accept-Ranges") == "bytes" and (
+            size >= self.RANGE_THRESHOLD
+        ):
+            self._download_ranges(url, f, size)
+            return
+
+        with self._session.get(url, stream=True, timeout=self._timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(CHUNKSIZE):
+                f.write(chunk)
+            f.flush()
+
+    def _download_ranges(self, url, f, size):
+        ranges = [
+            (start, min(start + self.RANGE_SIZE, size) - 1)
+            for start in range(0, size, self.RANGE_SIZE)
+        ]
+        LOG.debug("Downloading %s in %s ranges", url, len(ranges))
+
+        # Each range is written at its own offset, so they can all be written
+        # concurrently to the same file.
+        f.truncate(size)
+        fd = f.fileno()
+
+        def get_range(byte_range):
+            start, end = byte_range
+            headers = {"Range": "bytes=%s-%s" % (start, end)}
+            with self._session.get(
+                url, headers=headers, stream=True, timeout=self._timeout
+            ) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise IOError("Range request not honored for %s" % url)
+                offset = start
+                for chunk in response.iter_content(CHUNKSIZE):
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+            if offset != end + 1:
+                raise IOError(
+                    "Incomplete range %s-%s of %s (got %s bytes)"
+                    % (start, end, url, offset - start)
+                )
+
+        # list() so that any exception is raised.
+        list(self._range_executor.map(get_range, ranges))
+
+    def _verify(self, url, f, checksums):
+        # Verifies the downloaded content in f, returning its sha256sum.
+        hashers = {"sha256": hashlib.sha256()}
+        for algorithm in checksums:
+            if algorithm not in hashers:
+                hashers[algorithm] = hashlib.new(algorithm)
+
+        f.seek(0)
+        while True:
+            chunk = f.read(CHUNKSIZE)
+            if not chunk:
+                break
+            for hasher in hashers.values():
+                hasher.update(chunk)
+
+        for algorithm, expected in checksums.items():
+            actual = hashers[algorithm].hexdigest()
+            if actual != expected:
+                raise ValueError(
+                    "%s checksum mismatch for %s: expected %s, got %s"
+                    % (algorithm, url, expected, actual)
+                )
+
+        return hashers["sha256"].hexdigest()
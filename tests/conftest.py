@@ -5,6 +5,8 @@ from mock import patch
 import json
 
 from pushsource import Source
+from pushsource._impl.backend import rpm_keys, koji_sessions, modulemd
+from pushsource._impl.backend.errata_source import errata_sessions, errata_kerberos
 from .errata.fake_errata_tool import FakeErrataToolController
 from .koji.fake_koji import FakeKojiController
 from pushsource._impl.model import (
@@ -141,3 +143,43 @@ def clean_backends():
     backends = copy.deepcopy(Source._BACKENDS)
     yield
     Source._BACKENDS = backends
+
+
+@fixture(autouse=True)
+def clean_signing_keys():
+    """Ensure RPM signing keys cached by one test can't be seen by others."""
+    rpm_keys.SIGNING_KEYS.clear()
+    yield
+    rpm_keys.SIGNING_KEYS.clear()
+
+
+@fixture(autouse=True)
+def clean_koji_sessions():
+    """Ensure koji sessions (possibly fake) can't be reused across tests."""
+    koji_sessions.SESSION_POOL.clear()
+    yield
+    koji_sessions.SESSION_POOL.clear()
+
+
+@fixture(autouse=True)
+def clean_errata_sessions():
+    """Ensure Errata Tool sessions (possibly fake) can't be reused across tests."""
+    errata_sessions.SESSION_POOL.clear()
+    yield
+    errata_sessions.SESSION_POOL.clear()
+
+
+@fixture(autouse=True)
+def clean_errata_credentials():
+    """Ensure Kerberos credentials (possibly fake) can't be reused across tests."""
+    errata_kerberos.CREDENTIALS.clear()
+    yield
+    errata_kerberos.CREDENTIALS.clear()
+
+
+@fixture(autouse=True)
+def clean_modules():
+    """Ensure modulemd files cached by one test can't be seen by others."""
+    modulemd.MODULES.clear()
+    yield
+    modulemd.MODULES.clear()
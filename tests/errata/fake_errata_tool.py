@@ -94,6 +94,9 @@ class FakeErrataToolProxy(object):
     def get_ftp_paths(self, advisory_id):
         return self._get_data(advisory_id, "ftp_paths")
 
+    def close(self):
+        pass
+
     def get(self, url, *args, **kwargs):
         response_object = Mock(spec=requests.models.Response)
         for path_regex, func in self.url_map:
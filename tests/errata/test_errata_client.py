@@ -1,6 +1,7 @@
 import mock
 import logging
 import subprocess
+import time
 
 import requests_mock
 import pytest
@@ -11,6 +12,10 @@ from pushsource._impl.backend.errata_source.errata_client import (
     ErrataHTTPClient,
     get_errata_client,
 )
+from pushsource._impl.backend.errata_source.errata_sessions import ErrataSessionPool
+
+ET_URL = "https://errata.example.com/"
+CCACHE = "/temp/ccache_pushsource_errata_1234"
 
 
 @pytest.fixture(autouse=True)
@@ -41,17 +46,12 @@ def test_init_env_vars():
 @mock.patch("gssapi.Credentials.acquire")
 @mock.patch("requests.Session")
 @mock.patch("requests_gssapi.HTTPSPNEGOAuth")
-def test_get_session(
-    mock_auth, mock_session, mock_acquire, mock_name, mock_adapter, caplog
-):
-    caplog.set_level(logging.DEBUG)
-
+def test_new_session(mock_auth, mock_session, mock_acquire, mock_name, mock_adapter):
     client = ErrataHTTPClient(
         1, "https://errata.example.com/", "/path/to/keytab", "pub-errata@IPA.REDHAT.COM"
     )
-    assert not hasattr(client._tls, "session")
 
-    session = client._errata_service
+    session = client._new_session()
 
     mock_name.assert_called_once()
     mock_acquire.assert_called_once_with(
@@ -65,36 +65,105 @@ def test_get_session(
     assert session.mount.call_count == 2
 
     assert session == mock_session.return_value
-    assert client._tls.session == mock_session.return_value
 
-    assert caplog.messages == [
-        "Creating HTTP client for Errata Tool: " "https://errata.example.com/"
+
+def test_session_reused(caplog):
+    caplog.set_level(logging.DEBUG)
+
+    # Sessions are shared between clients using the same URL and principal
+    clients = [
+        ErrataHTTPClient(
+            1,
+            "https://errata.example.com/",
+            "/path/to/keytab",
+            "pub-errata@IPA.REDHAT.COM",
+        )
+        for _ in range(2)
     ]
+    with requests_mock.Mocker() as m:
+        m.get(
+            "https://errata.example.com/api/v1/erratum/RHSA-123456789",
+            json={"errata": "data"},
+        )
 
+        for client in clients:
+            assert client.get_advisory_data("RHSA-123456789") == {"errata": "data"}
 
-@mock.patch("gssapi.Name")
-@mock.patch("gssapi.Credentials.acquire")
-@mock.patch("requests.Session")
-@mock.patch("requests_gssapi.HTTPSPNEGOAuth")
-def test_get_session_already_exists(
-    mock_auth, mock_session, mock_acquire, mock_name, caplog
-):
-    caplog.set_level(logging.DEBUG)
+    assert [msg for msg in caplog.messages if "Creating" in msg] == [
+        "Creating HTTP client for Errata Tool: https://errata.example.com/"
+    ]
 
-    client = ErrataHTTPClient(
-        1, "https://errata.example.com/", "/path/to/keytab", "pub-errata@IPA.REDHAT.COM"
-    )
-    assert not hasattr(client._tls, "session")
-    session_mock = client._tls.session = mock.MagicMock()
-    session = client._errata_service
 
-    mock_name.assert_not_called()
-    mock_acquire.assert_not_called()
-    mock_session.assert_not_called()
-    mock_auth.assert_not_called()
+def test_session_keepalive(monkeypatch):
+    pool = ErrataSessionPool(max_idle=2, keepalive=60)
+    factory = mock.Mock(side_effect=lambda: mock.Mock(spec=requests.Session))
+
+    with pool.session(ET_URL, "user", CCACHE, factory) as session1:
+        pass
+    with pool.session(ET_URL, "user", CCACHE, factory) as session2:
+        pass
+
+    # Idle session was reused
+    assert session1 is session2
+    assert factory.call_count == 1
+
+    # Once idle for longer than keepalive, session is closed rather than reused
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 120)
+    with pool.session(ET_URL, "user", CCACHE, factory) as session3:
+        pass
+
+    assert session3 is not session1
+    session1.close.assert_called_once_with()
+
+    # Sessions aren't shared between principals
+    with pool.session(ET_URL, "other", CCACHE, factory) as session4:
+        pass
+    assert session4 is not session3
+
+    # Or ccaches
+    with pool.session(ET_URL, "user", "/tmp/other-ccache", factory) as session5:
+        pass
+    assert session5 is not session3
+
+
+def test_session_max_idle():
+    pool = ErrataSessionPool(max_idle=1, keepalive=60)
+    factory = mock.Mock(side_effect=lambda: mock.Mock(spec=requests.Session))
+
+    with pool.session(ET_URL, "user", CCACHE, factory) as session1:
+        with pool.session(ET_URL, "user", CCACHE, factory) as session2:
+            pass
+
+    # Only one session was retained, the other was closed
+    session1.close.assert_called_once_with()
+    session2.close.assert_not_called()
+
+    with pool.session(ET_URL, "user", CCACHE, factory) as session3:
+        pass
+    assert session3 is session2
+
+
+def test_session_discarded_on_error():
+    pool = ErrataSessionPool(max_idle=2, keepalive=60)
+    factory = mock.Mock(side_effect=lambda: mock.Mock(spec=requests.Session))
+
+    # Error responses don't prevent reuse...
+    with pytest.raises(requests.HTTPError):
+        with pool.session(ET_URL, "user", CCACHE, factory) as session1:
+            raise requests.HTTPError()
+    with pool.session(ET_URL, "user", CCACHE, factory) as session2:
+        pass
+    assert session1 is session2
 
-    assert session == session_mock
-    assert caplog.messages == []
+    # ...but other errors do
+    with pytest.raises(requests.ConnectionError):
+        with pool.session(ET_URL, "user", CCACHE, factory) as session3:
+            raise requests.ConnectionError()
+    with pool.session(ET_URL, "user", CCACHE, factory) as session4:
+        pass
+    assert session3 is not session4
+    session3.close.assert_called_once_with()
 
 
 def test_get_advisory_data(caplog):
@@ -103,7 +172,6 @@ def test_get_advisory_data(caplog):
     client = ErrataHTTPClient(
         1, "https://errata.example.com/", "/path/to/keytab", "pub-errata@IPA.REDHAT.COM"
     )
-    client._tls.session = requests.Session()
     with requests_mock.Mocker() as m:
         m.get(
             "https://errata.example.com/api/v1/erratum/RHSA-123456789",
@@ -116,6 +184,7 @@ def test_get_advisory_data(caplog):
     assert m.call_count == 1
     assert caplog.messages == [
         "Calling Errata Tool /api/v1/erratum/{id}(RHSA-123456789)",
+        "Creating HTTP client for Errata Tool: https://errata.example.com/",
         "GET https://errata.example.com/api/v1/erratum/RHSA-123456789 200",
         "Errata Tool completed call /api/v1/erratum/{id}(RHSA-123456789)",
     ]
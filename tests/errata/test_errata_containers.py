@@ -1,10 +1,15 @@
 import os
+import threading
+from functools import partial
 from mock import patch
 import json
 
 import pytest
 
 from pushsource import Source, ContainerImagePushItem, OperatorManifestPushItem
+from pushsource._impl.backend.errata_source.errata_client import get_errata_client
+
+from .fake_errata_tool import FakeErrataToolProxy
 
 
 @pytest.fixture(autouse=True)
@@ -192,3 +197,95 @@ def test_errata_containers_multi_sig_key(source_factory, fake_koji):
         "(199e2f91fd431d51, 222e2f91fd431d51) on build "
         "cluster-logging-operator-metadata-container-v4.3.28.202006290519.p0.prod-1"
     ) in str(exc_info)
+
+
+def test_errata_containers_stream(source_factory):
+    """Errata source in stream mode yields the same container items."""
+
+    expected = list(source_factory(errata="RHBA-2020:2807"))
+    items = list(source_factory(errata="RHBA-2020:2807", stream=True))
+
+    assert [i for i in expected if isinstance(i, ContainerImagePushItem)]
+
+    assert sorted(items, key=repr) == sorted(expected, key=repr)
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+@patch("subprocess.run")
+def test_errata_containers_prefetch_advisory_data(
+    mock_run, source_factory, fake_koji, prefetch
+):
+    """Errata source fetches advisory data concurrently with other ET queries
+    when prefetch is enabled."""
+
+    mock_run.return_value.stdout = "Default principal: pub-errata@IPA.REDHAT.COM\n"
+    mock_run.return_value.returncode = 0
+
+    source = source_factory(
+        errata="RHBA-2020:2807",
+        keytab_path="/path/to/keytab",
+        principal="pub-errata@IPA.REDHAT.COM",
+        prefetch=prefetch,
+    )
+
+    threads = []
+    get_advisory_data = FakeErrataToolProxy.get_advisory_data
+
+    def spy(self, advisory_id):
+        threads.append(threading.current_thread().name)
+        return get_advisory_data(self, advisory_id)
+
+    with patch.object(FakeErrataToolProxy, "get_advisory_data", spy):
+        items = [i for i in source if isinstance(i, ContainerImagePushItem)]
+
+    # It should have obtained the product name from ET either way
+    assert items
+    assert all(i.product_name == "Red Hat OpenShift Enterprise" for i in items)
+
+    # Advisory data was requested once, either by the ET client alongside
+    # other queries, or only afterward while processing the advisory
+    assert len(threads) == 1
+    assert ("pushsource-errata-client" in threads[0]) == prefetch
+
+
+@patch("subprocess.run")
+def test_errata_containers_prefetch_advisory_data_error(
+    mock_run, source_factory, fake_koji
+):
+    """Errors prefetching advisory data don't fail the advisory; the data is
+    fetched again when needed."""
+
+    mock_run.return_value.stdout = "Default principal: pub-errata@IPA.REDHAT.COM\n"
+    mock_run.return_value.returncode = 0
+
+    # Disable retry so that the prefetch fails, rather than being retried
+    with patch(
+        "pushsource._impl.backend.errata_source.errata_source.get_errata_client",
+        partial(get_errata_client, max_attempts=1),
+    ):
+        source = source_factory(
+            errata="RHBA-2020:2807",
+            keytab_path="/path/to/keytab",
+            principal="pub-errata@IPA.REDHAT.COM",
+            prefetch=True,
+        )
+
+    threads = []
+    get_advisory_data = FakeErrataToolProxy.get_advisory_data
+
+    def flaky(self, advisory_id):
+        threads.append(threading.current_thread().name)
+        if len(threads) == 1:
+            raise RuntimeError("simulated error")
+        return get_advisory_data(self, advisory_id)
+
+    with patch.object(FakeErrataToolProxy, "get_advisory_data", flaky):
+        items = [i for i in source if isinstance(i, ContainerImagePushItem)]
+
+    assert items
+    assert all(i.product_name == "Red Hat OpenShift Enterprise" for i in items)
+
+    # Prefetch failed, then the data was requested again while processing
+    assert len(threads) == 2
+    assert "pushsource-errata-client" in threads[0]
+    assert "pushsource-errata-client" not in threads[1]
@@ -1,6 +1,11 @@
+import threading
+from concurrent import futures
+
+from mock import patch
 from pytest import raises
 
 from pushsource import Source, ErratumPushItem, ErratumReference, RpmPushItem
+from pushsource._impl.backend.errata_source import ErrataSource
 
 
 def test_errata_files_needs_koji_url(fake_errata_tool):
@@ -44,3 +49,29 @@ def test_errata_missing_koji_rpms(fake_errata_tool):
         "Advisory refers to sudo-1.8.25p1-4.el8_0.3.x86_64.rpm but RPM was not found in koji"
         in str(exc.value)
     )
+
+
+def test_errata_stream_timeout(fake_errata_tool):
+    """Errata source in stream mode raises if no push items are produced
+    within the timeout."""
+
+    release = threading.Event()
+
+    def stuck(self, raw):
+        release.wait()
+        return iter([])
+
+    source = Source.get(
+        "errata:https://errata.example.com?errata=RHEA-2020:0346",
+        stream=True,
+        timeout=0.1,
+    )
+    with patch.object(ErrataSource, "_stream_push_items_from_raw", stuck):
+        try:
+            with raises(futures.TimeoutError) as exc_info:
+                list(source)
+        finally:
+            release.set()
+
+    assert "No push items produced in 0.1 seconds" in str(exc_info.value)
+    assert exc_info.value.__suppress_context__
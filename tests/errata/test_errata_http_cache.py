@@ -0,0 +1,193 @@
+import mock
+
+import requests_mock
+import pytest
+import requests
+
+from pushsource._impl.backend.errata_source.errata_client import (
+    ErrataHTTPClient,
+    get_errata_client,
+)
+
+ERRATUM_URL = "https://errata.example.com/api/v1/erratum/RHBA-2020:2807"
+FILE_LIST_URL = (
+    "https://errata.example.com/api/v1/push_metadata/cdn_file_list/RHBA-2020:2807.json"
+)
+
+
+@pytest.fixture(autouse=True)
+def fake_temporary_file(mocker):
+    mock_file = mocker.patch("tempfile.NamedTemporaryFile")
+    mock_file.return_value.__enter__.return_value.name = (
+        "/temp/ccache_pushsource_errata_1234"
+    )
+
+
+@pytest.fixture
+def client(tmpdir):
+    return ErrataHTTPClient(
+        1,
+        "https://errata.example.com/",
+        "/path/to/keytab",
+        "pub-errata@IPA.REDHAT.COM",
+        http_cache=str(tmpdir.join("et-cache.db")),
+    )
+
+
+def erratum(status):
+    return {"errata": {"rhba": {"fulladvisory": "RHBA-2020:2807-01", "status": status}}}
+
+
+@mock.patch.dict(
+    "os.environ",
+    {
+        "PUSHSOURCE_ERRATA_KEYTAB_PATH": "/path/to/keytab",
+        "PUSHSOURCE_ERRATA_PRINCIPAL": "pub-errata@IPA.REDHAT.COM",
+    },
+)
+def test_http_cache_env_var(tmpdir):
+    """HTTP cache can be enabled via environment variable."""
+    path = str(tmpdir.join("et-cache.db"))
+    with mock.patch.dict("os.environ", {"PUSHSOURCE_ERRATA_HTTP_CACHE": path}):
+        client = get_errata_client(1, "https://errata.example.com/")
+
+    assert client._http_cache
+    assert tmpdir.join("et-cache.db").check()
+
+
+def test_http_cache_conditional_requests(client):
+    """Cached responses are revalidated using conditional requests."""
+
+    with requests_mock.Mocker() as m:
+        m.get(FILE_LIST_URL, json={"rpms": ["a"]}, headers={"ETag": '"v1"'})
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["a"]}
+        assert "If-None-Match" not in m.last_request.headers
+
+        # Unchanged response is served from the cache.
+        m.get(FILE_LIST_URL, status_code=304)
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["a"]}
+        assert m.last_request.headers["If-None-Match"] == '"v1"'
+
+        # Changed response replaces the cached one.
+        m.get(FILE_LIST_URL, json={"rpms": ["b"]}, headers={"ETag": '"v2"'})
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["b"]}
+        assert m.last_request.headers["If-None-Match"] == '"v1"'
+
+        m.get(FILE_LIST_URL, status_code=304)
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["b"]}
+        assert m.last_request.headers["If-None-Match"] == '"v2"'
+
+    assert m.call_count == 4
+
+
+def test_http_cache_last_modified(client):
+    """Last-Modified is used for revalidation if there's no ETag."""
+
+    modified = "Wed, 08 Jul 2020 22:20:59 GMT"
+    with requests_mock.Mocker() as m:
+        m.get(FILE_LIST_URL, json={"rpms": ["a"]}, headers={"Last-Modified": modified})
+        client._get_advisory_cdn_file_list("RHBA-2020:2807")
+
+        m.get(FILE_LIST_URL, status_code=304)
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["a"]}
+        assert m.last_request.headers["If-Modified-Since"] == modified
+
+
+def test_http_cache_shipped_immutable(client):
+    """Responses for shipped advisories are reused without revalidation."""
+
+    with requests_mock.Mocker() as m:
+        m.get(FILE_LIST_URL, json={"rpms": ["a"]}, headers={"ETag": '"v1"'})
+        m.get(ERRATUM_URL, json=erratum("SHIPPED_LIVE"))
+
+        # File list fetched before the advisory is known to be shipped.
+        client._get_advisory_cdn_file_list("RHBA-2020:2807")
+        assert client.get_advisory_data("RHBA-2020:2807") == erratum("SHIPPED_LIVE")
+        assert m.call_count == 2
+
+        # The erratum is immutable, so isn't requested again.
+        assert client.get_advisory_data("RHBA-2020:2807") == erratum("SHIPPED_LIVE")
+        assert m.call_count == 2
+
+        # The file list predates knowledge of the advisory's state, so it's
+        # revalidated once, and then immutable.
+        m.get(FILE_LIST_URL, status_code=304)
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["a"]}
+        assert m.call_count == 3
+
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["a"]}
+        assert m.call_count == 3
+
+
+def test_http_cache_unshipped_revalidated(client):
+    """Responses for advisories not yet shipped are always revalidated."""
+
+    with requests_mock.Mocker() as m:
+        m.get(ERRATUM_URL, json=erratum("QE"), headers={"ETag": '"v1"'})
+        client.get_advisory_data("RHBA-2020:2807")
+
+        m.get(ERRATUM_URL, status_code=304)
+        assert client.get_advisory_data("RHBA-2020:2807") == erratum("QE")
+        assert client.get_advisory_data("RHBA-2020:2807") == erratum("QE")
+
+    assert m.call_count == 3
+
+
+def test_http_cache_immutable_policy(client, monkeypatch):
+    """Treating advisories as immutable can be disabled."""
+
+    monkeypatch.setattr(
+        "pushsource._impl.backend.errata_source.errata_client.HTTP_CACHE_IMMUTABLE_STATES",
+        [],
+    )
+
+    with requests_mock.Mocker() as m:
+        m.get(ERRATUM_URL, json=erratum("SHIPPED_LIVE"), headers={"ETag": '"v1"'})
+        client.get_advisory_data("RHBA-2020:2807")
+
+        m.get(ERRATUM_URL, status_code=304)
+        assert client.get_advisory_data("RHBA-2020:2807") == erratum("SHIPPED_LIVE")
+
+    assert m.call_count == 2
+
+
+def test_http_cache_errors_not_cached(client):
+    """Failed requests are not cached."""
+
+    with requests_mock.Mocker() as m:
+        m.get(FILE_LIST_URL, status_code=404, headers={"ETag": '"v1"'})
+        with pytest.raises(requests.HTTPError):
+            client._get_advisory_cdn_file_list("RHBA-2020:2807")
+
+        m.get(FILE_LIST_URL, json={"rpms": ["a"]})
+        assert client._get_advisory_cdn_file_list("RHBA-2020:2807") == {"rpms": ["a"]}
+        assert "If-None-Match" not in m.last_request.headers
+
+
+def test_http_cache_raw_immutable(client):
+    """All responses for a shipped advisory are reused without revalidation."""
+
+    base = "https://errata.example.com/api/v1/push_metadata/"
+    urls = [
+        base + "cdn_metadata/RHBA-2020:2807.json",
+        FILE_LIST_URL,
+        base + "cdn_docker_file_list/RHBA-2020:2807.json",
+        base + "ftp_paths/RHBA-2020:2807.json",
+    ]
+
+    with requests_mock.Mocker() as m:
+        m.get(ERRATUM_URL, json=erratum("SHIPPED_LIVE"))
+        for url in urls:
+            m.get(url, json={"url": url}, headers={"ETag": '"v1"'})
+
+        # The erratum is queried along with the push_metadata APIs, even
+        # though its data wasn't requested.
+        raw = client.get_raw_f("RHBA-2020:2807").result()
+        assert m.call_count == 5
+        assert m.request_history[0].url == ERRATUM_URL
+        assert raw.advisory_cdn_file_list == {"url": FILE_LIST_URL}
+        assert raw.advisory_data == erratum("SHIPPED_LIVE")
+
+        # Everything is served from the cache
+        assert client.get_raw_f("RHBA-2020:2807").result() == raw
+        assert m.call_count == 5
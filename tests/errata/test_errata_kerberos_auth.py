@@ -1,10 +1,14 @@
 import mock
 import logging
 import subprocess
+import threading
 
 import pytest
 
 from pushsource._impl.backend.errata_source.errata_client import ErrataHTTPClient
+from pushsource._impl.backend.errata_source.errata_kerberos import (
+    KerberosCredentialManager,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -125,3 +129,203 @@ def test_authenticate_kinit_failed(mock_run, caplog):
         "for principal pub-errata@IPA.REDHAT.COM",
         "kinit has failed: 'kinit failed'",
     ]
+
+
+@mock.patch("subprocess.run")
+def test_authenticate_shared(mock_run):
+    """Clients using the same principal and keytab share a ccache and TGT."""
+    clients = [
+        ErrataHTTPClient(
+            1,
+            "https://errata.example.com/",
+            "/path/to/keytab",
+            "pub-errata@IPA.REDHAT.COM",
+        )
+        for _ in range(3)
+    ]
+
+    mock_run.return_value.stdout = "Default principal: pub-errata@IPA.REDHAT.COM\n"
+    mock_run.return_value.returncode = 0
+
+    for client in clients:
+        client.authenticate()
+
+    # Only the first client needed to check for a TGT
+    mock_run.assert_called_once()
+
+    # They all use the same ccache
+    assert len(set(client.ccache_filename for client in clients)) == 1
+
+
+@mock.patch("subprocess.run")
+def test_authenticate_retried_after_failure(mock_run):
+    """Authentication is attempted again if kinit previously failed."""
+    client = ErrataHTTPClient(
+        1, "https://errata.example.com/", "/path/to/keytab", "pub-errata@IPA.REDHAT.COM"
+    )
+
+    failed = mock.MagicMock(stdout="kinit failed", returncode=1)
+    mock_run.return_value = failed
+    client.authenticate()
+    assert mock_run.call_count == 2
+
+    ok = mock.MagicMock(stdout="", returncode=0)
+    mock_run.return_value = ok
+    client.authenticate()
+    assert mock_run.call_count == 4
+
+    # Authenticated now, so nothing more to do
+    client.authenticate()
+    assert mock_run.call_count == 4
+
+
+@mock.patch("gssapi.Credentials.acquire")
+def test_credentials_acquired_once(mock_acquire):
+    """gssapi credentials are acquired once per principal and keytab."""
+    manager = KerberosCredentialManager(renew_before=100, check_interval=1000)
+
+    creds1 = manager.credentials("user1@EXAMPLE.COM", "/path/to/keytab")
+    creds2 = manager.credentials("user1@EXAMPLE.COM", "/path/to/keytab")
+    manager.credentials("user2@EXAMPLE.COM", "/path/to/keytab")
+
+    assert creds1 is creds2
+    assert mock_acquire.call_count == 2
+    assert mock_acquire.call_args_list[0] == mock.call(
+        name=mock.ANY,
+        usage="initiate",
+        store={"ccache": "FILE:/temp/ccache_pushsource_errata_1234"},
+    )
+
+
+@mock.patch("subprocess.run")
+def test_renew(mock_run, caplog):
+    """Credentials are renewed once close to expiry."""
+    caplog.set_level(logging.INFO)
+
+    manager = KerberosCredentialManager(renew_before=100, check_interval=1000)
+    mock_run.return_value = mock.MagicMock(stdout="", returncode=0)
+
+    entry = manager.authenticate("pub-errata@IPA.REDHAT.COM", "/path/to/keytab")
+    entry.creds = mock.Mock(lifetime=500)
+    mock_run.reset_mock()
+
+    # Not close to expiry, nothing to do
+    manager.renew()
+    mock_run.assert_not_called()
+
+    # Close to expiry, runs kinit
+    entry.creds.lifetime = 50
+    manager.renew()
+    mock_run.assert_called_once_with(
+        [
+            "kinit",
+            "pub-errata@IPA.REDHAT.COM",
+            "-k",
+            "-t",
+            "/path/to/keytab",
+            "-c",
+            "FILE:/temp/ccache_pushsource_errata_1234",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        check=False,
+    )
+    assert "Renewing Errata TGT for principal pub-errata@IPA.REDHAT.COM" in (
+        caplog.messages
+    )
+
+    manager.clear()
+
+
+@mock.patch("subprocess.run")
+def test_renew_failed(mock_run, caplog):
+    """If renewal fails, credentials are acquired again on next authenticate."""
+
+    manager = KerberosCredentialManager(renew_before=100, check_interval=1000)
+    mock_run.return_value = mock.MagicMock(stdout="", returncode=0)
+
+    entry = manager.authenticate("pub-errata@IPA.REDHAT.COM", "/path/to/keytab")
+    entry.creds = mock.Mock(lifetime=50)
+    mock_run.reset_mock()
+
+    # kinit fails during renewal
+    mock_run.return_value = mock.MagicMock(stdout="kinit failed", returncode=1)
+    manager.renew()
+
+    assert "kinit has failed: 'kinit failed'" in caplog.messages
+    assert not entry.authenticated
+
+    # Renewal is not attempted again from the background...
+    mock_run.reset_mock()
+    manager.renew()
+    mock_run.assert_not_called()
+
+    # ...but from the next caller to authenticate, who gets a new ticket
+    mock_run.return_value = mock.MagicMock(stdout="", returncode=0)
+    assert manager.authenticate(
+        "pub-errata@IPA.REDHAT.COM", "/path/to/keytab"
+    ).authenticated
+    assert mock_run.call_count == 2
+    assert mock_run.call_args[0][0][:2] == ["kinit", "pub-errata@IPA.REDHAT.COM"]
+
+    # If kinit can't be run at all, the same applies
+    mock_run.side_effect = OSError("kinit not found")
+    with pytest.raises(OSError):
+        manager.renew()
+    assert not entry.authenticated
+
+    manager.clear()
+
+
+@mock.patch("subprocess.run")
+def test_renew_lifetime_error(mock_run):
+    """Credentials are renewed if their lifetime can't be determined."""
+
+    manager = KerberosCredentialManager(renew_before=100, check_interval=1000)
+    mock_run.return_value = mock.MagicMock(stdout="", returncode=0)
+
+    entry = manager.authenticate("pub-errata@IPA.REDHAT.COM", "/path/to/keytab")
+    entry.creds = mock.Mock()
+    type(entry.creds).lifetime = mock.PropertyMock(side_effect=RuntimeError("expired"))
+
+    # Not yet authenticated, so never renewed
+    manager.get("other@IPA.REDHAT.COM", "/path/to/keytab")
+    mock_run.reset_mock()
+
+    manager.renew()
+
+    mock_run.assert_called_once()
+    assert mock_run.call_args[0][0][:2] == ["kinit", "pub-errata@IPA.REDHAT.COM"]
+
+    manager.clear()
+
+
+@mock.patch("subprocess.run")
+def test_renew_loop(mock_run, caplog):
+    """Credentials are checked periodically until the manager is cleared."""
+
+    manager = KerberosCredentialManager(renew_before=100, check_interval=0.01)
+    mock_run.return_value = mock.MagicMock(stdout="", returncode=0)
+
+    renewed = threading.Event()
+    calls = []
+
+    def renew():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError("simulated error")
+        renewed.set()
+
+    with mock.patch.object(manager, "renew", side_effect=renew):
+        manager.authenticate("pub-errata@IPA.REDHAT.COM", "/path/to/keytab")
+
+        # It continued after the error
+        assert renewed.wait(10.0)
+        assert "Failed to renew Errata TGT" in caplog.messages
+
+        manager.clear()
+        for thread in threading.enumerate():
+            if thread.name == "pushsource-errata-kerberos":
+                thread.join(10.0)
+                assert not thread.is_alive()
@@ -2,178 +2,13 @@ import os
 
 import pytest
 
-from pushsource import Source, ModuleMdSourcePushItem
-from mock import patch
+from pushsource import ErratumPushItem, ModuleMdSourcePushItem
 
 
-@pytest.fixture
-def source_factory(fake_errata_tool, fake_koji, koji_dir):
-    ctor = Source.get_partial(
-        "errata:https://errata.example.com",
-        koji_source="koji:https://koji.example.com?basedir=%s" % koji_dir,
-    )
-
-    rpm_filenames = [
-        "pgaudit-1.4.0-4.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "pgaudit-1.4.0-4.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "pgaudit-1.4.0-4.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "pgaudit-1.4.0-4.module+el8.1.1+4794+c82b6e09.src.rpm",
-        "pgaudit-1.4.0-4.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "pgaudit-debuginfo-1.4.0-4.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "pgaudit-debuginfo-1.4.0-4.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "pgaudit-debuginfo-1.4.0-4.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "pgaudit-debuginfo-1.4.0-4.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "pgaudit-debugsource-1.4.0-4.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "pgaudit-debugsource-1.4.0-4.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "pgaudit-debugsource-1.4.0-4.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "pgaudit-debugsource-1.4.0-4.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgres-decoderbufs-0.10.0-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgres-decoderbufs-0.10.0-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgres-decoderbufs-0.10.0-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgres-decoderbufs-0.10.0-2.module+el8.1.1+4794+c82b6e09.src.rpm",
-        "postgres-decoderbufs-0.10.0-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgres-decoderbufs-debuginfo-0.10.0-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgres-decoderbufs-debuginfo-0.10.0-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgres-decoderbufs-debuginfo-0.10.0-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgres-decoderbufs-debuginfo-0.10.0-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgres-decoderbufs-debugsource-0.10.0-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgres-decoderbufs-debugsource-0.10.0-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgres-decoderbufs-debugsource-0.10.0-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgres-decoderbufs-debugsource-0.10.0-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-12.1-2.module+el8.1.1+4794+c82b6e09.src.rpm",
-        "postgresql-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-contrib-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-contrib-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-contrib-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-contrib-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-contrib-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-contrib-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-contrib-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-contrib-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-debugsource-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-debugsource-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-debugsource-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-debugsource-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-docs-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-docs-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-docs-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-docs-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-docs-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-docs-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-docs-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-docs-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-plperl-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-plperl-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-plperl-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-plperl-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-plperl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-plperl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-plperl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-plperl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-plpython3-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-plpython3-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-plpython3-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-plpython3-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-plpython3-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-plpython3-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-plpython3-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-plpython3-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-pltcl-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-pltcl-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-pltcl-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-pltcl-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-pltcl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-pltcl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-pltcl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-pltcl-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-server-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-server-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-server-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-server-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-server-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-server-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-server-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-server-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-server-devel-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-server-devel-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-server-devel-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-server-devel-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-server-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-server-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-server-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-server-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-static-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-static-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-static-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-static-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-test-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-test-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-test-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-test-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-test-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-test-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-test-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-test-rpm-macros-12.1-2.module+el8.1.1+4794+c82b6e09.noarch.rpm",
-        "postgresql-upgrade-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-upgrade-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-upgrade-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-upgrade-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-upgrade-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-upgrade-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-upgrade-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-upgrade-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-upgrade-devel-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-upgrade-devel-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-upgrade-devel-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-upgrade-devel-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-upgrade-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.aarch64.rpm",
-        "postgresql-upgrade-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-        "postgresql-upgrade-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.s390x.rpm",
-        "postgresql-upgrade-devel-debuginfo-12.1-2.module+el8.1.1+4794+c82b6e09.x86_64.rpm",
-        "postgresql-test-12.1-2.module+el8.1.1+4794+c82b6e09.ppc64le.rpm",
-    ]
-
-    # Insert koji RPMs referenced by this advisory
-    fake_koji.insert_rpms(
-        rpm_filenames,
-        koji_dir=koji_dir,
-        signing_key="fd431d51",
-        build_nvr="postgresql-12.1-2.module+el8.1.1+4794+c82b6e09",
-    )
-
-    # Insert archives referenced by build
-    fake_koji.insert_modules(
-        [
-            "modulemd.aarch64.txt",
-            "modulemd.ppc64le.txt",
-            "modulemd.s390x.txt",
-            "modulemd.x86_64.txt",
-            "modulemd.src.txt",
-        ],
-        build_nvr="postgresql-12-8010120191120141335.e4e244f9",
-    )
-
-    yield ctor
-
-
-@patch(
-    "pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header",
-    return_value="fd431d51",
-)
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
-def test_errata_module_sources(
-    mock_get_rpm_header, mock_get_keys_from_headers, source_factory, koji_dir
-):
+def test_errata_module_sources(module_source_factory, koji_dir):
     """Errata source can provide ModuleMdSourcePushItems, typical scenario."""
 
-    source = source_factory(errata="RHEA-2020:0346")
+    source = module_source_factory(errata="RHEA-2020:0346")
 
     items = list(source)
 
@@ -202,18 +37,11 @@ def test_errata_module_sources(
     ]
 
 
-@patch(
-    "pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header",
-    return_value="fd431d51",
-)
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
-def test_errata_module_sources_no_ftp_paths(
-    mock_get_rpm_header, mock_get_keys_from_headers, source_factory
-):
+def test_errata_module_sources_no_ftp_paths(module_source_factory):
     """Errata source skips ModuleMdSourcePushItems if ET does not request any
     FTP paths for modules."""
 
-    source = source_factory(errata="RHEA-2020:0346-no-module-ftp-paths")
+    source = module_source_factory(errata="RHEA-2020:0346-no-module-ftp-paths")
 
     items = list(source)
 
@@ -223,18 +51,11 @@ def test_errata_module_sources_no_ftp_paths(
     assert src_items == []
 
 
-@patch(
-    "pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header",
-    return_value="fd431d51",
-)
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
-def test_errata_module_sources_no_cdn_list(
-    mock_get_rpm_header, mock_get_keys_from_headers, source_factory, caplog
-):
+def test_errata_module_sources_no_cdn_list(module_source_factory, caplog):
     """Errata source skips ModuleMdSourcePushItems if ET does not present those
     modules in get_advisory_cdn_file_list."""
 
-    source = source_factory(errata="RHEA-2020:0346-no-cdn-list")
+    source = module_source_factory(errata="RHEA-2020:0346-no-cdn-list")
 
     items = list(source)
 
@@ -251,28 +72,27 @@ def test_errata_module_sources_no_cdn_list(
     )
 
 
-@patch(
-    "pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header",
-    return_value="fd431d51",
-)
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
-def test_errata_module_missing_sources(
-    mock_get_rpm_header, mock_get_keys_from_headers, source_factory, fake_koji
-):
+@pytest.mark.parametrize("stream", [False, True])
+def test_errata_module_missing_sources(module_source_factory, fake_koji, stream):
     """Errata source gives fatal error if ET requests some FTP paths for modules,
     yet no module sources exist on koji build."""
-    source = source_factory(errata="RHEA-2020:0346")
+    source = module_source_factory(errata="RHEA-2020:0346", stream=stream)
 
     fake_koji.remove_archive(
         "modulemd.src.txt", "postgresql-12-8010120191120141335.e4e244f9"
     )
 
     # It should raise.
+    items = []
     with pytest.raises(ValueError) as exc_info:
-        list(source)
+        for item in source:
+            items.append(item)
 
     # It should tell us exactly what the problem was.
     assert (
         "Erratum RHEA-2020:0346: missing modulemd sources on koji build(s): "
         "postgresql-12-8010120191120141335.e4e244f9"
     ) in str(exc_info)
+
+    # In stream mode, other items may have been yielded, but never the erratum
+    assert not [item for item in items if isinstance(item, ErratumPushItem)]
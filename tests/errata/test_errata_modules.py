@@ -1,4 +1,6 @@
+import logging
 import os
+import threading
 from mock import patch
 from pushsource import (
     Source,
@@ -8,14 +10,16 @@ from pushsource import (
     ErratumReference,
     RpmPushItem,
     ModuleMdPushItem,
+    ModuleMdSourcePushItem,
 )
+from pushsource._impl.backend.errata_source import ErrataSource
 
 
 @patch(
-    "pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header",
+    "pushsource._impl.backend.rpm_keys.rpmlib.get_keys_from_header",
     return_value="fd431d51",
 )
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
+@patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header")
 def test_errata_modules_via_koji(
     mock_get_rpm_header,
     mock_get_keys_from_headers,
@@ -327,3 +331,176 @@ def test_errata_modules_via_koji(
             signing_key=None,
         ),
     ]
+
+
+def test_errata_modules_single_koji_source(fake_errata_tool):
+    """Errata source resolves RPMs and modules of an advisory through a single
+    koji source, so they share calls to koji."""
+
+    created = []
+
+    class RecordingKojiSource(object):
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+            created.append(kwargs)
+
+        def __iter__(self):
+            # Yield the requested RPMs and modules as if they were all found.
+            for filename in self.kwargs.get("rpm") or []:
+                yield RpmPushItem(name=filename, build=filename.rsplit(".", 2)[0])
+            for build in self.kwargs.get("module_build") or []:
+                for filename in self.kwargs["module_filter_filename"]:
+                    klass = (
+                        ModuleMdSourcePushItem
+                        if filename == "modulemd.src.txt"
+                        else ModuleMdPushItem
+                    )
+                    yield klass(name=filename, src="/some/dir/" + filename, build=build)
+
+    Source.register_backend("recordingkoji", RecordingKojiSource)
+
+    items = list(
+        Source.get(
+            "errata:https://errata.example.com?errata=RHEA-2020:0346",
+            koji_source="recordingkoji:",
+        )
+    )
+
+    # There should have been exactly one koji source, for RPMs and modules
+    assert len(created) == 1
+    assert created[0]["signing_key"] == "fd431d51"
+    assert created[0]["module_build"] == ["postgresql-12-8010120191120141335.e4e244f9"]
+    assert created[0]["rpm"]
+
+    # And it should have yielded both
+    assert [i for i in items if isinstance(i, RpmPushItem)]
+    assert sorted(i.name for i in items if isinstance(i, ModuleMdPushItem)) == [
+        "modulemd.aarch64.txt",
+        "modulemd.ppc64le.txt",
+        "modulemd.s390x.txt",
+        "modulemd.x86_64.txt",
+    ]
+
+    # If all RPMs are filtered out, modules are still obtained from one source
+    del created[:]
+    items = list(
+        Source.get(
+            "errata:https://errata.example.com?errata=RHEA-2020:0346",
+            koji_source="recordingkoji:",
+            rpm_filter_arch=["no-such-arch"],
+        )
+    )
+    assert len(created) == 1
+    assert "rpm" not in created[0]
+    assert not [i for i in items if isinstance(i, RpmPushItem)]
+    assert [i for i in items if isinstance(i, ModuleMdPushItem)]
+
+
+def test_errata_modules_stream(module_source_factory):
+    """Errata source in stream mode yields the same items, with erratum last."""
+
+    expected = list(module_source_factory(errata="RHEA-2020:0346"))
+    items = list(module_source_factory(errata="RHEA-2020:0346", stream=True))
+
+    # Same items, though in a different order
+    assert sorted(items, key=repr) == sorted(expected, key=repr)
+
+    # The erratum is last, so that its dest can account for all other items
+    assert isinstance(expected[0], ErratumPushItem)
+    assert items[-1] == expected[0]
+
+
+def test_errata_modules_ignores_unexpected(module_source_factory, koji_dir):
+    """Errata source ignores items from koji source which it didn't request."""
+
+    class ExtraKoji(object):
+        # Yields whatever koji yields, followed by items not requested
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+            self.koji = Source.get(
+                "koji:https://koji.example.com?basedir=%s" % koji_dir, **kwargs
+            )
+
+        def __iter__(self):
+            for item in self.koji:
+                yield item
+            if self.kwargs.get("rpm"):
+                yield RpmPushItem(
+                    name="unexpected-1.0-1.x86_64.rpm", build="unexpected-1.0-1"
+                )
+            if self.kwargs.get("module_build"):
+                yield ModuleMdPushItem(
+                    name="modulemd.x86_64.txt",
+                    src="/unexpected/modulemd.x86_64.txt",
+                    build="unexpected-1.0-1",
+                )
+                yield ModuleMdPushItem(
+                    name="modulemd.unexpected.txt",
+                    src="/unexpected/modulemd.unexpected.txt",
+                    build=self.kwargs["module_build"][0],
+                )
+
+    Source.register_backend("extra-koji", ExtraKoji)
+
+    expected = list(module_source_factory(errata="RHEA-2020:0346"))
+    items = list(
+        module_source_factory(errata="RHEA-2020:0346", koji_source="extra-koji:")
+    )
+
+    assert sorted(items, key=repr) == sorted(expected, key=repr)
+
+
+def test_errata_modules_prefetch(module_source_factory, caplog):
+    """Errata source with prefetch from koji yields the same items."""
+    caplog.set_level(logging.DEBUG, "pushsource")
+
+    expected = list(module_source_factory(errata="RHEA-2020:0346"))
+
+    koji_source = ErrataSource._koji_source
+    requests = {"prefetch": [], "source": []}
+
+    def record_koji_source(self, **kwargs):
+        kind = "prefetch" if kwargs.pop("fetch_only", False) else "source"
+        requests[kind].append(kwargs)
+        return koji_source(self, **kwargs)
+
+    with patch.object(ErrataSource, "_koji_source", record_koji_source):
+        with module_source_factory(errata="RHEA-2020:0346", prefetch=True) as source:
+            items = list(source)
+
+    assert sorted(items, key=repr) == sorted(expected, key=repr)
+
+    # It should have prefetched only the koji data, requesting the same
+    # modules as the source producing push items
+    assert requests["prefetch"]
+    module_requests = lambda kind: [
+        kwargs for kwargs in requests[kind] if "module_build" in kwargs
+    ]
+    assert module_requests("prefetch") == module_requests("source")
+
+    # It should have prefetched
+    assert "Erratum RHEA-2020:0346: prefetching koji data" in caplog.messages
+    assert "koji prefetch failed" not in caplog.text
+
+
+def test_errata_modules_prefetch_error(module_source_factory, caplog):
+    """Errors during prefetch from koji don't affect the yielded items."""
+    caplog.set_level(logging.DEBUG, "pushsource")
+
+    expected = list(module_source_factory(errata="RHEA-2020:0346"))
+
+    koji_source = ErrataSource._koji_source
+
+    def prefetch_fails(self, **kwargs):
+        if "prefetch" in threading.current_thread().name:
+            raise RuntimeError("simulated error")
+        return koji_source(self, **kwargs)
+
+    with patch.object(ErrataSource, "_koji_source", prefetch_fails):
+        with module_source_factory(errata="RHEA-2020:0346", prefetch=True) as source:
+            items = list(source)
+
+    assert sorted(items, key=repr) == sorted(expected, key=repr)
+
+    # It should have tried to prefetch
+    assert "Erratum RHEA-2020:0346: koji prefetch failed" in caplog.messages
@@ -19,10 +19,10 @@ TEST_DATA = (
 
 @pytest.mark.parametrize("erratum, expected_sig_key_path", TEST_DATA)
 @patch(
-    "pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header",
+    "pushsource._impl.backend.rpm_keys.rpmlib.get_keys_from_header",
     return_value="fd431d51",
 )
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
+@patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header")
 def test_errata_rpms_via_koji(
     mock_get_rpm_header,
     mock_get_keys_from_headers,
@@ -336,3 +336,53 @@ def test_errata_rpms_via_koji(
             signing_key="fd431d51",
         ),
     ]
+
+
+def test_errata_rpms_single_koji_source(fake_errata_tool):
+    """Errata source resolves the RPMs of all builds in an advisory through one
+    koji source and does not look up modules on builds without any."""
+
+    created = []
+
+    class RecordingKojiSource(object):
+        def __init__(self, **kwargs):
+            self.rpm = kwargs.get("rpm") or []
+            created.append(kwargs)
+
+        def __iter__(self):
+            # Yield the requested RPMs as if they were all found.
+            for filename in self.rpm:
+                yield RpmPushItem(name=filename, build=filename.rsplit(".", 2)[0])
+
+    Source.register_backend("recordingkoji", RecordingKojiSource)
+
+    source = Source.get(
+        "errata:https://errata.example.com?errata=RHBA-2020:0600-multi-build",
+        koji_source="recordingkoji:",
+    )
+
+    items = list(source)
+
+    # There should have been exactly one koji source, for RPMs only.
+    assert len(created) == 1
+    assert created[0]["signing_key"] == "fd431d51"
+    assert sorted(created[0]["rpm"]) == [
+        "bar-2.0-1.el8.src.rpm",
+        "bar-2.0-1.el8.x86_64.rpm",
+        "foo-1.0-1.el8.src.rpm",
+        "foo-1.0-1.el8.x86_64.rpm",
+        "foo-libs-1.0-1.el8.x86_64.rpm",
+    ]
+
+    # Items should have been mapped back to the builds which requested them,
+    # picking up the dest from each build.
+    rpm_items = sorted(
+        [(i.name, list(i.dest)) for i in items if isinstance(i, RpmPushItem)]
+    )
+    assert rpm_items == [
+        ("bar-2.0-1.el8.src.rpm", ["rhel-8-for-x86_64-baseos-source-rpms__8"]),
+        ("bar-2.0-1.el8.x86_64.rpm", ["rhel-8-for-x86_64-baseos-rpms__8"]),
+        ("foo-1.0-1.el8.src.rpm", ["rhel-8-for-x86_64-baseos-source-rpms__8"]),
+        ("foo-1.0-1.el8.x86_64.rpm", ["rhel-8-for-x86_64-baseos-rpms__8"]),
+        ("foo-libs-1.0-1.el8.x86_64.rpm", ["rhel-8-for-x86_64-baseos-rpms__8"]),
+    ]
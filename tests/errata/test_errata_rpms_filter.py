@@ -139,10 +139,10 @@ def source_factory(fake_errata_tool, fake_koji, koji_dir):
     ],
 )
 @patch(
-    "pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header",
+    "pushsource._impl.backend.rpm_keys.rpmlib.get_keys_from_header",
     return_value="fd431d51",
 )
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
+@patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header")
 def test_errata_rpms_filtered_by_arch(
     mock_get_rpm_header,
     mock_get_keys_from_headers,
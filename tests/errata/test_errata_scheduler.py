@@ -0,0 +1,169 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+import pytest
+from mock import patch
+
+from pushsource._impl.backend.errata_source import ErrataSource
+from pushsource._impl.backend.errata_source.errata_client import ErrataRaw
+from pushsource._impl.backend.errata_source.errata_scheduler import (
+    CostScheduler,
+    advisory_cost,
+)
+
+
+def test_advisory_cost():
+    """Advisory cost is estimated from requested files."""
+    raw = ErrataRaw(
+        advisory_cdn_metadata={},
+        advisory_cdn_file_list={
+            "foo-1.0-1": {
+                "rpms": {"foo-1.0-1.src.rpm": [], "foo-1.0-1.noarch.rpm": []}
+            },
+            "bar-1.0-1": {
+                "rpms": {"bar-1.0-1.src.rpm": []},
+                "modules": {"modulemd.x86_64.txt": []},
+            },
+        },
+        advisory_cdn_docker_file_list={"some-container-1.0-1": {}},
+        ftp_paths={},
+    )
+
+    assert advisory_cost(raw) == 2 + 1 + 1 + 10
+
+
+def test_scheduler_shortest_first():
+    """Jobs waiting for a worker are run in order of cost."""
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def blocker():
+        started.set()
+        release.wait()
+
+    with ThreadPoolExecutor(1) as executor:
+        scheduler = CostScheduler(executor)
+
+        # Occupy the only worker so that other jobs must wait
+        fs = [scheduler.submit(100, blocker)]
+        started.wait()
+
+        for cost in [50, 10, 30]:
+            fs.append(scheduler.submit(cost, order.append, cost))
+
+        release.set()
+        for f in fs:
+            f.result()
+
+    assert order == [10, 30, 50]
+
+
+def test_scheduler_errors():
+    """Errors from jobs are propagated via their futures."""
+
+    def fail():
+        raise RuntimeError("simulated error")
+
+    with ThreadPoolExecutor(1) as executor:
+        scheduler = CostScheduler(executor)
+        f = scheduler.submit(1, fail)
+
+        with pytest.raises(RuntimeError):
+            f.result()
+
+
+def test_scheduler_cancel():
+    """Jobs which can't run due to executor shutdown are cancelled."""
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker():
+        started.set()
+        release.wait()
+
+    executor = ThreadPoolExecutor(1)
+    scheduler = CostScheduler(executor)
+
+    blocked = scheduler.submit(1, blocker)
+    started.wait()
+    pending = scheduler.submit(1, lambda: None)
+
+    executor.shutdown(wait=False, cancel_futures=True)
+    release.set()
+
+    assert blocked.result() is None
+    with pytest.raises(CancelledError):
+        pending.result()
+
+
+def test_scheduler_job_cancelled():
+    """Jobs cancelled while waiting for a worker are not run."""
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def blocker():
+        started.set()
+        release.wait()
+
+    with ThreadPoolExecutor(1) as executor:
+        scheduler = CostScheduler(executor)
+
+        blocked = scheduler.submit(1, blocker)
+        started.wait()
+        cancelled = scheduler.submit(1, calls.append, "cancelled")
+        other = scheduler.submit(2, calls.append, "other")
+
+        assert cancelled.cancel()
+        release.set()
+
+        blocked.result()
+        other.result()
+
+    assert cancelled.cancelled()
+    assert calls == ["other"]
+
+
+def test_errata_source_shortest_first(module_source_factory):
+    """Errata source processes cheaper advisories first and yields the same items."""
+
+    errata = "RHEA-2020:0346,RHBA-2020:0518"
+    expected = list(module_source_factory(errata=errata))
+
+    submit = CostScheduler.submit
+    release = threading.Event()
+    costs = {}
+
+    def submit_blocked(scheduler, cost, fn, raw):
+        # Occupy the only worker until all advisories are waiting for it, so
+        # that they are run in order of cost rather than submission.
+        if not costs:
+            submit(scheduler, -1, release.wait)
+        costs[raw.advisory_cdn_metadata["id"]] = cost
+        f = submit(scheduler, cost, fn, raw)
+        if len(costs) == 2:
+            release.set()
+        return f
+
+    with patch.object(CostScheduler, "submit", submit_blocked), patch.object(
+        ErrataSource,
+        "_push_items_from_raw",
+        autospec=True,
+        side_effect=ErrataSource._push_items_from_raw,
+    ) as push_items_from_raw:
+        with module_source_factory(
+            errata=errata, shortest_first=True, threads=1
+        ) as source:
+            items = list(source)
+
+    assert sorted(items, key=repr) == sorted(expected, key=repr)
+
+    # The advisory requesting fewer files should have been processed first,
+    # though it was requested last
+    assert costs == {"RHEA-2020:0346": 128, "RHBA-2020:0518": 0}
+    processed = [
+        call.args[1].advisory_cdn_metadata["id"]
+        for call in push_items_from_raw.call_args_list
+    ]
+    assert processed == ["RHBA-2020:0518", "RHEA-2020:0346"]
@@ -15,7 +15,8 @@ from pushsource import (
 )
 
 
-def test_errata_ami_via_koji(fake_errata_tool, fake_koji, koji_dir):
+@pytest.mark.parametrize("stream", [False, True])
+def test_errata_ami_via_koji(fake_errata_tool, fake_koji, koji_dir, stream):
     """Errata source containing a module yields modules & RPMs taken
     from koji source"""
 
@@ -23,6 +24,7 @@ def test_errata_ami_via_koji(fake_errata_tool, fake_koji, koji_dir):
         "errata:https://errata.example.com",
         errata="RHSA-2022:78146",
         koji_source="koji:https://koji.example.com?basedir=%s" % koji_dir,
+        stream=stream,
     )
 
     nvr = "rhel-ec2-8.7-1"
@@ -1,6 +1,8 @@
 import os
 import glob
 
+import httpx
+import koji
 import yaml
 
 BUILDS_DIR = os.path.join(os.path.dirname(__file__), "data", "builds")
@@ -11,20 +13,58 @@ class FakeKojiController(object):
         self.rpm_data = {}
         self.build_data = {}
         self.archive_data = {}
+        self.rpm_sigs = {}
+        self.tag_data = {}
+        self.session_count = 0
+        self.logout_count = 0
+        self.multicall_count = 0
         self.last_url = None
         self.next_build_id = 80000
+        self.next_rpm_id = 90000
 
     def reset(self):
         self.rpm_data = {}
         self.build_data = {}
         self.archive_data = {}
+        self.rpm_sigs = {}
+        self.tag_data = {}
+        self.session_count = 0
+        self.logout_count = 0
+        self.multicall_count = 0
         self.last_url = None
         self.next_build_id = 80000
+        self.next_rpm_id = 90000
 
     def session(self, url, opts=None):
         self.last_url = url
+        self.session_count += 1
         return FakeKojiSession(self)
 
+    def async_transport(self):
+        # An httpx transport serving XML-RPC calls from this controller,
+        # for use with the asyncio koji client.
+        session = FakeKojiSession(self)
+
+        def call(method, params):
+            args, kwargs = koji.decode_args(*params)
+            return getattr(session, method)(*args, **kwargs)
+
+        def handler(request):
+            params, method = koji.loads(request.content)
+            if method == "multiCall":
+                result = []
+                for entry in params[0]:
+                    try:
+                        result.append([call(entry["methodName"], entry["params"])])
+                    except Exception as ex:  # pylint: disable=broad-except
+                        result.append({"faultCode": 1000, "faultString": str(ex)})
+            else:
+                result = call(method, params)
+            body = koji.dumps((result,), methodresponse=1, allow_none=1)
+            return httpx.Response(200, content=body.encode("utf-8"))
+
+        return httpx.MockTransport(handler)
+
     def load_build(self, nvr):
         build_file = os.path.join(BUILDS_DIR, nvr + ".yaml")
 
@@ -69,7 +109,8 @@ class FakeKojiController(object):
         stored_rpms = []
 
         for filename in filenames:
-            data = {}
+            data = {"id": self.next_rpm_id}
+            self.next_rpm_id += 1
             rfilename = filename[-1::-1]
             rpm, arch, rest = rfilename.split(".", 2)
             rpm = rpm[-1::-1]
@@ -111,6 +152,14 @@ class FakeKojiController(object):
                     signing_key=signing_key,
                 )
 
+                self.rpm_sigs.setdefault(self.rpm_data[filename]["id"], []).append(
+                    {
+                        "rpm_id": self.rpm_data[filename]["id"],
+                        "sigkey": signing_key.lower(),
+                        "sighash": "abc123",
+                    }
+                )
+
                 signed_dir = os.path.dirname(signed_rpm_path)
                 if not os.path.exists(signed_dir):
                     os.makedirs(signed_dir)
@@ -157,6 +206,9 @@ class FakeKojiSession(object):
             raise value
         return value
 
+    def logout(self):
+        self._ctrl.logout_count += 1
+
     def getKojiVersion(self):
         return "fake-version"
 
@@ -169,7 +221,37 @@ class FakeKojiSession(object):
     def listArchives(self, build_id):
         return self._return_or_raise(self._ctrl.archive_data.get(build_id) or [])
 
+    def listRPMs(self, buildID=None):
+        # rpm_data may contain the same RPM more than once (e.g. by ID and filename)
+        rpms = dict(
+            (id(rpm), rpm)
+            for rpm in self._ctrl.rpm_data.values()
+            if not isinstance(rpm, Exception) and rpm.get("build_id") == buildID
+        )
+        return list(rpms.values())
+
+    def listTagged(self, tag, latest=False, inherit=False, type=None):
+        # tag_data holds NVRs of builds in each tag, and a build type per NVR
+        # can be set by including (nvr, type) instead.
+        out = []
+        for entry in self._ctrl.tag_data.get(tag) or []:
+            nvr, btype = entry if isinstance(entry, tuple) else (entry, None)
+            if type is None or type == btype:
+                out.append(self._ctrl.build_data[nvr])
+        return out
+
+    def listTaggedRPMS(self, tag, latest=False, inherit=False):
+        builds = self.listTagged(tag, latest=latest, inherit=inherit)
+        rpms = []
+        for build in builds:
+            rpms.extend(self.listRPMs(buildID=build["id"]))
+        return [rpms, builds]
+
+    def queryRPMSigs(self, rpm_id=None):
+        return self._return_or_raise(self._ctrl.rpm_sigs.get(rpm_id) or [])
+
     def multicall(self, *args, **kwargs):
+        self._ctrl.multicall_count += 1
         return FakeMulticall(self, *args, **kwargs)
 
 
@@ -191,6 +273,8 @@ class FakeMulticall(object):
         self.getRPM = self._proxy(session.getRPM)
         self.getBuild = self._proxy(session.getBuild)
         self.listArchives = self._proxy(session.listArchives)
+        self.queryRPMSigs = self._proxy(session.queryRPMSigs)
+        self.listRPMs = self._proxy(session.listRPMs)
 
     def call_all(self, strict=None, batch=None):
         for call in self._pending:
@@ -1,9 +1,18 @@
+import asyncio
+import json
 import os
+import sqlite3
+import threading
+from concurrent.futures import Future, CancelledError
 from mock import patch
 
-from pytest import raises
+from pytest import mark, raises
+import httpx
+import koji
 
 from pushsource import Source, RpmPushItem
+from pushsource._impl.backend import koji_async
+from pushsource._impl.backend.koji_source import KojiSource
 
 DATADIR = os.path.join(os.path.dirname(__file__), "data")
 
@@ -278,6 +287,143 @@ def test_koji_uses_signing_key(fake_koji, koji_dir, caplog):
     )
 
 
+def test_koji_query_signatures(fake_koji, koji_dir):
+    """RPM signing key is selected from signatures known to koji, if requested."""
+
+    fake_koji.insert_rpms(
+        ["foo-1.0-1.x86_64.rpm"],
+        koji_dir=koji_dir,
+        signing_key="abcd1234",
+        build_nvr="foo-1.0-1",
+    )
+
+    source = Source.get(
+        "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm&query_signatures=1",
+        basedir=koji_dir,
+        signing_key=["ABC123", "ABCD1234", None],
+    )
+
+    with patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header") as get_header:
+        items = list(source)
+
+    # It should have found the RPM signed with the key known to koji
+    assert items == [
+        RpmPushItem(
+            name="foo-1.0-1.x86_64.rpm",
+            src=os.path.join(
+                koji_dir,
+                "packages/foo/1.0/1/data/signed/abcd1234/x86_64/foo-1.0-1.x86_64.rpm",
+            ),
+            build="foo-1.0-1",
+            signing_key="abcd1234",
+        )
+    ]
+
+    # It should not have needed to read the RPM header to know the key
+    get_header.assert_not_called()
+
+
+def test_koji_query_signatures_cached(fake_koji, koji_dir):
+    """RPM signatures are queried once per cache, including in stream mode."""
+
+    fake_koji.insert_rpms(
+        ["foo-1.0-1.x86_64.rpm"],
+        koji_dir=koji_dir,
+        signing_key="abcd1234",
+        build_nvr="foo-1.0-1",
+    )
+
+    cache = {}
+    get_items = lambda stream: list(
+        Source.get(
+            "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm&query_signatures=1",
+            basedir=koji_dir,
+            signing_key="ABCD1234",
+            cache=cache,
+            stream=stream,
+        )
+    )
+
+    items = get_items(True)
+    assert [i.signing_key for i in items] == ["ABCD1234"]
+    calls = cache["stats"]["calls"]
+
+    # Everything is found in the cache the second time
+    assert get_items(False) == items
+    assert cache["stats"]["calls"] == calls
+
+
+def test_koji_query_signatures_fallback(fake_koji, koji_dir, caplog):
+    """RPM paths are probed if signatures known to koji don't find an RPM."""
+
+    for name in ("foo", "bar", "baz"):
+        fake_koji.insert_rpms(
+            ["%s-1.0-1.x86_64.rpm" % name],
+            koji_dir=koji_dir,
+            signing_key="abcd1234",
+            build_nvr="%s-1.0-1" % name,
+        )
+    fake_koji.insert_rpms(
+        ["alias-1.0-1.x86_64.rpm"],
+        koji_dir=koji_dir,
+        signing_key="myalias",
+        build_nvr="alias-1.0-1",
+    )
+
+    # foo is signed according to koji, but missing
+    os.remove(
+        os.path.join(
+            koji_dir,
+            "packages/foo/1.0/1/data/signed/abcd1234/x86_64/foo-1.0-1.x86_64.rpm",
+        )
+    )
+
+    # bar is present unsigned
+    bar_path = os.path.join(koji_dir, "packages/bar/1.0/1/x86_64/bar-1.0-1.x86_64.rpm")
+    os.makedirs(os.path.dirname(bar_path))
+    open(bar_path, "w").close()
+
+    def get_item(rpm, signing_key):
+        source = Source.get(
+            "koji:https://koji.example.com/?query_signatures=1",
+            rpm=rpm,
+            basedir=koji_dir,
+            signing_key=signing_key,
+        )
+        with patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header"), patch(
+            "pushsource._impl.backend.rpm_keys.rpmlib.get_keys_from_header",
+            return_value="abcd1234",
+        ):
+            (item,) = list(source)
+        return item
+
+    assert get_item("foo-1.0-1.x86_64.rpm", ["ABCD1234", None]).state == "NOTFOUND"
+    assert (
+        "RPM signed with abcd1234 according to koji is missing at %s"
+        % os.path.join(
+            koji_dir,
+            "packages/foo/1.0/1/data/signed/abcd1234/x86_64/foo-1.0-1.x86_64.rpm",
+        )
+        in caplog.messages
+    )
+
+    # Unsigned RPM is used when preferred keys aren't known to koji
+    item = get_item("bar-1.0-1.x86_64.rpm", ["FFFF0000", None])
+    assert item.src == bar_path
+    assert item.signing_key is None
+
+    # Nothing found with keys known to koji, nor by probing
+    assert get_item("baz-1.0-1.x86_64.rpm", ["FFFF0000"]).state == "NOTFOUND"
+
+    # Key aliases are resolved from the RPM header
+    item = get_item("alias-1.0-1.x86_64.rpm", ["MyAlias"])
+    assert item.src == os.path.join(
+        koji_dir,
+        "packages/alias/1.0/1/data/signed/myalias/x86_64/alias-1.0-1.x86_64.rpm",
+    )
+    assert item.signing_key == "ABCD1234"
+
+
 def test_koji_cache(fake_koji, koji_dir):
     """Koji source can reuse a cache to avoid repeated calls."""
 
@@ -314,6 +460,279 @@ def test_koji_cache(fake_koji, koji_dir):
     assert cache
 
 
+def test_koji_coalesces_calls(fake_koji, koji_dir):
+    """Koji source makes each distinct call only once, and counts calls avoided."""
+
+    cache = {}
+    rpms = ["foo-1.0-1.x86_64.rpm", "foo-1.0-1.s390x.rpm", "foo-1.0-1.src.rpm"]
+    fake_koji.insert_rpms(rpms, build_nvr="foo-1.0-1")
+
+    source = Source.get(
+        "koji:https://koji.example.com/",
+        rpm=rpms,
+        basedir=koji_dir,
+        cache=cache,
+        threads=8,
+    )
+    items = list(source)
+
+    assert len(items) == 3
+
+    stats = cache["stats"]
+
+    # It should have done 1 getRPM for each RPM, and only a single getBuild
+    # even though the build was needed by every RPM
+    assert stats["calls"] == 4
+
+    # The other lookups of the build were either found in cache, or coalesced
+    # with the call already in flight
+    assert stats["cache_hits"] + stats["coalesced"] == 2
+
+    # Nothing should be left in flight
+    assert not cache["inflight"]
+
+
+def test_koji_list_rpms(fake_koji, koji_dir):
+    """Koji source can look up RPMs of the same build together."""
+
+    foo_rpms = [
+        "foo-1.0-1.%s.rpm" % arch for arch in ("src", "x86_64", "s390x", "ppc64le")
+    ] + ["foo-devel-1.0-1.x86_64.rpm"]
+    fake_koji.insert_rpms(foo_rpms, build_nvr="foo-1.0-1")
+    fake_koji.insert_rpms(["bar-2.0-1.x86_64.rpm"], build_nvr="bar-2.0-1")
+    # Same version-release as foo, but a different build
+    fake_koji.insert_rpms(["baz-1.0-1.noarch.rpm"], build_nvr="baz-1.0-1")
+
+    rpms = foo_rpms + [
+        "bar-2.0-1.x86_64.rpm",
+        "baz-1.0-1.noarch.rpm",
+        "notfound-1.0-1.x86_64.rpm",
+    ]
+
+    default_cache = {}
+    items = sorted(
+        Source.get(
+            "koji:https://koji.example.com/",
+            rpm=rpms,
+            basedir=koji_dir,
+            cache=default_cache,
+        ),
+        key=repr,
+    )
+
+    list_cache = {}
+    list_items = sorted(
+        Source.get(
+            "koji:https://koji.example.com/?list_rpms=1",
+            rpm=rpms,
+            basedir=koji_dir,
+            cache=list_cache,
+        ),
+        key=repr,
+    )
+
+    stream_items = sorted(
+        Source.get(
+            "koji:https://koji.example.com/?list_rpms=1",
+            rpm=rpms,
+            basedir=koji_dir,
+            stream=True,
+        ),
+        key=repr,
+    )
+
+    # It should find the same items either way, including the missing RPM
+    assert len(items) == 8
+    assert list_items == items
+    assert stream_items == items
+
+    # Default mode does a getRPM per RPM and a getBuild per build
+    assert default_cache["stats"]["calls"] == 11
+
+    # listRPMs mode does a getRPM and listRPMs for the foo group (including
+    # foo-devel), and a getRPM for each of bar, baz and the missing RPM, which
+    # aren't grouped with foo; plus getBuild for each build.
+    assert list_cache["stats"]["calls"] == 8
+
+
+def test_koji_list_rpms_fallback(fake_koji, koji_dir):
+    """Koji source looks up RPMs directly where grouping guessed wrong."""
+
+    # Grouped as foo and libfoo, both of which list the RPMs of this build
+    foo_rpms = [
+        "foo-1.0-1.x86_64.rpm",
+        "foo-devel-1.0-1.x86_64.rpm",
+        "libfoo-1.0-1.x86_64.rpm",
+        "libfoo-devel-1.0-1.x86_64.rpm",
+    ]
+    fake_koji.insert_rpms(
+        foo_rpms, build_nvr="foo-1.0-1", koji_dir=koji_dir, signing_key="abc123"
+    )
+    # Grouped with foo, but from a different build
+    fake_koji.insert_rpms(
+        ["foo-extra-1.0-1.noarch.rpm"],
+        build_nvr="foo-extra-1.0-1",
+        koji_dir=koji_dir,
+        signing_key="abc123",
+    )
+
+    rpms = foo_rpms + [
+        "foo-extra-1.0-1.noarch.rpm",
+        "missing-1.0-1.x86_64.rpm",
+        "missing-devel-1.0-1.x86_64.rpm",
+    ]
+
+    def get_items(url):
+        return sorted(
+            Source.get(url, rpm=rpms, basedir=koji_dir, signing_key="abc123"),
+            key=repr,
+        )
+
+    with patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header"), patch(
+        "pushsource._impl.backend.rpm_keys.rpmlib.get_keys_from_header",
+        return_value="abc123",
+    ):
+        items = get_items("koji:https://koji.example.com/?query_signatures=1")
+        list_items = get_items(
+            "koji:https://koji.example.com/?query_signatures=1&list_rpms=1"
+        )
+
+    # It should find the same items either way, including missing RPMs
+    assert [i.state for i in list_items] == ["PENDING"] * 5 + ["NOTFOUND"] * 2
+    assert list_items == items
+
+
+def test_koji_fetch_only(fake_koji, koji_dir):
+    """Koji source with fetch_only caches koji data without yielding items."""
+
+    cache = {}
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(["modulemd.x86_64.txt"], build_nvr="foo-1.0-1")
+    source_ctor = Source.get_partial(
+        "koji:https://koji.example.com/?module_build=foo-1.0-1",
+        rpm=["foo-1.0-1.x86_64.rpm"],
+        basedir=koji_dir,
+        cache=cache,
+    )
+
+    assert list(source_ctor(fetch_only=True)) == []
+    calls = cache["stats"]["calls"]
+    assert calls
+
+    # A later source finds everything in the cache
+    assert len(list(source_ctor())) == 2
+    assert cache["stats"]["calls"] == calls
+
+
+def test_koji_origin(fake_koji, koji_dir):
+    """Koji source fills in origin of push items, if requested."""
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+
+    items = list(
+        Source.get(
+            "koji:https://koji.example.com/",
+            rpm=["foo-1.0-1.x86_64.rpm", "notfound-1.0-1.x86_64.rpm"],
+            basedir=koji_dir,
+            origin="some-origin",
+        )
+    )
+
+    assert len(items) == 2
+    assert [item.origin for item in items] == ["some-origin"] * 2
+
+
+def test_koji_list_rpms_grouping():
+    """RPMs are grouped by name prefix and version-release."""
+
+    source = KojiSource(
+        "https://koji.example.com/",
+        list_rpms=True,
+        rpm=[
+            "foo-1.0-1.x86_64.rpm",
+            "foo-devel-1.0-1.x86_64.rpm",
+            "bar-1.0-1.x86_64.rpm",
+            "foo-2.0-1.x86_64.rpm",
+            # RPM requested by ID, not grouped
+            1234,
+        ],
+    )
+
+    commands = source._rpm_commands()
+    assert [(c.ident, c.siblings) for c in commands] == [
+        (1234, []),
+        ("foo-1.0-1.x86_64.rpm", ["foo-devel-1.0-1.x86_64.rpm"]),
+        ("bar-1.0-1.x86_64.rpm", []),
+        ("foo-2.0-1.x86_64.rpm", []),
+    ]
+
+
+def test_koji_persistent_cache(fake_koji, koji_dir, tmpdir):
+    """Koji source can reuse a persistent cache across instances."""
+
+    source_ctor = Source.get_partial(
+        "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm,bar-1.0-1.x86_64.rpm"
+        "&module_build=foo-1.0-1",
+        basedir=koji_dir,
+        persistent_cache=str(tmpdir.join("koji-cache.db")),
+    )
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(
+        ["modulemd.x86_64.txt", "modulemd.s390x.txt"], build_nvr="foo-1.0-1"
+    )
+
+    # Get push items from one source
+    items1 = sorted(list(source_ctor()), key=repr)
+
+    # It should have four items (1 RPM, 1 missing RPM, two modulemds)
+    assert len(items1) == 4
+    assert [i.state for i in items1 if isinstance(i, RpmPushItem)] == [
+        "NOTFOUND",
+        "PENDING",
+    ]
+
+    # Now wipe out all the fake_koji data
+    fake_koji.reset()
+
+    # Get push items from a new source, which doesn't share any in-memory
+    # cache with the first. It should succeed from the persistent cache.
+    items2 = sorted(list(source_ctor()), key=repr)
+    assert items1 == items2
+
+    # Missing data should not have been cached, so if the missing RPM now
+    # appears in koji, it can be found.
+    fake_koji.insert_rpms(["bar-1.0-1.x86_64.rpm"], build_nvr="bar-1.0-1")
+    items3 = list(source_ctor())
+    assert "NOTFOUND" not in [i.state for i in items3]
+
+
+def test_koji_persistent_cache_complete_builds(fake_koji, koji_dir, tmpdir):
+    """Data of completed builds is persistently cached without expiry."""
+
+    path = str(tmpdir.join("koji-cache.db"))
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_rpms(["bar-1.0-1.x86_64.rpm"], build_nvr="bar-1.0-1")
+    fake_koji.build_data["foo-1.0-1"]["state"] = koji.BUILD_STATES["COMPLETE"]
+    fake_koji.build_data["bar-1.0-1"]["state"] = koji.BUILD_STATES["BUILDING"]
+
+    list(
+        Source.get(
+            "koji:https://koji.example.com/?module_build=foo-1.0-1,bar-1.0-1",
+            basedir=koji_dir,
+            persistent_cache=path,
+        )
+    )
+
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT key, expires FROM cache").fetchall()
+
+    expires = dict((tuple(json.loads(key)[1:]), exp) for (key, exp) in rows)
+    assert expires[("build", "foo-1.0-1")] is None
+    assert expires[("build", "bar-1.0-1")] is not None
+    assert [k for k in expires if k[0] == "archives"]
+
+
 def test_koji_uses_signing_key_alias(fake_koji, koji_dir, caplog):
     """RPM uses first existing of specified signing keys including multi-key alias."""
 
@@ -361,3 +780,521 @@ def test_koji_uses_signing_key_alias(fake_koji, koji_dir, caplog):
         build="foobuild-1.0-1.el8",
         signing_key="f78fb195",
     )
+
+
+def test_koji_stream(fake_koji, koji_dir):
+    """Koji source in stream mode yields the same items as in the default mode."""
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(
+        ["modulemd.x86_64.txt", "modulemd.s390x.txt"], build_nvr="foo-1.0-1"
+    )
+
+    url = (
+        "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm,notfound-1.0-1.noarch.rpm"
+        "&module_build=foo-1.0-1"
+    )
+
+    with Source.get(url, basedir=koji_dir) as source:
+        items = sorted(list(source), key=repr)
+
+    with Source.get(url, basedir=koji_dir, stream=True) as source:
+        streamed_items = sorted(list(source), key=repr)
+
+    # It should have found 1 RPM, 1 missing RPM and two modulemds
+    assert len(items) == 4
+
+    # Streaming should make no difference to the output
+    assert streamed_items == items
+
+
+def test_koji_stream_early(fake_koji, koji_dir, monkeypatch):
+    """Koji source in stream mode yields items while fetches are still ongoing."""
+
+    monkeypatch.setattr(KojiSource, "_BATCH_SIZE", 2)
+
+    rpms = []
+    for i in range(0, 6):
+        rpm = "foo%s-1.0-1.x86_64.rpm" % i
+        fake_koji.insert_rpms([rpm], build_nvr="foo%s-1.0-1" % i)
+        rpms.append(rpm)
+
+    with Source.get(
+        "koji:https://koji.example.com/", rpm=rpms, basedir=koji_dir
+    ) as source:
+        items = sorted(source, key=repr)
+
+    # Lookups of RPMs after the first batch are blocked until we've
+    # received an item.
+    gate = threading.Event()
+    rpm_data = fake_koji.rpm_data
+
+    class GatedRpms(dict):
+        def get(self, key, default=None):
+            if key not in rpms[0:2]:
+                assert gate.wait(10)
+            return super(GatedRpms, self).get(key, default)
+
+    fake_koji.rpm_data = GatedRpms(rpm_data)
+
+    with Source.get(
+        "koji:https://koji.example.com/",
+        rpm=rpms,
+        basedir=koji_dir,
+        stream=True,
+        threads=1,
+    ) as source:
+        streamed = iter(source)
+
+        # The first item is yielded while fetches are blocked
+        first = next(streamed)
+        assert not gate.is_set()
+        assert first.name in rpms[0:2]
+
+        gate.set()
+        streamed_items = sorted([first] + list(streamed), key=repr)
+
+    # It should yield the same items as when not streaming
+    assert len(items) == 6
+    assert streamed_items == items
+
+
+def test_koji_chunked(fake_koji, koji_dir, monkeypatch):
+    """Koji source processing items in chunks yields the same items as otherwise."""
+
+    rpms = ["foo-1.0-1.%s.rpm" % arch for arch in ("src", "x86_64", "s390x")]
+    fake_koji.insert_rpms(rpms, build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(
+        ["modulemd.x86_64.txt", "modulemd.s390x.txt"], build_nvr="foo-1.0-1"
+    )
+
+    def get_items(**kwargs):
+        source = Source.get(
+            "koji:https://koji.example.com/?module_build=foo-1.0-1",
+            rpm=rpms + ["notfound-1.0-1.noarch.rpm"],
+            basedir=koji_dir,
+            **kwargs
+        )
+        return sorted(list(source), key=repr)
+
+    items = get_items()
+    assert len(items) == 6
+
+    monkeypatch.setattr(KojiSource, "_CHUNK_SIZE", 3)
+
+    # Chunking should make no difference to the output, in either mode
+    assert get_items() == items
+    assert get_items(stream=True) == items
+
+
+def test_koji_chunk_errors():
+    """Errors at any stage of processing a chunk are propagated to its future."""
+
+    class FakeExecutor(object):
+        def __init__(self, cancel=False, error=None):
+            self.cancel = cancel
+            self.error = error
+
+        def submit(self, fn):
+            if self.error:
+                raise self.error
+            out = Future()
+            if self.cancel:
+                out.cancel()
+                return out
+            try:
+                out.set_result(fn())
+            except Exception as e:
+                out.set_exception(e)
+            return out
+
+    def failed(error):
+        out = Future()
+        out.set_exception(error)
+        return out
+
+    source = KojiSource("https://koji.example.com/")
+    error1 = RuntimeError("error 1")
+    error2 = RuntimeError("error 2")
+
+    def get_meta(ident):
+        if ident == "bad":
+            raise error1
+        return ident
+
+    def chunk_future(chunk, ready=(), executor=None, push_items=lambda x, y: [y]):
+        source._executor = executor or FakeExecutor()
+        return source._chunk_future(chunk, list(ready), get_meta, push_items)
+
+    # Successful chunk
+    assert chunk_future(["a", "b"]).result() == ["a", "b"]
+
+    # Failure from the first of several failed dependencies
+    f = chunk_future(["a", "b"], ready=[failed(error1), failed(error2)])
+    assert f.exception() is error1
+
+    # Cancelled dependency
+    cancelled = Future()
+    cancelled.cancel()
+    with raises(CancelledError):
+        chunk_future(["a"], ready=[cancelled]).result()
+
+    # Executor unable to accept the chunk, e.g. shut down
+    f = chunk_future(["a"], executor=FakeExecutor(error=error1))
+    assert f.exception() is error1
+
+    # Chunk cancelled in executor
+    assert chunk_future(["a"], executor=FakeExecutor(cancel=True)).cancelled()
+
+    # Failure to get metadata
+    assert chunk_future(["a", "bad"]).exception() is error1
+
+    # Failure to convert to push items
+    def push_items(ident, meta):
+        raise error2
+
+    assert chunk_future(["a"], push_items=push_items).exception() is error2
+
+
+def test_koji_stream_exceptions(fake_koji):
+    """Exceptions raised during calls to koji are propagated in stream mode"""
+
+    source = Source.get(
+        "koji:https://koji.example.com/?module_build=error-1.2.3", stream="1"
+    )
+
+    error = RuntimeError("simulated error")
+    fake_koji.build_data["error-1.2.3"] = error
+
+    with raises(Exception) as exc_info:
+        list(source)
+
+    # It should have propagated *exactly* the exception from koji
+    assert exc_info.value is error
+
+
+def test_koji_async(fake_koji, koji_dir, monkeypatch):
+    """Koji source iterated with 'async for' yields the same items as otherwise."""
+
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": fake_koji.async_transport()}
+    )
+
+    rpms = ["foo-1.0-1.%s.rpm" % arch for arch in ("src", "x86_64", "s390x")]
+    fake_koji.insert_rpms(rpms, build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(
+        ["modulemd.x86_64.txt", "modulemd.s390x.txt"], build_nvr="foo-1.0-1"
+    )
+
+    source_ctor = Source.get_partial(
+        "koji:https://koji.example.com/?module_build=foo-1.0-1",
+        rpm=rpms + ["notfound-1.0-1.noarch.rpm"],
+        basedir=koji_dir,
+    )
+
+    async def get_items(**kwargs):
+        with source_ctor(**kwargs) as source:
+            return sorted([item async for item in source], key=repr)
+
+    items = sorted(source_ctor(), key=repr)
+    assert len(items) == 6
+
+    # Output should be the same in either mode
+    assert asyncio.run(get_items()) == items
+    assert asyncio.run(get_items(stream=True)) == items
+
+
+def test_koji_async_coalesces_calls(fake_koji, koji_dir, monkeypatch):
+    """Koji source iterated with 'async for' makes each distinct call only once."""
+
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": fake_koji.async_transport()}
+    )
+
+    cache = {}
+    rpms = ["foo-1.0-1.x86_64.rpm", "foo-1.0-1.s390x.rpm", "foo-1.0-1.src.rpm"]
+    fake_koji.insert_rpms(rpms, build_nvr="foo-1.0-1")
+
+    async def get_items():
+        with Source.get(
+            "koji:https://koji.example.com/",
+            rpm=rpms,
+            basedir=koji_dir,
+            cache=cache,
+            threads=8,
+        ) as source:
+            return [item async for item in source]
+
+    assert len(asyncio.run(get_items())) == 3
+
+    # Same calls as in sync mode, with nothing left in flight
+    assert cache["stats"]["calls"] == 4
+    assert cache["stats"]["cache_hits"] + cache["stats"]["coalesced"] == 2
+    assert not cache["inflight"]
+
+
+def test_koji_async_fetch_only(fake_koji, koji_dir, monkeypatch):
+    """Koji source with fetch_only caches koji data when iterated with
+    'async for'."""
+
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": fake_koji.async_transport()}
+    )
+
+    cache = {}
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    source_ctor = Source.get_partial(
+        "koji:https://koji.example.com/",
+        rpm=["foo-1.0-1.x86_64.rpm"],
+        basedir=koji_dir,
+        cache=cache,
+    )
+
+    async def get_items():
+        with source_ctor(fetch_only=True) as source:
+            return [item async for item in source]
+
+    assert asyncio.run(get_items()) == []
+    assert "foo-1.0-1.x86_64.rpm" in cache["rpm"]
+
+
+def test_koji_async_timeout_shared_call(fake_koji, koji_dir, monkeypatch):
+    """Timing out while waiting on a call made by another caller when
+    iterating with 'async for' doesn't affect that caller."""
+
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": fake_koji.async_transport()}
+    )
+
+    cache = {}
+    key = ("getRPM", "foo-1.0-1.x86_64.rpm")
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    source_ctor = Source.get_partial(
+        "koji:https://koji.example.com/",
+        rpm=["foo-1.0-1.x86_64.rpm"],
+        basedir=koji_dir,
+        cache=cache,
+    )
+
+    # Some other caller is already getting the RPM
+    other = KojiSource("https://koji.example.com/", cache=cache)
+    assert other._begin_call(key, lambda: False) == (True, None)
+    inflight = cache["inflight"][key]
+
+    async def get_items():
+        with source_ctor(timeout=0.1) as source:
+            return [item async for item in source]
+
+    with raises(asyncio.TimeoutError):
+        asyncio.run(get_items())
+
+    # The shared call should be unaffected, and can be completed by its caller
+    assert not inflight.done()
+    other._end_call(key)
+    assert inflight.result() is None
+
+
+@mark.parametrize("stream", [False, True])
+def test_koji_async_exceptions(fake_koji, monkeypatch, stream):
+    """Errors from koji calls are propagated when iterating with 'async for'."""
+
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": fake_koji.async_transport()}
+    )
+
+    cache = {}
+    fake_koji.build_data["error-1.2.3"] = RuntimeError("simulated error")
+
+    async def get_items():
+        with Source.get(
+            "koji:https://koji.example.com/?module_build=error-1.2.3",
+            cache=cache,
+            stream=stream,
+        ) as source:
+            return [item async for item in source]
+
+    with raises(koji.GenericError) as exc_info:
+        asyncio.run(get_items())
+
+    # It should have propagated the error from koji
+    assert "simulated error" in str(exc_info.value)
+
+    # Nothing should be left in flight
+    assert not cache["inflight"]
+
+
+def test_koji_async_connect_error(monkeypatch):
+    """Koji source raises a meaningful error if koji can't be reached
+    when iterating with 'async for'."""
+
+    monkeypatch.setattr(
+        koji_async,
+        "CLIENT_ARGS",
+        {"transport": httpx.MockTransport(lambda request: httpx.Response(403))},
+    )
+
+    async def get_items():
+        with Source.get("koji:https://koji.example.com/", rpm=["foo"]) as source:
+            return [item async for item in source]
+
+    with raises(RuntimeError) as exc_info:
+        asyncio.run(get_items())
+
+    assert "Communication error with koji at https://koji.example.com/" in str(
+        exc_info.value
+    )
+    assert isinstance(exc_info.value.__cause__, httpx.HTTPStatusError)
+
+
+def test_koji_async_stop_early(fake_koji, koji_dir, monkeypatch):
+    """Koji fetches are abandoned if 'async for' stops before all items
+    are yielded."""
+
+    cache = {}
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(["modulemd.x86_64.txt"], build_nvr="bar-1.0-1")
+
+    # Get the RPM's data into the cache
+    (rpm,) = Source.get(
+        "koji:https://koji.example.com/",
+        rpm=["foo-1.0-1.x86_64.rpm"],
+        basedir=koji_dir,
+        cache=cache,
+    )
+
+    async def hang(request):
+        await asyncio.Event().wait()
+
+    # Any further calls to koji never complete
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": httpx.MockTransport(hang)}
+    )
+
+    async def get_first():
+        with Source.get(
+            "koji:https://koji.example.com/?module_build=bar-1.0-1",
+            rpm=["foo-1.0-1.x86_64.rpm"],
+            basedir=koji_dir,
+            cache=cache,
+            stream=True,
+        ) as source:
+            items = source.__aiter__()
+            item = await items.__anext__()
+            await items.aclose()
+            return item
+
+    # It can provide the cached RPM without waiting for the module
+    assert asyncio.run(get_first()) == rpm
+
+    # The abandoned call was released
+    assert not cache["inflight"]
+
+
+def test_koji_small_build_cache(fake_koji, koji_dir, monkeypatch):
+    """Koji source yields the same items if builds are evicted from its cache."""
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_rpms(["bar-1.0-1.x86_64.rpm"], build_nvr="bar-1.0-1")
+    fake_koji.insert_modules(["modulemd.x86_64.txt"], build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(["modulemd.s390x.txt"], build_nvr="bar-1.0-1")
+
+    def get_items():
+        source = Source.get(
+            "koji:https://koji.example.com/?module_build=foo-1.0-1,bar-1.0-1",
+            rpm=["foo-1.0-1.x86_64.rpm", "bar-1.0-1.x86_64.rpm"],
+            basedir=koji_dir,
+        )
+        return sorted(list(source), key=repr)
+
+    items = get_items()
+    assert len(items) == 4
+
+    monkeypatch.setattr(KojiSource, "_BUILD_CACHE_SIZE", 1)
+
+    assert get_items() == items
+
+
+def test_koji_build_evicted_missing(fake_koji):
+    """An evicted build which is no longer in koji is cached as missing."""
+
+    source = KojiSource("https://koji.example.com/")
+
+    assert source._get_build(1234) is None
+    assert source._build_cache[1234] is None
+
+
+def test_koji_tag(fake_koji, koji_dir):
+    """Koji source can yield RPMs and builds from a tag via bulk queries."""
+
+    foo_rpms = ["foo-1.0-1.%s.rpm" % arch for arch in ("src", "x86_64")]
+    fake_koji.insert_rpms(foo_rpms, build_nvr="foo-1.0-1")
+    fake_koji.insert_rpms(["bar-2.0-1.x86_64.rpm"], build_nvr="bar-2.0-1")
+    fake_koji.insert_modules(["modulemd.x86_64.txt"], build_nvr="mod-1.0-1")
+    fake_koji.tag_data["my-tag"] = ["foo-1.0-1", "bar-2.0-1", ("mod-1.0-1", "module")]
+
+    expected = sorted(
+        Source.get(
+            "koji:https://koji.example.com/?module_build=mod-1.0-1",
+            rpm=foo_rpms + ["bar-2.0-1.x86_64.rpm"],
+            basedir=koji_dir,
+        ),
+        key=repr,
+    )
+    assert len(expected) == 4
+
+    cache = {}
+    items = sorted(
+        Source.get(
+            "koji:https://koji.example.com/?tag=my-tag&tag_type=rpm,module",
+            basedir=koji_dir,
+            cache=cache,
+        ),
+        key=repr,
+    )
+
+    # It should find the same items from the tag
+    assert items == expected
+
+    # RPMs and their builds came from listTaggedRPMS, so only the tag queries
+    # and the getBuild & listArchives for the module build were needed
+    assert cache["stats"]["calls"] == 4
+
+
+def test_koji_tag_signatures_async(fake_koji, koji_dir, monkeypatch):
+    """Koji source can query signatures of RPMs from a tag, including when
+    iterated with 'async for'."""
+
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": fake_koji.async_transport()}
+    )
+
+    foo_rpms = ["foo-1.0-1.%s.rpm" % arch for arch in ("src", "x86_64")]
+    fake_koji.insert_rpms(
+        foo_rpms, build_nvr="foo-1.0-1", koji_dir=koji_dir, signing_key="abcd1234"
+    )
+    fake_koji.tag_data["my-tag"] = ["foo-1.0-1"]
+
+    source_ctor = Source.get_partial(
+        "koji:https://koji.example.com/?query_signatures=1",
+        basedir=koji_dir,
+        signing_key="ABCD1234",
+    )
+
+    expected = sorted(source_ctor(rpm=foo_rpms), key=repr)
+    assert [i.state for i in expected] == ["PENDING", "PENDING"]
+
+    async def get_items():
+        with source_ctor(tag="my-tag") as source:
+            return sorted([item async for item in source], key=repr)
+
+    assert sorted(source_ctor(tag="my-tag"), key=repr) == expected
+    assert asyncio.run(get_items()) == expected
+
+
+def test_koji_tag_bad_type():
+    """Koji source rejects unknown tag types."""
+
+    with raises(ValueError) as exc_info:
+        Source.get("koji:https://koji.example.com/?tag=my-tag&tag_type=foo")
+
+    assert "Unsupported tag_type: foo" in str(exc_info.value)
@@ -0,0 +1,179 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pytest import raises
+
+from pushsource import Source, RpmPushItem
+from pushsource._impl.backend.koji_aggregator import KojiCallAggregator
+
+from .fake_koji import FakeMulticall, FakeKojiSession
+
+URL = "https://koji.example.com/"
+
+
+def test_koji_aggregate_concurrent_sources(fake_koji, koji_dir, monkeypatch):
+    """Calls from concurrent sources are merged into shared multicalls."""
+
+    # Use a window long enough that all sources will join each round
+    aggregator = KojiCallAggregator(window=0.5, max_rounds=4)
+    monkeypatch.setattr("pushsource._impl.backend.koji_source.AGGREGATOR", aggregator)
+
+    filenames = ["foo%s-1.0-1.x86_64.rpm" % i for i in range(8)]
+    for filename in filenames:
+        fake_koji.insert_rpms([filename], build_nvr=filename[:-11])
+
+    def get_items(filename):
+        source = Source.get(
+            "koji:https://koji.example.com/?rpm=%s&aggregate=1" % filename,
+            basedir=koji_dir,
+            threads=1,
+        )
+        with source:
+            return list(source)
+
+    with ThreadPoolExecutor(len(filenames)) as executor:
+        results = list(executor.map(get_items, filenames))
+
+    # Each source should have found its own RPM
+    for filename, items in zip(filenames, results):
+        assert items == [
+            RpmPushItem(
+                name=filename,
+                src="%s/packages/%s/1.0/1/x86_64/%s"
+                % (koji_dir, filename[:-17], filename),
+                build=filename[:-11],
+            )
+        ]
+
+    # Without aggregation, each source makes 2 multicalls (getRPM, then getBuild).
+    # With aggregation, sources share them.
+    assert fake_koji.multicall_count == 2
+
+
+def test_koji_aggregate_errors_isolated(fake_koji, koji_dir, monkeypatch):
+    """Errors in calls made for one source don't affect other sources."""
+
+    aggregator = KojiCallAggregator(window=0.5, max_rounds=4)
+    monkeypatch.setattr("pushsource._impl.backend.koji_source.AGGREGATOR", aggregator)
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.rpm_data["bar-1.0-1.x86_64.rpm"] = RuntimeError("simulated error")
+
+    def get_items(filename):
+        source = Source.get(
+            "koji:https://koji.example.com/?rpm=%s&aggregate=1" % filename,
+            basedir=koji_dir,
+            threads=1,
+        )
+        with source:
+            return list(source)
+
+    with ThreadPoolExecutor(2) as executor:
+        good = executor.submit(get_items, "foo-1.0-1.x86_64.rpm")
+        bad = executor.submit(get_items, "bar-1.0-1.x86_64.rpm")
+
+        assert [item.name for item in good.result()] == ["foo-1.0-1.x86_64.rpm"]
+
+        with raises(RuntimeError) as exc_info:
+            bad.result()
+
+    assert "simulated error" in str(exc_info.value)
+
+
+def test_koji_aggregate_call_api(fake_koji):
+    """Aggregated calls behave like calls in a koji multicall."""
+
+    aggregator = KojiCallAggregator(window=0, max_rounds=4)
+    multicall = aggregator.multicall(URL)
+
+    with raises(AttributeError):
+        multicall._foo  # pylint: disable=pointless-statement
+
+    call = multicall.getBuild(1234)
+
+    # Result can't be used until executed
+    with raises(RuntimeError) as exc_info:
+        call.result  # pylint: disable=pointless-statement
+    assert "before done" in str(exc_info.value)
+
+    multicall.call_all()
+    assert call.result is None
+
+
+def test_koji_aggregate_multicall_error(fake_koji, monkeypatch):
+    """A failing shared multicall raises for every source in it."""
+
+    aggregator = KojiCallAggregator(window=0.5, max_rounds=4)
+    batches = []
+
+    def call_all(self, strict=None, batch=None):
+        raise RuntimeError("simulated error")
+
+    def multicall(self, strict=None, batch=None):
+        batches.append(batch)
+        return FakeMulticall(self)
+
+    monkeypatch.setattr(FakeMulticall, "call_all", call_all)
+    monkeypatch.setattr(FakeKojiSession, "multicall", multicall)
+
+    def execute(batch):
+        multicall = aggregator.multicall(URL, batch=batch)
+        multicall.getBuild(1234)
+        multicall.call_all()
+
+    with ThreadPoolExecutor(3) as executor:
+        fs = [executor.submit(execute, batch) for batch in (None, 20, 10)]
+
+        for f in fs:
+            with raises(RuntimeError) as exc_info:
+                f.result()
+            assert "simulated error" in str(exc_info.value)
+
+    # It was a single multicall, using the smallest requested batch size
+    assert batches == [10]
+
+
+def test_koji_aggregate_max_rounds(fake_koji, monkeypatch):
+    """A round waiting for a running round keeps accepting calls, then runs."""
+
+    aggregator = KojiCallAggregator(window=0, max_rounds=1)
+    release = threading.Event()
+    calls_per_multicall = []
+    orig_call_all = FakeMulticall.call_all
+
+    def call_all(self, strict=None, batch=None):
+        calls_per_multicall.append(len(self._pending))
+        if len(calls_per_multicall) == 1:
+            assert release.wait(10.0)
+        return orig_call_all(self, strict, batch)
+
+    monkeypatch.setattr(FakeMulticall, "call_all", call_all)
+
+    def execute():
+        multicall = aggregator.multicall(URL, strict=True)
+        call = multicall.getBuild(1234)
+        multicall.call_all()
+        return call.result
+
+    def wait_for(condition):
+        deadline = time.monotonic() + 10.0
+        while not condition():
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+
+    with ThreadPoolExecutor(3) as executor:
+        # First round is running, and blocks
+        fs = [executor.submit(execute)]
+        wait_for(lambda: calls_per_multicall)
+
+        # Next round waits for it, while more calls join
+        fs.append(executor.submit(execute))
+        wait_for(lambda: URL in aggregator._open)
+        fs.append(executor.submit(execute))
+        wait_for(lambda: aggregator._open[URL].sources == 2)
+
+        release.set()
+        assert [f.result() for f in fs] == [None, None, None]
+
+    assert calls_per_multicall == [1, 2]
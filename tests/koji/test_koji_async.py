@@ -0,0 +1,160 @@
+import asyncio
+
+import httpx
+import koji
+import mock
+from pytest import fixture, mark, raises, PytestUnhandledThreadExceptionWarning
+
+from pushsource._impl.backend import koji_async
+from pushsource._impl.backend.koji_async import (
+    AsyncKojiSession,
+    async_session,
+    release_async_session,
+)
+
+URL = "https://koji.example.com/"
+
+# Un-awaited coroutines and errors in threads should fail tests rather than
+# going unnoticed.
+pytestmark = [
+    mark.filterwarnings("error::RuntimeWarning"),
+    mark.filterwarnings("error", category=PytestUnhandledThreadExceptionWarning),
+]
+
+
+def response(result):
+    body = koji.dumps((result,), methodresponse=1, allow_none=1)
+    return httpx.Response(200, content=body.encode("utf-8"))
+
+
+class FakeHub(object):
+    # Serves queued responses to requests from the async client, in order.
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+
+    def handler(self, request):
+        self.requests.append(request)
+        out = self.responses.pop(0)
+        if isinstance(out, Exception):
+            raise out
+        return out
+
+
+@fixture
+def hub(monkeypatch):
+    out = FakeHub()
+    monkeypatch.setattr(
+        koji_async, "CLIENT_ARGS", {"transport": httpx.MockTransport(out.handler)}
+    )
+    yield out
+
+
+@fixture(autouse=True)
+def no_sleep():
+    # Retries happen without delay
+    sleep = mock.Mock()
+
+    async def fake_sleep(delay):
+        sleep(delay)
+
+    with mock.patch("asyncio.sleep", new=fake_sleep):
+        yield sleep
+
+
+def call(method, *args):
+    async def do_call():
+        async with AsyncKojiSession(URL, 4) as session:
+            return await session.call(method, *args)
+
+    return asyncio.run(do_call())
+
+
+def test_async_call_retries(hub, no_sleep):
+    """Calls are retried on connection errors and server errors."""
+
+    hub.responses.extend(
+        [
+            httpx.ConnectError("simulated error"),
+            httpx.Response(503),
+            response("1.33.0"),
+        ]
+    )
+
+    assert call("getKojiVersion") == "1.33.0"
+    assert len(hub.requests) == 3
+    assert [c.args for c in no_sleep.call_args_list] == [(2,), (4,)]
+
+
+def test_async_call_retries_exhausted(hub):
+    """Calls fail once all attempts have failed."""
+
+    hub.responses.extend([httpx.Response(500)] * 3)
+
+    with raises(httpx.HTTPStatusError):
+        call("getKojiVersion")
+    assert len(hub.requests) == 3
+
+
+def test_async_call_client_error(hub):
+    """Calls failing due to client errors are not retried."""
+
+    hub.responses.append(httpx.Response(403))
+
+    with raises(httpx.HTTPStatusError):
+        call("getKojiVersion")
+    assert len(hub.requests) == 1
+
+
+def test_async_call_fault(hub):
+    """Faults are raised as the corresponding koji exceptions."""
+
+    body = koji.dumps(koji.Fault(1000, "simulated fault"), methodresponse=1)
+    hub.responses.append(httpx.Response(200, content=body.encode("utf-8")))
+
+    with raises(koji.GenericError) as exc_info:
+        call("getBuild", 1234)
+    assert "simulated fault" in str(exc_info.value)
+
+
+def test_async_multicall_strict(hub):
+    """Strict multicalls raise the first fault among their calls."""
+
+    hub.responses.append(
+        response([["ok"], {"faultCode": 1000, "faultString": "simulated fault"}])
+    )
+
+    async def do_multicall():
+        async with AsyncKojiSession(URL, 4) as session:
+            multicall = session.multicall(strict=True)
+            with raises(AttributeError):
+                multicall._foo  # pylint: disable=pointless-statement
+            multicall.getBuild(1)
+            multicall.getBuild(2)
+            await multicall.call_all()
+
+    with raises(koji.GenericError) as exc_info:
+        asyncio.run(do_multicall())
+    assert "simulated fault" in str(exc_info.value)
+
+
+def test_async_session_shared(hub):
+    """Sessions are shared by users of a loop and closed once all are done."""
+
+    async def use_sessions():
+        session1 = async_session(URL)
+        session2 = async_session(URL)
+        assert session1 is session2
+
+        await release_async_session(session1)
+        assert not session1._client.is_closed
+
+        await release_async_session(session2)
+        assert session1._client.is_closed
+
+        # A new session is created for any later users
+        session3 = async_session(URL)
+        assert session3 is not session1
+        await release_async_session(session3)
+
+    asyncio.run(use_sessions())
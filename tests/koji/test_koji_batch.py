@@ -0,0 +1,174 @@
+from pushsource import Source
+from pushsource._impl.backend.koji_source import KojiSource
+from pytest import raises
+
+from pushsource._impl.backend.koji_batch import (
+    AdaptiveBatchSize,
+    parse_batch_size,
+    results_size,
+)
+
+
+def test_batch_size_adapts():
+    """Cost of calls is learned separately per method, within bounds."""
+
+    sizer = AdaptiveBatchSize(10, 500, initial=100)
+
+    # Before anything is known, initial size is used
+    assert sizer.get("getRPM") == 100
+
+    # Fast calls with small responses should allow the largest batches
+    sizer.record({"getRPM": 100}, 0.1, {"getRPM": 100 * 1000})
+    assert sizer.get("getRPM") == 500
+
+    # Calls with huge responses should get small batches
+    sizer.record({"listArchives": 10}, 0.1, {"listArchives": 10 * 1024 * 1024})
+    assert sizer.get("listArchives") == 10
+
+    # Calls which are slow but small get batches sized to target latency
+    sizer.record({"getBuild": 100}, 10.0, {"getBuild": 100})
+    assert sizer.get("getBuild") == 20
+
+    # Each method remains independent
+    assert sizer.get("getRPM") == 500
+
+
+def test_batch_size_moving_average():
+    """Batch sizes are based on a moving average of observations."""
+
+    sizer = AdaptiveBatchSize(10, 500, initial=100)
+
+    sizer.record({"getBuild": 100}, 10.0, {"getBuild": 100})
+    assert sizer.get("getBuild") == 20
+
+    # Average of 0.1s and 0.02s per call
+    sizer.record({"getBuild": 100}, 2.0, {"getBuild": 100})
+    assert sizer.get("getBuild") == 33
+
+    # Nothing is learned from empty multicalls
+    sizer.record({"getBuild": 0}, 0.0, {})
+    assert sizer.get("getBuild") == 33
+
+
+def test_batch_mixed_methods():
+    """Calls to different methods share a batch, sized by their total cost."""
+
+    sizer = AdaptiveBatchSize(10, 500, initial=100)
+
+    # Time is attributed to methods in proportion to their results' size:
+    # here, getBuild takes 1.5s (0.015s per call) and listArchives 0.5s
+    # (0.05s per call).
+    sizer.record(
+        {"getBuild": 100, "listArchives": 10},
+        2.0,
+        {"getBuild": 300, "listArchives": 100},
+    )
+    assert sizer.get("getBuild") == 133
+    assert sizer.get("listArchives") == 40
+
+    # A batch is full once the total cost of its calls reaches the target
+    assert not sizer.full({"getBuild": 66, "listArchives": 19})
+    assert sizer.full({"getBuild": 67, "listArchives": 20})
+
+    # Unknown methods are costed as per the initial batch size
+    assert not sizer.full({"getBuild": 66, "getRPM": 49})
+    assert sizer.full({"getBuild": 67, "getRPM": 50})
+
+    # Batches are never smaller than the minimum...
+    assert not sizer.full({"listArchives": 9, "getBuild": 0})
+
+    # ...nor larger than the maximum
+    cheap = AdaptiveBatchSize(10, 500, initial=100)
+    cheap.record({"getRPM": 100}, 0.0, {"getRPM": 100})
+    assert cheap.full({"getRPM": 500})
+    assert not cheap.full({"getRPM": 499})
+
+    # Without results, time is attributed by number of calls
+    sizer = AdaptiveBatchSize(10, 500, initial=100)
+    sizer.record({"getBuild": 30, "getRPM": 10}, 4.0, {})
+    assert sizer.get("getBuild") == 20
+    assert sizer.get("getRPM") == 20
+
+
+def test_results_size():
+    """Size of results is estimated from a sample."""
+
+    assert results_size([]) == 0
+    assert results_size([{"id": 1}]) == len('[{"id": 1}]')
+
+    # Results of similar size give a close estimate
+    results = [{"id": i, "nvr": "foo-1.0-%s" % i} for i in range(1000)]
+    exact = sum(len(str(r)) for r in results)
+    assert 0.9 * exact < results_size(results) < 1.1 * exact
+
+
+def test_parse_batch_size():
+    """Batch size is a number of calls or 'auto'."""
+
+    assert parse_batch_size("50") == 50
+    assert parse_batch_size("auto") == "auto"
+
+    with raises(ValueError):
+        parse_batch_size("lots")
+
+
+def test_koji_adaptive_batch(fake_koji, koji_dir, monkeypatch):
+    """Koji source with adaptive batch size yields the same items as otherwise."""
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(
+        ["modulemd.x86_64.txt", "modulemd.s390x.txt"], build_nvr="foo-1.0-1"
+    )
+
+    url = (
+        "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm,notfound-1.0-1.noarch.rpm"
+        "&module_build=foo-1.0-1"
+    )
+
+    with Source.get(url, basedir=koji_dir) as source:
+        items = sorted(list(source), key=repr)
+
+    monkeypatch.setattr(KojiSource, "_BATCH_SIZE", "auto")
+    cache = {}
+    with Source.get(url, basedir=koji_dir, cache=cache) as source:
+        adaptive_items = sorted(list(source), key=repr)
+
+    # Batch sizing should make no difference to the output
+    assert len(items) == 4
+    assert adaptive_items == items
+
+    # It should have learned sizes for each method used, within bounds
+    sizer = cache["batch_sizer"]
+    for method in ("getRPM", "getBuild", "listArchives"):
+        assert 10 <= sizer.get(method) <= 1000
+
+
+def test_koji_adaptive_batch_shared(fake_koji, koji_dir, monkeypatch):
+    """Koji source with adaptive batch size makes calls to different methods
+    in the same multicall."""
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+    fake_koji.insert_modules(["modulemd.x86_64.txt"], build_nvr="foo-1.0-1")
+
+    monkeypatch.setattr(KojiSource, "_BATCH_SIZE", "auto")
+
+    multicalls = []
+    orig_call_all = KojiSource._call_all
+
+    def call_all(self, session, counts, commands):
+        multicalls.append(dict(counts))
+        return orig_call_all(self, session, counts, commands)
+
+    monkeypatch.setattr(KojiSource, "_call_all", call_all)
+
+    url = (
+        "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm"
+        "&module_build=foo-1.0-1"
+    )
+    with Source.get(url, basedir=koji_dir, cache={}) as source:
+        items = list(source)
+
+    assert len(items) == 2
+
+    # The RPM and the module build were looked up in a single multicall
+    assert {"getRPM": 1, "getBuild": 1} in multicalls
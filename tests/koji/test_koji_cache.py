@@ -0,0 +1,101 @@
+from pytest import raises
+
+from pushsource._impl.backend.koji_cache import (
+    ProjectedCache,
+    project_build,
+    project_archives,
+)
+
+
+def test_projection_drops_unused_fields():
+    """Projection retains fields used by KojiSource and drops others."""
+
+    build = {
+        "id": 123,
+        "nvr": "foo-1.0-1",
+        "owner_name": "someone",
+        "extra": {
+            "typeinfo": {"image": {"media_types": ["a"], "parent_images": ["x"]}},
+            "osbs_build": {"kind": "container_build"},
+        },
+    }
+    archive = {
+        "filename": "foo.tar",
+        "buildroot_id": 1,
+        "extra": {
+            "docker": {
+                "tags": ["latest"],
+                "config": {
+                    "architecture": "amd64",
+                    "history": ["a", "b", "c"],
+                    "config": {"Labels": {"a": "b"}, "Env": ["X=1"]},
+                },
+            }
+        },
+    }
+
+    assert project_build(build) == {
+        "id": 123,
+        "nvr": "foo-1.0-1",
+        "extra": {"typeinfo": {"image": {"media_types": ["a"]}}},
+    }
+    assert project_archives([archive]) == [
+        {
+            "filename": "foo.tar",
+            "extra": {
+                "docker": {
+                    "tags": ["latest"],
+                    "config": {
+                        "architecture": "amd64",
+                        "config": {"Labels": {"a": "b"}},
+                    },
+                }
+            },
+        }
+    ]
+
+    # Missing builds are retained as-is
+    assert project_build(None) is None
+
+
+def test_cache_aliases_and_eviction():
+    """Values are stored once under all keys and evicted by LRU."""
+
+    cache = ProjectedCache(project_build, max_entries=2)
+
+    cache.put({"id": 1, "nvr": "a-1-1"}, [1, "a-1-1"])
+    cache.put({"id": 2, "nvr": "b-1-1"}, [2, "b-1-1"])
+
+    # Each value is stored once, and found via any key
+    assert len(cache) == 2
+    assert cache["a-1-1"] is cache[1]
+
+    # 'a' is now most recently used, so adding another value evicts 'b'
+    cache["c-1-1"] = None
+    assert len(cache) == 2
+    assert 1 in cache
+    assert "b-1-1" not in cache
+    assert cache["c-1-1"] is None
+
+    with raises(KeyError):
+        cache[2]
+
+
+def test_cache_rekeyed():
+    """Storing a value under a key held by another value replaces that value."""
+
+    cache = ProjectedCache(project_build, max_entries=10)
+
+    cache.put({"id": 1, "nvr": "a-1-1"}, [1, "a-1-1"])
+
+    # Keys are added to an existing value
+    cache.put({"id": 1, "nvr": "a-1-1"}, [1, "a-1-1-alias"])
+    assert len(cache) == 1
+    assert cache["a-1-1"] is cache["a-1-1-alias"]
+
+    # The nvr now refers to some other build, so the old one is dropped
+    cache.put({"id": 2, "nvr": "a-1-1"}, [2, "a-1-1"])
+    assert len(cache) == 1
+    assert cache["a-1-1"]["id"] == 2
+    assert 1 not in cache
+    assert "a-1-1-alias" not in cache
@@ -0,0 +1,339 @@
+import hashlib
+import os
+from types import SimpleNamespace
+
+import mock
+import requests_mock
+from pytest import raises
+
+from pushsource import Source, RpmPushItem
+from pushsource._impl.backend.koji_source import KojiSource
+from pushsource._impl.utils.http_opener import HttpOpener
+
+DATADIR = os.path.join(os.path.dirname(__file__), "data")
+
+TOPURL = "https://kojipkgs.example.com/"
+
+with open(os.path.join(DATADIR, "rpms", "walrus-5.21-1.noarch.rpm"), "rb") as f:
+    RPM_CONTENT = f.read()
+
+
+def ranged_content(content):
+    # A requests_mock callback serving content, honoring any Range header.
+    def callback(request, context):
+        byte_range = request.headers.get("Range")
+        if not byte_range:
+            return content
+        start, end = byte_range.split("=")[1].split("-")
+        context.status_code = 206
+        return content[int(start) : int(end) + 1]
+
+    return callback
+
+
+def test_koji_http_rpm(fake_koji, koji_dir):
+    """RPMs are located and read over HTTP if topurl is provided."""
+
+    fake_koji.rpm_data["foo-1.0-1.x86_64.rpm"] = {
+        "arch": "x86_64",
+        "name": "foo",
+        "version": "1.0",
+        "release": "1",
+        "build_id": 1234,
+    }
+    fake_koji.build_data[1234] = {
+        "id": 1234,
+        "name": "foobuild",
+        "version": "1.0",
+        "release": "1.el8",
+        "nvr": "foobuild-1.0-1.el8",
+        "volume_name": "somevol",
+    }
+
+    build_url = TOPURL + "vol/somevol/packages/foobuild/1.0/1.el8/"
+    signed_url = build_url + "data/signed/f78fb195/x86_64/foo-1.0-1.x86_64.rpm"
+
+    source = Source.get(
+        "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm",
+        basedir=koji_dir,
+        topurl=TOPURL,
+        signing_key=["ABC123", "F78FB195"],
+    )
+
+    with requests_mock.Mocker() as m:
+        m.head(
+            build_url + "data/signed/abc123/x86_64/foo-1.0-1.x86_64.rpm",
+            status_code=404,
+        )
+        m.head(signed_url)
+        m.get(signed_url, content=RPM_CONTENT)
+
+        items = list(source)
+
+        # It should have found the RPM and its signing key, without any
+        # local files
+        assert items == [
+            RpmPushItem(
+                name="foo-1.0-1.x86_64.rpm",
+                src=os.path.join(
+                    koji_dir,
+                    "vol/somevol/packages/foobuild/1.0/1.el8",
+                    "data/signed/f78fb195/x86_64/foo-1.0-1.x86_64.rpm",
+                ),
+                build="foobuild-1.0-1.el8",
+                signing_key="f78fb195",
+                opener=HttpOpener(koji_dir, TOPURL),
+            )
+        ]
+
+        # Content can be read and checksummed over HTTP
+        item = items[0]
+        assert item.content().read() == RPM_CONTENT
+        assert (
+            item.with_checksums().sha256sum == hashlib.sha256(RPM_CONTENT).hexdigest()
+        )
+
+
+def test_http_opener_ranges_and_cache(tmpdir):
+    """Large files are downloaded in ranges, and cached by content."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL, cache_dir=str(tmpdir), threads=3)
+    opener.RANGE_THRESHOLD = 100
+    opener.RANGE_SIZE = 1000
+
+    path = "/mnt/koji/packages/foo/foo.rpm"
+    url = TOPURL + "packages/foo/foo.rpm"
+    opener.add_checksum(path, "sha256", hashlib.sha256(RPM_CONTENT).hexdigest())
+
+    with requests_mock.Mocker() as m:
+        m.head(
+            url,
+            headers={
+                "Accept-Ranges": "bytes",
+                "Content-Length": str(len(RPM_CONTENT)),
+            },
+        )
+        m.get(url, content=ranged_content(RPM_CONTENT))
+
+        with opener.open(path) as f:
+            assert f.read() == RPM_CONTENT
+
+        # HEAD to probe the file, then one GET per range
+        methods = [r.method for r in m.request_history]
+        ranges = [r.headers.get("Range") for r in m.request_history]
+        assert methods[0] == "HEAD"
+        assert methods[1:] == ["GET"] * ((len(RPM_CONTENT) + 999) // 1000)
+        assert "bytes=0-999" in ranges
+
+        # Every request has a timeout
+        assert all(r.timeout == opener._timeout for r in m.request_history)
+
+        # Opening again uses the cache
+        calls = m.call_count
+        with opener.open(path) as f:
+            assert f.read() == RPM_CONTENT
+        assert m.call_count == calls
+
+    # Cache is content-addressed
+    digest = hashlib.sha256(RPM_CONTENT).hexdigest()
+    assert os.path.exists(str(tmpdir.join("sha256", digest[:2], digest)))
+
+
+def test_http_opener_checksum_mismatch(tmpdir):
+    """Content not matching known checksums raises, and is not cached."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL, cache_dir=str(tmpdir))
+    opener.add_checksum("/mnt/koji/foo.txt", "md5", "0" * 32)
+
+    with requests_mock.Mocker() as m:
+        m.head(TOPURL + "foo.txt")
+        m.get(TOPURL + "foo.txt", content=b"hello")
+
+        with raises(ValueError) as exc_info:
+            opener.open("/mnt/koji/foo.txt")
+
+    assert "md5 checksum mismatch" in str(exc_info.value)
+    assert not tmpdir.join("sha256").check()
+    assert tmpdir.join("tmp").listdir() == []
+
+
+def test_http_opener_outside_topdir():
+    """Paths outside of topdir can't be opened."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL)
+
+    with raises(ValueError) as exc_info:
+        opener.url("/etc/passwd")
+
+    assert "/etc/passwd is not located under /mnt/koji/" in str(exc_info.value)
+
+
+def test_http_opener_ranges_not_honored():
+    """Servers ignoring range requests are detected."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL)
+    opener.RANGE_THRESHOLD = 100
+    url = TOPURL + "foo.rpm"
+
+    with requests_mock.Mocker() as m:
+        m.head(
+            url,
+            headers={"Accept-Ranges": "bytes", "Content-Length": str(len(RPM_CONTENT))},
+        )
+        m.get(url, content=RPM_CONTENT)
+
+        with raises(IOError) as exc_info:
+            opener.open("/mnt/koji/foo.rpm")
+
+    assert "Range request not honored for %s" % url in str(exc_info.value)
+
+
+def test_http_opener_incomplete_range():
+    """Ranges with less content than requested are detected."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL)
+    opener.RANGE_THRESHOLD = 100
+    url = TOPURL + "foo.rpm"
+
+    with requests_mock.Mocker() as m:
+        m.head(url, headers={"Accept-Ranges": "bytes", "Content-Length": "200"})
+        m.get(url, status_code=206, content=b"x" * 150)
+
+        with raises(IOError) as exc_info:
+            opener.open("/mnt/koji/foo.rpm")
+
+    assert "Incomplete range 0-199 of %s (got 150 bytes)" % url in str(exc_info.value)
+
+
+def test_http_opener_item_checksums():
+    """Content is verified against the checksums of the push item."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL)
+    item = RpmPushItem(
+        name="foo.rpm",
+        src="/mnt/koji/foo.rpm",
+        sha256sum=hashlib.sha256(RPM_CONTENT).hexdigest(),
+        md5sum="0" * 32,
+    )
+
+    with requests_mock.Mocker() as m:
+        m.head(TOPURL + "foo.rpm")
+        m.get(TOPURL + "foo.rpm", content=RPM_CONTENT)
+
+        with raises(ValueError) as exc_info:
+            opener(item)
+
+        assert "md5 checksum mismatch" in str(exc_info.value)
+
+        # Checksums of unexpected length are not used
+        item = SimpleNamespace(src="/mnt/koji/foo.rpm", md5sum="abc123")
+        assert opener(item).read() == RPM_CONTENT
+
+
+def test_http_opener_equality():
+    """Openers for the same location are equal."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL)
+
+    assert opener == HttpOpener("/mnt/koji/", TOPURL, threads=8)
+    assert opener != HttpOpener("/mnt/other", TOPURL)
+    assert opener != "/mnt/koji"
+    assert hash(opener) == hash(HttpOpener("/mnt/koji", TOPURL))
+    assert repr(opener) == "HttpOpener('/mnt/koji/', '%s')" % TOPURL
+
+
+def test_http_opener_close():
+    """Closing an opener releases its connections, and it can still be used."""
+
+    opener = HttpOpener("/mnt/koji", TOPURL)
+    opener.RANGE_THRESHOLD = 100
+    opener.RANGE_SIZE = 1000
+    url = TOPURL + "foo.rpm"
+
+    with requests_mock.Mocker() as m:
+        m.head(
+            url,
+            headers={"Accept-Ranges": "bytes", "Content-Length": str(len(RPM_CONTENT))},
+        )
+        m.get(url, content=ranged_content(RPM_CONTENT))
+
+        assert opener.open("/mnt/koji/foo.rpm").read() == RPM_CONTENT
+        session = opener._session
+        executor = opener._executor
+        assert executor
+
+        with mock.patch.object(session, "close") as close:
+            opener.close()
+        close.assert_called_once_with()
+        assert executor._shutdown
+        assert opener._executor is None
+
+        # Opener can be used again, with new connections
+        assert opener.open("/mnt/koji/foo.rpm").read() == RPM_CONTENT
+        assert opener._session is not session
+
+    opener.close()
+
+
+def test_koji_http_module(fake_koji, koji_dir):
+    """Modules are read over HTTP, and verified using koji's checksums."""
+
+    with open(os.path.join(DATADIR, "modulemd-varnish-x86_64.yaml"), "rb") as f:
+        content = f.read()
+
+    fake_koji.insert_archives(
+        [
+            {
+                "btype": "module",
+                "filename": "modulemd.x86_64.txt",
+                "nvr": "varnish-6.0-1",
+                "checksum": hashlib.sha256(content).hexdigest(),
+                # As returned by koji: an ID rather than a name
+                "checksum_type": 2,
+            }
+        ],
+        build_nvr="varnish-6.0-1",
+    )
+    url = TOPURL + "packages/varnish/6.0/1/files/module/modulemd.x86_64.txt"
+
+    source = Source.get(
+        "koji:https://koji.example.com/?module_build=varnish-6.0-1",
+        basedir=koji_dir,
+        topurl=TOPURL,
+    )
+
+    with requests_mock.Mocker() as m:
+        m.head(url)
+        m.get(url, content=content)
+
+        items = list(source)
+
+        assert [i.name for i in items] == [
+            "varnish:6.0:3220200215073318:43bbeeef:x86_64"
+        ]
+        assert items[0].content().read() == content
+
+
+def test_koji_source_files(koji_dir):
+    """Files needed by koji source itself are read locally, or over HTTP
+    if topurl is provided."""
+
+    path = os.path.join(koji_dir, "packages/foo/1.0/1/images/meta.json")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write("{}")
+
+    local = KojiSource("https://koji.example.com/", basedir=koji_dir)
+    with mock.patch("pushsource._impl.backend.koji_source.wait_exist") as wait_exist:
+        assert local._exists(path, timeout=30, poll_rate=5)
+    wait_exist.assert_called_once_with(path, 30, 5)
+    with local._open(path) as f:
+        assert f.read() == b"{}"
+
+    remote = KojiSource("https://koji.example.com/", basedir=koji_dir, topurl=TOPURL)
+    url = TOPURL + "packages/foo/1.0/1/images/meta.json"
+    with requests_mock.Mocker() as m:
+        m.head(url)
+        m.get(url, content=b'{"remote": true}')
+        with remote._open(path) as f:
+            assert f.read() == b'{"remote": true}'
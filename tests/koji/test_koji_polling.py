@@ -15,8 +15,8 @@ DATADIR = os.path.join(os.path.dirname(__file__), "data")
 )
 @patch("pushsource._impl.helpers.os.path.exists")
 @patch("pushsource._impl.helpers.time.sleep")
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header")
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
+@patch("pushsource._impl.backend.rpm_keys.rpmlib.get_keys_from_header")
+@patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header")
 def test_koji_poll_for_signed_rpm_highest_priority_key_present(
     mock_get_rpm_header,
     mock_get_keys_from_headers,
@@ -79,8 +79,8 @@ def test_koji_poll_for_signed_rpm_highest_priority_key_present(
 )
 @patch("pushsource._impl.helpers.os.path.exists")
 @patch("pushsource._impl.helpers.time.sleep")
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_keys_from_header")
-@patch("pushsource._impl.backend.koji_source.rpmlib.get_rpm_header")
+@patch("pushsource._impl.backend.rpm_keys.rpmlib.get_keys_from_header")
+@patch("pushsource._impl.backend.rpm_keys.rpmlib.get_rpm_header")
 def test_koji_poll_for_signed_rpm_highest_priority_key_absent(
     mock_get_rpm_header,
     mock_get_keys_from_headers,
@@ -0,0 +1,111 @@
+from mock import patch, MagicMock
+from pytest import raises
+
+from pushsource import Source
+from pushsource._impl.backend.koji_sessions import KojiSessionPool, SESSION_POOL
+
+
+def test_koji_sessions_reused(fake_koji, koji_dir):
+    """Koji sessions are reused across sources."""
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+
+    for _ in range(3):
+        source = Source.get(
+            "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm",
+            basedir=koji_dir,
+            threads=1,
+        )
+        assert len(list(source)) == 1
+
+    # Only a single session should have been needed, as each source could
+    # borrow the session used by the previous source.
+    assert fake_koji.session_count == 1
+
+
+def test_koji_session_pool_discards_broken():
+    """Sessions are discarded after errors or failed health checks."""
+
+    pool = KojiSessionPool(max_idle=2, check_after=0)
+
+    with patch("koji.ClientSession") as client_session:
+        client_session.side_effect = lambda *_: MagicMock()
+
+        # An error while using a session means it's not reused
+        with raises(RuntimeError):
+            with pool.session("https://koji.example.com/"):
+                raise RuntimeError("simulated error")
+        assert client_session.call_count == 1
+
+        with pool.session("https://koji.example.com/") as session:
+            pass
+        assert client_session.call_count == 2
+
+        # With check_after=0, the session will be health-checked before reuse;
+        # if the check fails, a new session should be created.
+        session.getKojiVersion.side_effect = RuntimeError("oops")
+        with pool.session("https://koji.example.com/") as new_session:
+            pass
+        assert client_session.call_count == 3
+
+        # The healthy session can be reused.
+        with pool.session("https://koji.example.com/") as reused_session:
+            pass
+        assert reused_session is new_session
+        assert client_session.call_count == 3
+
+
+def test_koji_session_pool_closes_discarded():
+    """Sessions leaving the pool are logged out and closed."""
+
+    pool = KojiSessionPool(max_idle=1, check_after=0)
+
+    with patch("koji.ClientSession") as client_session:
+        client_session.side_effect = lambda *_: MagicMock()
+
+        # Session discarded after an error
+        with raises(RuntimeError):
+            with pool.session("https://koji.example.com/") as broken:
+                raise RuntimeError("simulated error")
+        broken.logout.assert_called_once_with()
+        broken.rsession.close.assert_called_once_with()
+
+        # Session not retained since the pool is already full
+        with pool.session("https://koji.example.com/") as extra:
+            with pool.session("https://koji.example.com/") as idle:
+                pass
+        extra.logout.assert_called_once_with()
+        extra.rsession.close.assert_called_once_with()
+        idle.logout.assert_not_called()
+
+        # Session failing its health check
+        idle.getKojiVersion.side_effect = RuntimeError("oops")
+        with pool.session("https://koji.example.com/") as healthy:
+            pass
+        idle.logout.assert_called_once_with()
+        idle.rsession.close.assert_called_once_with()
+
+        # Idle sessions when the pool is cleared; an error logging out
+        # doesn't prevent closing the connection.
+        healthy.logout.side_effect = RuntimeError("logout failed")
+        pool.clear()
+        healthy.logout.assert_called_once_with()
+        healthy.rsession.close.assert_called_once_with()
+
+
+def test_koji_sessions_closed_on_clear(fake_koji, koji_dir):
+    """Pooled sessions are logged out once the pool is cleared."""
+
+    fake_koji.insert_rpms(["foo-1.0-1.x86_64.rpm"], build_nvr="foo-1.0-1")
+
+    with Source.get(
+        "koji:https://koji.example.com/?rpm=foo-1.0-1.x86_64.rpm",
+        basedir=koji_dir,
+        threads=1,
+    ) as source:
+        assert len(list(source)) == 1
+
+    assert fake_koji.logout_count == 0
+
+    SESSION_POOL.clear()
+    assert fake_koji.logout_count == fake_koji.session_count == 1
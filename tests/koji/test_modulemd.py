@@ -0,0 +1,180 @@
+import os
+
+from mock import patch
+from pytest import raises
+
+from pushsource._impl.backend import modulemd
+from pushsource._impl.backend.modulemd import Module, scan_fields
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def test_scan_matches_full_parse():
+    """Fields found by scanning a modulemd file match those from a full parse."""
+
+    with open(os.path.join(DATA_DIR, "modulemd-varnish-x86_64.yaml")) as f:
+        text = f.read()
+
+    scanned = scan_fields(text)
+    parsed = modulemd.yaml.load(text, Loader=modulemd.yaml.BaseLoader)["data"]
+
+    assert scanned == dict((key, parsed[key]) for key in modulemd.MOD_FIELDS)
+
+
+def test_scan_handles_any_style():
+    """Scanning finds fields written in any YAML style."""
+
+    assert scan_fields(
+        'data: {name: foo, stream: "s", version: 1, context: \'c\', arch: "x86\\x5f64"}'
+    ) == {
+        "name": "foo",
+        "stream": "s",
+        "version": "1",
+        "context": "c",
+        "arch": "x86_64",
+    }
+
+
+def test_scan_declines_unusual_documents():
+    """Scanning gives up on documents it can't reliably handle."""
+
+    fields = "  name: foo\n  stream: s\n  version: 1\n  context: c\n"
+
+    # Something it can handle, for comparison
+    assert scan_fields("---\ndata:\n" + fields + "  arch: x86_64\n...\n")
+
+    # Field which isn't a scalar
+    assert scan_fields("data:\n" + fields + "  arch: [x86_64]\n") is None
+    assert scan_fields("data:\n" + fields + "  arch: &a x86_64\n  arch: *a\n") is None
+
+    # Key which isn't a scalar
+    assert scan_fields("data:\n" + fields + "  ? [a]\n  : b\n") is None
+
+    # Missing a field
+    assert scan_fields("data:\n" + fields) is None
+    assert scan_fields("other:\n" + fields + "  arch: x86_64\n") is None
+    assert scan_fields("- data:\n" + fields + "  arch: x86_64\n") is None
+
+    # Fields nested too deep
+    nested = (fields + "  arch: x86_64\n").replace("  ", "    ")
+    assert scan_fields("data:\n  data:\n" + nested) is None
+
+    # Multiple documents
+    with open(os.path.join(DATA_DIR, "modulemd-multiple.yaml")) as f:
+        assert scan_fields(f) is None
+
+
+def test_scan_last_data_wins():
+    """As in a full load, the last of any duplicate keys is used."""
+
+    fields = "  name: foo\n  stream: s\n  version: 1\n  context: c\n"
+    text = "data:\n" + fields + "  arch: x86_64\n  arch: s390x\n"
+    assert scan_fields(text)["arch"] == "s390x"
+
+    text = "data:\n" + fields + "  arch: x86_64\ndata:\n  name: bar\n"
+    assert scan_fields(text) is None
+
+
+def test_scan_invalid_raises():
+    """Invalid YAML after the fields raises, as for a full load."""
+
+    fields = "  name: foo\n  stream: s\n  version: 1\n  context: c\n"
+    with raises(modulemd.yaml.YAMLError):
+        scan_fields("data:\n" + fields + "  arch: x86_64\n  artifacts: [\n")
+
+
+def test_from_file_full_parse(tmpdir):
+    """Files which can't be scanned are loaded by a full parse."""
+
+    path = tmpdir.join("modulemd.txt")
+    path.write("data:\n  name: foo\n  stream: s\n  version: 1\n  context: c\n")
+
+    with raises(KeyError):
+        Module.from_file(str(path))
+
+    path.write(
+        "data:\n  name: foo\n  stream: s\n  version: 1\n  context: &c c\n"
+        "  arch: x86_64\n  context: *c\n"
+    )
+    assert Module.from_file(str(path)).nsvca == "foo:s:1:c:x86_64"
+
+
+def test_from_text():
+    """Module can be obtained from text, including by a full parse."""
+
+    fields = "  name: foo\n  stream: s\n  version: 1\n  context: c\n"
+    assert Module.from_text("data:\n" + fields + "  arch: a\n").arch == "a"
+    assert Module.from_text("data:\n" + fields + "  arch: [a]\n").arch == ["a"]
+
+
+def test_modules_cached(tmpdir):
+    """Each modulemd file is only loaded once, unless modified."""
+
+    path = str(tmpdir.join("modulemd.x86_64.txt"))
+    with open(os.path.join(DATA_DIR, "modulemd-varnish-x86_64.yaml")) as f:
+        text = f.read()
+    with open(path, "w") as f:
+        f.write(text)
+
+    with patch.object(Module, "_load", wraps=Module._load) as load:
+        assert (
+            Module.from_file(path).nsvca
+            == "varnish:6.0:3220200215073318:43bbeeef:x86_64"
+        )
+        assert (
+            Module.from_file(path).nsvca
+            == "varnish:6.0:3220200215073318:43bbeeef:x86_64"
+        )
+        assert load.call_count == 1
+
+        with open(path, "w") as f:
+            f.write(text.replace("name: varnish", "name: other"))
+
+        assert Module.from_file(path).name == "other"
+        assert load.call_count == 2
+
+    # Invalid files still raise
+    with open(path, "w") as f:
+        f.write("data: [")
+    with raises(Exception):
+        Module.from_file(path)
+
+
+def test_modules_not_cached_if_missing(tmpdir):
+    """Files which can't be stat'd are loaded without caching."""
+
+    load = lambda fname: fname.upper()
+    cache = modulemd.ModuleCache()
+    path = str(tmpdir.join("missing"))
+
+    assert cache.get(path, load) == path.upper()
+    assert not cache._modules
+
+
+def test_modules_cache_bounded(tmpdir):
+    """The least recently used modules are evicted once the cache is full."""
+
+    cache = modulemd.ModuleCache()
+    cache.MAX_ENTRIES = 2
+    paths = []
+    for name in "abc":
+        path = tmpdir.join(name)
+        path.write(name)
+        paths.append(str(path))
+
+    loaded = []
+
+    def load(fname):
+        loaded.append(fname)
+        return fname
+
+    cache.get(paths[0], load)
+    cache.get(paths[1], load)
+    cache.get(paths[0], load)
+    cache.get(paths[2], load)
+    assert len(cache._modules) == 2
+
+    # b was least recently used, so it was evicted
+    cache.get(paths[0], load)
+    cache.get(paths[1], load)
+    assert loaded == [paths[0], paths[1], paths[2], paths[1]]
@@ -0,0 +1,39 @@
+"""Tests for parsing of erratum package lists."""
+
+import copy
+
+from pushsource import ErratumPackageCollection
+
+
+def test_pkglist_from_data_unmodified():
+    """Parsing a package list doesn't modify the input, so the same data can
+    be parsed repeatedly with identical results."""
+
+    data = [
+        {
+            "name": "collection1",
+            "short": "",
+            "packages": [
+                {
+                    "arch": "x86_64",
+                    "epoch": "0",
+                    "filename": "foo-1.0-1.x86_64.rpm",
+                    "name": "foo",
+                    "version": "1.0",
+                    "release": "1",
+                    "src": "foo-1.0-1.src.rpm",
+                    "sum": ["md5", "a" * 32, "sha256", "b" * 64],
+                }
+            ],
+        }
+    ]
+    orig_data = copy.deepcopy(data)
+
+    parsed = ErratumPackageCollection._from_data(data)
+    assert data == orig_data
+
+    assert parsed[0].packages[0].md5sum == "a" * 32
+    assert parsed[0].packages[0].sha256sum == "b" * 64
+    assert parsed[0].packages[0].sha1sum is None
+
+    assert ErratumPackageCollection._from_data(data) == parsed
@@ -0,0 +1,59 @@
+import asyncio
+
+from pushsource import Source, PushItem
+
+
+class BlockingSource(Source):
+    # A source which only supports blocking iteration.
+    def __init__(self, count):
+        self.count = count
+        self.yielded = 0
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            for i in range(self.count):
+                self.yielded += 1
+                yield PushItem(name="item%s" % i)
+        finally:
+            self.closed = True
+
+
+def test_async_blocking_source():
+    """Sources without async support can be used with 'async for'."""
+
+    source = BlockingSource(3)
+
+    async def get_items():
+        return [item.name async for item in Source.get("blocking:", source=source)]
+
+    Source.register_backend("blocking", lambda source: source)
+    try:
+        assert asyncio.run(get_items()) == ["item0", "item1", "item2"]
+    finally:
+        Source.reset()
+
+    assert source.closed
+
+
+def test_async_stop_early():
+    """Blocking iteration is ended if the consumer stops early."""
+
+    source = BlockingSource(100)
+
+    async def get_first():
+        items = Source.get("blocking:", source=source).__aiter__()
+        item = await items.__anext__()
+        await items.aclose()
+
+        # The generator was closed rather than left running
+        assert source.closed
+        return item.name
+
+    Source.register_backend("blocking", lambda source: source)
+    try:
+        assert asyncio.run(get_first()) == "item0"
+    finally:
+        Source.reset()
+
+    assert source.yielded == 1
@@ -0,0 +1,249 @@
+import io
+import os
+import shutil
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from mock import patch
+from pytest import mark, raises
+
+from pushsource import Source
+from pushsource._impl.backend import rpm_keys
+
+DATADIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+def test_staged_rpm_keys_cached(tmpdir, monkeypatch):
+    """RPM headers are parsed only once, even via hard links or across processes."""
+
+    staged_dir = str(tmpdir.join("staged"))
+    shutil.copytree(os.path.join(DATADIR, "simple_rpm"), staged_dir)
+
+    # Make the same RPM also appear in another dest via a hard link
+    os.makedirs(os.path.join(staged_dir, "dest2/RPMS"))
+    os.link(
+        os.path.join(staged_dir, "dest1/RPMS/walrus-5.21-1.noarch.rpm"),
+        os.path.join(staged_dir, "dest2/RPMS/walrus-5.21-1.noarch.rpm"),
+    )
+
+    monkeypatch.setenv("PUSHSOURCE_RPM_KEY_CACHE", str(tmpdir.join("keys.db")))
+
+    def get_keys():
+        items = Source.get("staged:" + staged_dir)
+        return sorted([(item.src, item.signing_key) for item in items])
+
+    with patch.object(
+        rpm_keys, "read_signing_key", wraps=rpm_keys.read_signing_key
+    ) as read_key:
+        keys = get_keys()
+
+        # It should have found the expected keys
+        assert [key for (_, key) in keys] == ["F78FB195", None, "F78FB195"]
+
+        # It should have only read each distinct file once
+        assert read_key.call_count == 2
+
+        # Getting the items again shouldn't read anything
+        assert get_keys() == keys
+        assert read_key.call_count == 2
+
+        # Even after the in-memory cache is lost, keys can be found in the
+        # persistent cache
+        rpm_keys.SIGNING_KEYS.clear()
+        assert get_keys() == keys
+        assert read_key.call_count == 2
+
+
+def test_read_signing_key():
+    """Signing keys can be read from the signature header alone."""
+
+    rpm_dir = os.path.join(DATADIR, "simple_rpm/dest1")
+
+    # Same results as rpmlib should be obtained for signed and unsigned RPMs
+    assert (
+        rpm_keys.read_signing_key(
+            os.path.join(rpm_dir, "RPMS/walrus-5.21-1.noarch.rpm")
+        )
+        == "F78FB195"
+    )
+    assert (
+        rpm_keys.read_signing_key(
+            os.path.join(rpm_dir, "SRPMS/test-srpm01-1.0-1.src.rpm")
+        )
+        is None
+    )
+
+    # Non-RPMs are rejected
+    with raises(ValueError) as exc_info:
+        rpm_keys.read_signing_key(os.path.join(rpm_dir, "RPMS/not-an-rpm.txt"))
+
+    assert "Not an RPM" in str(exc_info.value)
+
+
+def test_signing_key_falls_back_to_rpmlib(tmpdir):
+    """If the signature header can't be read, rpmlib is used instead."""
+
+    path = str(tmpdir.join("weird.rpm"))
+    open(path, "w").close()
+
+    with patch.object(rpm_keys.rpmlib, "get_rpm_header") as get_header:
+        with patch.object(
+            rpm_keys.rpmlib, "get_keys_from_header", return_value="ABC123"
+        ):
+            assert rpm_keys.get_signing_key(path) == "ABC123"
+
+    get_header.assert_called_once_with(path)
+
+
+def make_rpm(entries, data, sigtype=rpm_keys.RPM_SIGTYPE_HEADERSIG):
+    # Returns the start of an RPM with a signature header holding the given
+    # index entries (tag, type, offset, size) and data.
+    lead = rpm_keys.RPM_LEAD_MAGIC + b"\0" * 74 + struct.pack(">H", sigtype)
+    lead += b"\0" * (rpm_keys.RPM_LEAD_SIZE - len(lead))
+    intro = rpm_keys.HEADER_MAGIC + b"\0" * 4
+    intro += struct.pack(">II", len(entries), len(data))
+    index = b"".join(struct.pack(">IIII", *entry) for entry in entries)
+    return lead + intro + index + data
+
+
+with open(
+    os.path.join(DATADIR, "simple_rpm/dest1/RPMS/walrus-5.21-1.noarch.rpm"), "rb"
+) as f:
+    WALRUS = f.read()
+
+
+@mark.parametrize(
+    "content, message",
+    [
+        (WALRUS[:50], "Not an RPM"),
+        (make_rpm([], b"", sigtype=1), "Unsupported signature type 1"),
+        (WALRUS[:100], "Invalid signature header"),
+        (WALRUS[:96] + b"\0" * 16, "Invalid signature header"),
+        (
+            make_rpm([], b"")[:-8] + struct.pack(">II", 0x10000, 0),
+            "Invalid signature header",
+        ),
+        (WALRUS[:200], "Truncated signature header"),
+        (make_rpm([(268, 7, 10, 10)], b"\0" * 16), "Invalid signature header"),
+    ],
+    ids=[
+        "truncated lead",
+        "bad sigtype",
+        "truncated header",
+        "bad header magic",
+        "too many tags",
+        "truncated data",
+        "bad offset",
+    ],
+)
+def test_read_signing_key_malformed(content, message):
+    """Malformed RPMs are rejected."""
+
+    with raises(ValueError) as exc_info:
+        rpm_keys.read_signing_key_from(io.BytesIO(content), "test.rpm")
+
+    assert message in str(exc_info.value)
+
+
+def test_read_signing_key_ignores_other_tags():
+    """Only signature tags holding binary data are used."""
+
+    content = make_rpm(
+        [(1000, 7, 0, 4), (268, 6, 0, 4), (267, 7, 0, 0)], b"\x01\x02\x03\x04"
+    )
+    assert rpm_keys.read_signing_key_from(io.BytesIO(content), "test.rpm") is None
+
+
+def test_read_signing_key_multiple_keys():
+    """RPMs signed with more than one key are rejected."""
+
+    content = make_rpm([(268, 7, 0, 4), (1002, 7, 4, 4)], b"\0" * 8)
+
+    with patch("koji.get_sigpacket_key_id", side_effect=["aaaa", "bbbb"]):
+        with raises(ValueError) as exc_info:
+            rpm_keys.read_signing_key_from(io.BytesIO(content), "test.rpm")
+
+    assert "More than one key found" in str(exc_info.value)
+
+
+def test_signing_key_errors_not_cached(tmpdir):
+    """Errors reading signing keys are raised each time, not cached."""
+
+    path = str(tmpdir.join("bad.rpm"))
+    open(path, "w").close()
+
+    with patch.object(
+        rpm_keys.rpmlib, "get_rpm_header", side_effect=IOError("simulated error")
+    ) as get_header:
+        for _ in range(2):
+            with raises(IOError):
+                rpm_keys.get_signing_key(path)
+
+    assert get_header.call_count == 2
+
+
+def test_signing_key_cache_size(tmpdir):
+    """Only the most recently used keys are kept in memory."""
+
+    cache = rpm_keys.SigningKeyCache()
+    cache.MAX_ENTRIES = 1
+
+    paths = [
+        os.path.join(DATADIR, "simple_rpm/dest1/RPMS/walrus-5.21-1.noarch.rpm"),
+        os.path.join(DATADIR, "simple_rpm/dest1/SRPMS/test-srpm01-1.0-1.src.rpm"),
+    ]
+
+    with patch.object(
+        rpm_keys, "read_signing_key", wraps=rpm_keys.read_signing_key
+    ) as read_key:
+        assert [cache.get(p) for p in paths] == ["F78FB195", None]
+        assert len(cache._keys) == 1
+
+        # The first RPM was evicted, so it's read again
+        assert cache.get(paths[0]) == "F78FB195"
+        assert read_key.call_count == 3
+
+
+def test_signing_key_missing_file(tmpdir):
+    """Files which can't be identified are passed through to rpmlib."""
+
+    path = str(tmpdir.join("missing.rpm"))
+
+    with patch.object(
+        rpm_keys.rpmlib, "get_rpm_header", side_effect=IOError("no such file")
+    ) as get_header:
+        with raises(IOError):
+            rpm_keys.get_signing_key(path)
+
+    get_header.assert_called_once_with(path)
+
+
+def test_signing_key_concurrent_reads():
+    """Concurrent lookups of the same RPM read its signing key only once."""
+
+    cache = rpm_keys.SigningKeyCache()
+    path = os.path.join(DATADIR, "simple_rpm/dest1/RPMS/walrus-5.21-1.noarch.rpm")
+
+    waiting = threading.Event()
+
+    class WaitedFuture(rpm_keys.Future):
+        def result(self, timeout=None):
+            waiting.set()
+            return super(WaitedFuture, self).result(timeout)
+
+    def read_key(path):
+        # Block the first reader until the second is waiting for its result.
+        assert waiting.wait(10)
+        return "F78FB195"
+
+    with patch.object(rpm_keys, "Future", WaitedFuture), patch.object(
+        rpm_keys, "read_signing_key", side_effect=read_key
+    ) as read_signing_key:
+        with ThreadPoolExecutor(2) as executor:
+            first = executor.submit(cache.get, path)
+            second = executor.submit(cache.get, path)
+
+            assert first.result(10) == second.result(10) == "F78FB195"
+
+    read_signing_key.assert_called_once_with(path)
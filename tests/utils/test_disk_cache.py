@@ -0,0 +1,132 @@
+import logging
+
+from pushsource._impl.utils import disk_cache
+from pushsource._impl.utils.disk_cache import DiskCache
+
+
+def test_shared_per_settings(tmpdir):
+    """Shared instances are distinct for each path and settings."""
+
+    path = str(tmpdir.join("cache.db"))
+
+    cache = DiskCache.shared(path, ttl=10)
+    assert DiskCache.shared(path, ttl=10) is cache
+
+    # Different settings give a different instance, applying those settings
+    other = DiskCache.shared(path, ttl=20)
+    assert other is not cache
+    assert other._ttl == 20
+    assert DiskCache.shared(str(tmpdir.join("other.db")), ttl=10) is not cache
+
+    # But data is shared
+    cache.put("key", "value")
+    assert other.get("key") == "value"
+
+
+def test_expiry(tmpdir, monkeypatch):
+    """Entries are not returned once expired."""
+
+    cache = DiskCache(str(tmpdir.join("cache.db")), ttl=60)
+    now = 1000.0
+    monkeypatch.setattr(disk_cache.time, "time", lambda: now)
+
+    cache.put("default", 1)
+    cache.put("short", 2, ttl=10)
+    cache.put("forever", 3, ttl=None)
+
+    now += 30
+    assert [cache.get(k) for k in ("default", "short", "forever")] == [1, None, 3]
+
+    now += 60
+    assert [cache.get(k) for k in ("default", "short", "forever")] == [None, None, 3]
+
+
+def test_eviction(tmpdir, monkeypatch):
+    """Least recently used entries are evicted beyond max_entries."""
+
+    monkeypatch.setattr(disk_cache, "EVICT_INTERVAL", 1)
+    monkeypatch.setattr(disk_cache, "ACCESS_INTERVAL", 0)
+    cache = DiskCache(str(tmpdir.join("cache.db")), max_entries=2)
+    now = 1000.0
+    monkeypatch.setattr(disk_cache.time, "time", lambda: now)
+
+    cache.put("a", 1)
+    now += 1
+    cache.put("b", 2)
+    now += 1
+
+    # Access 'a' so that 'b' is least recently used
+    assert cache.get("a") == 1
+    now += 1
+
+    cache.put("c", 3)
+    assert [cache.get(k) for k in ("a", "b", "c")] == [1, None, 3]
+
+
+def test_access_interval(tmpdir, monkeypatch):
+    """Access times are only updated on read once older than ACCESS_INTERVAL."""
+
+    monkeypatch.setattr(disk_cache, "ACCESS_INTERVAL", 60)
+    cache = DiskCache(str(tmpdir.join("cache.db")))
+    now = 1000.0
+    monkeypatch.setattr(disk_cache.time, "time", lambda: now)
+
+    cache.put("key", "value")
+    changes = cache._conn.total_changes
+
+    # Reads within the interval don't write to the database
+    now += 30
+    assert cache.get("key") == "value"
+    assert cache._conn.total_changes == changes
+
+    # Later reads update the access time
+    now += 60
+    assert cache.get("key") == "value"
+    assert cache._conn.total_changes == changes + 1
+    (accessed,) = cache._conn.execute("SELECT accessed FROM cache").fetchone()
+    assert accessed == now
+
+
+def test_synchronous(tmpdir):
+    """Connections avoid syncing on every write."""
+
+    cache = DiskCache(str(tmpdir.join("cache.db")))
+
+    # 1 == NORMAL
+    assert cache._conn.execute("PRAGMA synchronous").fetchone() == (1,)
+
+
+def test_unlimited(tmpdir, monkeypatch):
+    """Entries are only evicted due to expiry if there's no max_entries."""
+
+    monkeypatch.setattr(disk_cache, "EVICT_INTERVAL", 1)
+    cache = DiskCache(str(tmpdir.join("cache.db")))
+
+    for i in range(10):
+        cache.put(str(i), i)
+
+    assert [cache.get(str(i)) for i in range(10)] == list(range(10))
+
+
+def test_unserializable(tmpdir, caplog):
+    """Values which can't be serialized are not cached."""
+
+    caplog.set_level(logging.DEBUG, "pushsource")
+    cache = DiskCache(str(tmpdir.join("cache.db")))
+
+    cache.put("key", object())
+
+    assert cache.get("key") is None
+    assert "Not caching unserializable value for key" in caplog.messages
+
+
+def test_database_errors(tmpdir, caplog):
+    """Database errors are treated as cache misses."""
+
+    # A directory can't be used as a database
+    path = str(tmpdir.mkdir("cache.db"))
+    cache = DiskCache(path)
+
+    cache.put("key", "value")
+    assert cache.get("key") is None
+    assert "Error using cache at %s" % path in caplog.messages